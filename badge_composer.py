@@ -0,0 +1,263 @@
+"""
+Renders the badge screen from a small config instead of a fixed BMP.
+
+/badge.json holds the fields, all optional:
+
+    {
+        "name": "Blinka",
+        "title": "Tic Tac Toe Champion",
+        "lines": ["blinka@example.com", "@blinka"],
+        "icon": "/o.bmp",
+        "qr": "http://{ip}:5000/"
+    }
+
+{ip} in the QR text is replaced with the badge's address. The rendered
+screen is saved as a 1-bit BMP named after a hash of everything that went
+into it, so later boots load the saved file with OnDiskBitmap and only render
+again when the config, the icon or the QR text changed. Saving needs a
+filesystem that is writable from code, see storage.remount() in boot.py,
+without it the screen is rendered on every boot.
+"""
+import json
+import os
+
+import bitmaptools
+import displayio
+import terminalio
+
+from framebuffer import FrameBuffer, load_bmp, BLACK, WHITE
+
+CONFIG_PATH = "/badge.json"
+CACHE_PREFIX = "badge_cache_"
+
+# change this when the layout changes, so old renders are not used
+RENDER_VERSION = 1
+
+MARGIN = 6
+
+
+def fnv1a(data, value=0x811C9DC5):
+    """
+    32-bit FNV-1a hash of data, hashlib is not available on every board.
+    """
+    for byte in data:
+        value = ((value ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return value
+
+
+class BadgeComposer:
+    """
+    Lays out name, title, icon and QR code on a width x height screen.
+    qr_encoder is called with the QR text and returns a FrameBuffer with one
+    pixel per module, quiet zone included. Without one the QR code is left out.
+    """
+
+    def __init__(self, config, width=296, height=128, font=terminalio.FONT, qr_encoder=None, cache_dir="/"):
+        self.config = config
+        self.name = config.get("name", "")
+        self.title = config.get("title", "")
+        self.lines = config.get("lines", [])
+        self.icon = config.get("icon")
+        self.qr = config.get("qr")
+        self.width = width
+        self.height = height
+        self.font = font
+        self.qr_encoder = qr_encoder
+        self.cache_dir = cache_dir
+        self.frame = None
+
+    @classmethod
+    def load(cls, path=CONFIG_PATH, **kwargs):
+        """
+        Returns a BadgeComposer for the config at path, or None if there is
+        no config.
+        """
+        try:
+            with open(path, "r") as config_file:
+                config = json.load(config_file)
+        except (OSError, ValueError) as e:
+            print(f"No badge config: {e}")
+            return None
+        return cls(config, **kwargs)
+
+    def qr_text(self, address):
+        if not self.qr or self.qr_encoder is None:
+            return None
+        return self.qr.replace("{ip}", address or "0.0.0.0")
+
+    def cache_path(self, address=None):
+        key = fnv1a(f"{RENDER_VERSION}|{self.width}x{self.height}|{self.name}|{self.title}|"
+                    f"{'|'.join(self.lines)}|{self.qr_text(address)}|{self.icon}".encode("utf-8"))
+        if self.icon:
+            try:
+                stat = os.stat(self.icon)
+                # size and modification time, the icon may be replaced
+                key = fnv1a(f"{stat[6]}|{stat[8]}".encode("utf-8"), key)
+            except OSError:
+                pass
+        return f"{self.cache_dir}{CACHE_PREFIX}{key:08x}.bmp"
+
+    def bitmap_path(self, address=None):
+        """
+        Path of the rendered screen for address, rendering and saving it if
+        it is not cached yet. Returns None when it could not be saved, the
+        render is then in frame.
+        """
+        path = self.cache_path(address)
+        try:
+            os.stat(path)
+            return path
+        except OSError:
+            pass
+        self.frame = self.render(address)
+        try:
+            self.frame.save_bmp(path)
+        except OSError as e:
+            print(f"Could not cache the badge render: {e}")
+            return None
+        self._remove_stale(path)
+        return path
+
+    def _remove_stale(self, keep):
+        for name in os.listdir(self.cache_dir):
+            path = self.cache_dir + name
+            if name.startswith(CACHE_PREFIX) and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def to_bitmap(self, frame=None):
+        """
+        A displayio Bitmap and Palette of a render, for when it could not be
+        saved to load with OnDiskBitmap.
+        """
+        frame = frame or self.frame
+        bitmap = displayio.Bitmap(frame.width, frame.height, 2)
+        palette = displayio.Palette(2)
+        palette[0] = 0xFFFFFF
+        palette[1] = 0x000000
+        # the bitmap starts out white, fill in the runs of black
+        for y in range(frame.height):
+            start = None
+            for x in range(frame.width + 1):
+                black = x < frame.width and not frame.get_pixel(x, y)
+                if black and start is None:
+                    start = x
+                elif not black and start is not None:
+                    bitmaptools.fill_region(bitmap, start, y, x, y + 1, 1)
+                    start = None
+        return bitmap, palette
+
+    def render(self, address=None):
+        frame = FrameBuffer(self.width, self.height)
+        frame.fill(WHITE)
+        text_width = self.width - 2 * MARGIN
+
+        qr_text = self.qr_text(address)
+        if qr_text:
+            code = self.qr_encoder(qr_text)
+            scale = max((self.height - 2 * MARGIN) // code.width, 1)
+            size = code.width * scale
+            left = self.width - MARGIN - size
+            self._draw_scaled(frame, code, left, (self.height - size) // 2, scale)
+            text_width = left - 2 * MARGIN
+
+        y = MARGIN
+        if self.name:
+            scale, lines = self._fit(self.name, text_width, max_scale=4, max_lines=1)
+            y = self._draw_lines(frame, lines, MARGIN, y, scale) + MARGIN
+        if self.title:
+            scale, lines = self._fit(self.title, text_width, max_scale=2, max_lines=3)
+            y = self._draw_lines(frame, lines, MARGIN, y, scale)
+        if self.lines:
+            # as large as all of them fit below the name and title, up to 2
+            line_height = self.font.get_bounding_box()[1] * len(self.lines)
+            max_scale = min(max((self.height - MARGIN - y) // line_height, 1), 2)
+            for line in self.lines:
+                scale, lines = self._fit(line, text_width, max_scale=max_scale, max_lines=1)
+                y = self._draw_lines(frame, lines, MARGIN, y, scale)
+
+        if self.icon:
+            try:
+                image, mask = load_bmp(self.icon)
+                frame.blit(image, MARGIN, self.height - MARGIN - image.height, mask)
+            except (OSError, ValueError) as e:
+                print(f"Could not load badge icon {self.icon}: {e}")
+        frame.clear_dirty()
+        return frame
+
+    @staticmethod
+    def _draw_scaled(frame, image, x, y, scale):
+        for image_y in range(image.height):
+            for image_x in range(image.width):
+                if not image.get_pixel(image_x, image_y):
+                    frame.fill_rect(x + image_x * scale, y + image_y * scale, scale, scale, BLACK)
+
+    def _text_width(self, text):
+        width = 0
+        for character in text:
+            glyph = self.font.get_glyph(ord(character))
+            if glyph is not None:
+                width += glyph.shift_x
+        return width
+
+    def _fit(self, text, max_width, max_scale, max_lines):
+        """
+        Pick the largest scale the text fits at, wrapping words onto at most
+        max_lines lines. Text that does not fit at scale 1 is cut off.
+        Returns (scale, lines).
+        """
+        words = text.split()
+        for scale in range(max_scale, 0, -1):
+            lines = []
+            line = ""
+            for word in words:
+                candidate = f"{line} {word}" if line else word
+                if self._text_width(candidate) * scale <= max_width:
+                    line = candidate
+                    continue
+                if line:
+                    lines.append(line)
+                line = word
+            if line:
+                lines.append(line)
+            if len(lines) <= max_lines and all(self._text_width(line) * scale <= max_width for line in lines):
+                return scale, lines
+        lines = lines[:max_lines]
+        for i, line in enumerate(lines):
+            while line and self._text_width(line) > max_width:
+                line = line[:-1]
+            lines[i] = line
+        return 1, lines
+
+    def _draw_lines(self, frame, lines, x, y, scale):
+        """
+        Draw lines of text with their top left at x, y. Returns the y below
+        the last line.
+        """
+        line_height = self.font.get_bounding_box()[1] * scale
+        for line in lines:
+            self._draw_text(frame, line, x, y, scale)
+            y += line_height
+        return y
+
+    def _draw_text(self, frame, text, x, y, scale):
+        font = self.font
+        box_height = font.get_bounding_box()[1]
+        for character in text:
+            glyph = font.get_glyph(ord(character))
+            if glyph is None:
+                continue
+            sheet = glyph.bitmap
+            tiles_per_row = sheet.width // glyph.width
+            sheet_x = (glyph.tile_index % tiles_per_row) * glyph.width
+            sheet_y = (glyph.tile_index // tiles_per_row) * glyph.height
+            # glyphs are placed on a shared baseline at the bottom of the font box
+            top = y + (box_height - glyph.height - glyph.dy) * scale
+            left = x + glyph.dx * scale
+            for glyph_y in range(glyph.height):
+                for glyph_x in range(glyph.width):
+                    if sheet[sheet_x + glyph_x, sheet_y + glyph_y]:
+                        frame.fill_rect(left + glyph_x * scale, top + glyph_y * scale, scale, scale, BLACK)
+            x += glyph.shift_x * scale
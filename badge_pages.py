@@ -0,0 +1,164 @@
+"""
+A carousel of badge pages, like a contact card, a QR code and the scores.
+
+Pages are decoded or rendered into displayio Bitmaps, which takes far longer
+than showing one, so decoded pages are kept in a PageCache up to a byte
+budget and the carousel decodes the next page ahead of time with prefetch()
+while the badge is idle. Flipping to a cached page only swaps a TileGrid.
+"""
+import displayio
+
+
+def bitmap_bytes(bitmap, colors):
+    """
+    RAM a displayio Bitmap with colors colours takes, rows are padded to 32 bits.
+    """
+    bits = 1
+    while (1 << bits) < colors:
+        bits *= 2
+    return ((bitmap.width * bits + 31) // 32) * 4 * bitmap.height
+
+
+class PageCache:
+    """
+    Least recently used cache of decoded pages under budget bytes. An entry
+    is (bitmap, pixel_shader, image, mask), image and mask the packed
+    FrameBuffers the ShadowDisplay draws, mask None when nothing is
+    transparent.
+    """
+
+    def __init__(self, budget=16384):
+        self.budget = budget
+        self.used = 0
+        # least recently used first
+        self._names = []
+        self._entries = {}
+        self._sizes = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def get(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._names.remove(name)
+        self._names.append(name)
+        return entry
+
+    def put(self, name, entry, keep=None):
+        """
+        Add entry, evicting the least recently used pages other than keep
+        until it fits. An entry larger than the budget is still kept, alone.
+        """
+        self.remove(name)
+        bitmap, pixel_shader, image, mask = entry
+        size = 0
+        if isinstance(bitmap, displayio.Bitmap):
+            size += bitmap_bytes(bitmap, len(pixel_shader) if isinstance(pixel_shader, displayio.Palette) else 2)
+        for frame in (image, mask):
+            if frame is not None:
+                size += len(frame.buffer)
+        for old in list(self._names):
+            if self.used + size <= self.budget:
+                break
+            if old != keep:
+                self.remove(old)
+                self.evictions += 1
+        self._names.append(name)
+        self._entries[name] = entry
+        self._sizes[name] = size
+        self.used += size
+
+    def remove(self, name):
+        if name in self._entries:
+            self._names.remove(name)
+            del self._entries[name]
+            self.used -= self._sizes.pop(name)
+
+    def clear(self):
+        for name in list(self._names):
+            self.remove(name)
+
+
+class Carousel:
+    """
+    Shows one of pages at a time as the bottom layer of group. pages is a list
+    of (name, load), load returning an entry as PageCache stores them.
+    Shown pages are registered with shadow, a ShadowDisplay, when given.
+    """
+
+    def __init__(self, group, pages, cache, shadow=None):
+        self.group = group
+        self.pages = pages
+        self.cache = cache
+        self.shadow = shadow
+        self.index = 0
+        self._shown = None
+        # the shown page changed since it was put into group
+        self.stale = False
+
+    @property
+    def name(self):
+        return self.pages[self.index][0]
+
+    def _entry(self, index):
+        name, load = self.pages[index]
+        entry = self.cache.get(name)
+        if entry is None:
+            entry = load()
+            self.cache.put(name, entry, keep=self.name)
+        return entry
+
+    def show(self, index=None):
+        """
+        Put page index, or the current page again, into group. The display
+        still has to be refreshed.
+        """
+        if index is not None:
+            self.index = index % len(self.pages)
+        bitmap, pixel_shader, image, mask = self._entry(self.index)
+        if self._shown is not None:
+            self.group.remove(self._shown)
+            if self.shadow is not None:
+                self.shadow.remove_image(self._shown.bitmap)
+        if self.shadow is not None:
+            self.shadow.add_image(bitmap, image, mask)
+        self._shown = displayio.TileGrid(bitmap=bitmap, pixel_shader=pixel_shader)
+        self.group.insert(0, self._shown)
+        self.stale = False
+
+    def next(self):
+        self.show(self.index + 1)
+
+    def previous(self):
+        self.show(self.index - 1)
+
+    def prefetch(self):
+        """
+        Decode the next page if it is not cached. Call while idle. Returns
+        True if a page was decoded.
+        """
+        index = (self.index + 1) % len(self.pages)
+        if self.pages[index][0] in self.cache:
+            return False
+        self._entry(index)
+        return True
+
+    def invalidate(self, name, reload=True):
+        """
+        Forget a page whose content changed. If it is the current page it is
+        shown again, or with reload False, while group is not on screen, it
+        is only marked stale for the next show().
+        """
+        self.cache.remove(name)
+        if self.name == name and self._shown is not None:
+            if reload:
+                self.show()
+            else:
+                self.stale = True
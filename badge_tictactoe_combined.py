@@ -12,6 +12,8 @@ from adafruit_display_shapes.rect import Rect
 from adafruit_display_text import bitmap_label as label
 import neopixel
 
+from idle_manager import IdleManager
+
 STATE_BADGE = 0
 STATE_TIC_TAC_TOE = 1
 STATE_TIC_TAC_TOE_GAMEOVER = 2
@@ -286,11 +288,19 @@ game = TicTacToeGame(display)
 tictactoe_group.append(game)
 
 # button keys setup
-buttons = keypad.Keys((board.SW_UP, board.SW_DOWN, board.SW_A, board.SW_B, board.SW_C), value_when_pressed=True)
+BUTTON_PINS = (board.SW_UP, board.SW_DOWN, board.SW_A, board.SW_B, board.SW_C)
+buttons = keypad.Keys(BUTTON_PINS, value_when_pressed=True)
 pressed_buttons = []
+# buttons held down while waking up, their release is not a game action
+wake_buttons = []
 
 pixels = neopixel.NeoPixel(board.SDA, 8)
 
+# LEDs off after 30 seconds without input, asleep until a button is pressed
+# after 2 minutes. Buttons are polled 100 times a second instead of spinning.
+idle = IdleManager(idle_after=30, sleep_after=120, active_interval=0.01, idle_interval=0.05,
+                   on_idle=lambda: pixels.fill(0))
+
 display = board.DISPLAY
 
 badge_group = displayio.Group()
@@ -325,7 +335,11 @@ set_state(CURRENT_STATE)
 
 while True:
     event = buttons.events.get()
+    if event and event.released and event.key_number in wake_buttons:
+        wake_buttons.remove(event.key_number)
+        event = None
     if event:
+        idle.activity()
         if event.pressed:
             if event.key_number not in pressed_buttons:
                 pressed_buttons.append(event.key_number)
@@ -397,3 +411,26 @@ while True:
         print(e)
         time.sleep(display.time_to_refresh + 0.6)
         display.refresh()
+
+    if idle.should_sleep():
+        # the alarms need the button pins
+        buttons.deinit()
+        if CURRENT_STATE == STATE_BADGE:
+            # the e-ink keeps showing the badge, starting over loses nothing
+            idle.deep_sleep(BUTTON_PINS)
+        # keeps the game that is in progress
+        idle.light_sleep(BUTTON_PINS)
+        buttons = keypad.Keys(BUTTON_PINS, value_when_pressed=True)
+        pressed_buttons.clear()
+        # Keys reports the button that woke the badge as pressed on its first
+        # scan, wait for that and leave its release out
+        wake_buttons.clear()
+        time.sleep(0.05)
+        event = buttons.events.get()
+        while event:
+            if event.pressed:
+                wake_buttons.append(event.key_number)
+            elif event.key_number in wake_buttons:
+                wake_buttons.remove(event.key_number)
+            event = buttons.events.get()
+    idle.wait()
@@ -1,4 +1,5 @@
 import gc
+import os
 import random
 import time
 import bitmaptools
@@ -6,35 +7,63 @@ import board
 import displayio
 import vectorio
 import keypad
+import microcontroller
 import socketpool
 import wifi
 import terminalio
 from adafruit_display_shapes.rect import Rect
 from adafruit_display_text import bitmap_label as label
 import neopixel
-
-from adafruit_led_animation.sequence import AnimationSequence
-from adafruit_led_animation.animation.rainbow import Rainbow
-from adafruit_led_animation.animation.rainbowchase import RainbowChase
-from adafruit_led_animation.animation.rainbowcomet import RainbowComet
-from adafruit_led_animation.animation.rainbowsparkle import RainbowSparkle
-from adafruit_led_animation.color import WHITE, BLACK
+from adafruit_ticks import ticks_ms
 
 import foamyguy_nvm_helper as nvm_helper
-from adafruit_httpserver import Server, Route, as_route, Request, Response, FileResponse, GET, POST
+from state_machine import StateMachine, key_mask
+from match import Match, MatchLog
+from move_history import MoveHistory, cell_index, cell_position
+from led_engine import LedEngine
+from led_scenes import ANIMATION_NAMES, Scene, ScenePlaylist, ScenePlayer
+from brightness import Brightness
+from color_params import PRESETS, SAVED_COLOR_SIZE, parse_color, format_color, load_color, save_color
+from network_manager import NetworkManager, NETWORK_CACHE_SIZE
+from captive_dns import DNSResponder
+from led_effects import TURN, DRAW_PULSE, DRAW_COLOR, piece_color, win_effect
+from gestures import GestureRecognizer, Gesture, GESTURE_TAP, GESTURE_LONG_PRESS, GESTURE_CHORD
+from rate_limit import RateLimiter
+from web_server import Server, Request, Response, JSONResponse, Status, BAD_REQUEST_400, GET, POST
+from page_templates import Template, TemplateResponse
+from shadow_display import ShadowDisplay
+from framebuffer import FrameBuffer
+from badge_composer import BadgeComposer, CONFIG_PATH
+from qr_code import QREncoder, ECC_M
+from rle_image import load_image
+from badge_pages import Carousel, PageCache
+from idle_manager import IdleManager
+from battery_monitor import BatteryMonitor, BatteryGlyph, PROFILE_FULL
+from screen_capture import ScreenCapture
+from checkpoint import Checkpoint, GameState
+from loop_supervisor import LoopSupervisor
 
 pool = socketpool.SocketPool(wifi.radio)
-server = Server(pool, "/static", debug=True)
+# the page and its assets share a few kept alive connections, and each poll()
+# spends at most 3 ms on them so buttons and LED frames are never held up.
+# Each phone gets a burst of 10 requests then 2 a second, and anyone beyond
+# the 4 connection slots is told to come back later.
+server = Server(pool, "/static", debug=True, pool_size=4, buffer_size=1024, idle_timeout=5, max_requests=20,
+                budget_us=3000, chunk_size=512, limiter=RateLimiter(size=16, rate=2, burst=10))
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
 
 STATE_BADGE = 0
 STATE_TIC_TAC_TOE = 1
 STATE_TIC_TAC_TOE_GAMEOVER = 2
 
-CURRENT_STATE = STATE_BADGE
-
 # Ignore multiple state changes if they occur within this many seconds
 CHANGE_STATE_BTN_COOLDOWN = 0.75
 LAST_STATE_CHANGE = -1
+LAST_PAGE_CHANGE = -1
+LAST_REFRESH = -1
+REFRESH_PENDING = False
 
 # Button numbers
 BUTTON_UP = 0
@@ -44,14 +73,15 @@ BUTTON_B = 3
 BUTTON_C = 4
 
 # NeoPixel and Animations setup
-pixels = neopixel.NeoPixel(board.SDA, 8)
-rainbow = Rainbow(pixels, speed=0.1, period=2)
-rainbow_comet = RainbowComet(pixels, speed=0.1, tail_length=11, bounce=True)
-rainbow_sparkle = RainbowSparkle(pixels, speed=0.1, num_sparkles=5)
-rainbow_chase = RainbowChase(pixels, speed=0.1, size=5, spacing=3)
-animations = AnimationSequence(
-    rainbow_comet, rainbow, rainbow_sparkle, rainbow_chase, advance_interval=45,
-)
+pixels = neopixel.NeoPixel(board.SDA, 8, auto_write=False)
+brightness = Brightness(len(pixels), levels=6, level=2, max_ma=400)
+animations = LedEngine(pixels, advance_interval=45, lut=brightness.lut)
+brightness.on_change = animations.redraw
+
+# user defined scenes from /scenes.bin replace the default sequence when present
+scene_playlist = ScenePlaylist()
+scene_player = ScenePlayer(animations, scene_playlist)
+scene_player.advance()
 
 # display setup
 display = board.DISPLAY
@@ -67,7 +97,37 @@ background_rect = vectorio.Rectangle(pixel_shader=background_p, width=display.wi
                                      y=0)
 tictactoe_group.append(background_rect)
 
-session_score = {"X": 0, "O": 0}
+# games are played in best of BEST_OF matches, the starting player alternates
+BEST_OF = 3
+match = Match(best_of=BEST_OF, first_turn="X")
+
+# NVM layout, foamyguy_nvm_helper data lives at the start
+NVM_MATCH_LOG_OFFSET = 256
+NVM_MATCH_LOG_SIZE = 1024
+NVM_LAST_COLOR_OFFSET = NVM_MATCH_LOG_OFFSET + NVM_MATCH_LOG_SIZE
+NVM_NETWORK_OFFSET = NVM_LAST_COLOR_OFFSET + SAVED_COLOR_SIZE
+NVM_CHECKPOINT_OFFSET = NVM_NETWORK_OFFSET + NETWORK_CACHE_SIZE
+
+
+# winning lines as masks of cell indexes, row * 3 + column, with their winner_line_map keys
+WIN_LINES = (
+    (0b000000111, "row-0"),
+    (0b000111000, "row-1"),
+    (0b111000000, "row-2"),
+    (0b001001001, "col-0"),
+    (0b010010010, "col-1"),
+    (0b100100100, "col-2"),
+    (0b100010001, "diag-tld"),
+    (0b001010100, "diag-bru"),
+)
+
+
+def _bit_count(value):
+    count = 0
+    while value:
+        value &= value - 1
+        count += 1
+    return count
 
 
 class TicTacToeGame(displayio.Group):
@@ -75,7 +135,7 @@ class TicTacToeGame(displayio.Group):
     Helper class to hold the visual and logical elements that make up the game.
     """
 
-    def __init__(self, display):
+    def __init__(self, display, first_turn="X"):
         super().__init__()
         self.display = display
 
@@ -83,8 +143,8 @@ class TicTacToeGame(displayio.Group):
         self.lines_p = displayio.Palette(1)
         self.lines_p[0] = 0x000000
 
-        # randomly decide who is first.
-        self.turn = random.choice(("X", "O"))
+        # who is first, the match decides this for later games.
+        self.turn = first_turn
 
         # board lines
         self.left_line = vectorio.Rectangle(pixel_shader=self.lines_p, width=2, height=118, y=5, x=40)
@@ -97,13 +157,14 @@ class TicTacToeGame(displayio.Group):
         self.append(self.bottom_line)
 
         #  dotted line box selector indicator
-        self.selector_bmp = displayio.OnDiskBitmap("selector.bmp")
-        self.selector_tg = displayio.TileGrid(pixel_shader=self.selector_bmp.pixel_shader, bitmap=self.selector_bmp)
+        self.selector_bmp, self.selector_shader = load_image("selector.bmp")
+        self.selector_tg = displayio.TileGrid(pixel_shader=self.selector_shader, bitmap=self.selector_bmp)
         self.append(self.selector_tg)
 
         # X and O piece bmps
-        self.x_bmp = displayio.OnDiskBitmap("x.bmp")
-        self.o_bmp = displayio.OnDiskBitmap("o.bmp")
+        # from the .rle images when they are on the badge, expanded into RAM once
+        self.x_bmp, self.x_shader = load_image("x.bmp")
+        self.o_bmp, self.o_shader = load_image("o.bmp")
 
         # mapping of board position indexes to pixel locations
         self.selector_location_map = [
@@ -128,6 +189,13 @@ class TicTacToeGame(displayio.Group):
             ["", "", ""],
         ]
 
+        # moves played so far, for undo and redo
+        self.history = MoveHistory(self.turn)
+
+        # bitmasks of the cells holding each piece, for checking lines
+        self.x_mask = 0
+        self.o_mask = 0
+
         self.winner_line_polygon = None
         self.winner_line_palette = displayio.Palette(1)
         self.winner_line_palette[0] = 0x000000
@@ -143,12 +211,17 @@ class TicTacToeGame(displayio.Group):
             "diag-bru": ((5, 105), (15, 115), (115, 15), (105, 5)),
         }
 
-    def reset_game(self):
+    def reset_game(self, first_turn=None):
+        if first_turn is not None:
+            self.turn = first_turn
         while len(self.played_pieces) > 0:
             self.remove(self.played_pieces.pop())
         for row_idx in range(3):
             for col_idx in range(3):
                 self.board_state[row_idx][col_idx] = ""
+        self.history.clear(self.turn)
+        self.x_mask = 0
+        self.o_mask = 0
 
         print("board state after reset")
         print(self.board_state)
@@ -185,9 +258,9 @@ class TicTacToeGame(displayio.Group):
     def play_piece_at(self, piece, position, refresh=False):
         # create the right type of TileGrid based on turn
         if piece == "X":
-            piece_tg = displayio.TileGrid(pixel_shader=self.x_bmp.pixel_shader, bitmap=self.x_bmp)
+            piece_tg = displayio.TileGrid(pixel_shader=self.x_shader, bitmap=self.x_bmp)
         else:  # O's turn
-            piece_tg = displayio.TileGrid(pixel_shader=self.o_bmp.pixel_shader, bitmap=self.o_bmp)
+            piece_tg = displayio.TileGrid(pixel_shader=self.o_shader, bitmap=self.o_bmp)
 
         # append it to self Group instance
         self.append(piece_tg)
@@ -200,13 +273,18 @@ class TicTacToeGame(displayio.Group):
         self.place_tilegrid_at_board_position(position, piece_tg, refresh=refresh)
 
         # update the board state with this move
-        self.board_state[self.selector_position[1]][self.selector_position[0]] = piece
+        self.board_state[position[1]][position[0]] = piece
+        if piece == "X":
+            self.x_mask |= 1 << cell_index(position)
+        else:
+            self.o_mask |= 1 << cell_index(position)
 
     def play_current_move(self):
         """
         Place a piece at the selected position based on which turn it is currently.
         """
 
+        self.history.push(cell_index(self.selector_position))
         self.play_piece_at(self.turn, self.selector_position, refresh=False)
 
         # set the turn to next players
@@ -216,50 +294,90 @@ class TicTacToeGame(displayio.Group):
         for row in self.board_state:
             print(row)
 
-        try:
-            # update selector_position to a random empty location
-            self.selector_position = random.choice(self.empty_spots)
-        except IndexError:
-            # no more empty spaces
-            pass
+        # update selector_position to a random empty location, if any are left
+        empty_spots = self.empty_spots
+        if empty_spots:
+            self.selector_position = random.choice(empty_spots)
 
         # move the selector TileGrid to the selector_position and refresh
         self.place_tilegrid_at_board_position(self.selector_position, self.selector_tg, refresh=False)
 
-    def check_winner(self):
-        winner = None
-        # horizontals:
-        for row_idx, row in enumerate(self.board_state):
-            if row.count(row[0]) == 3 and row[0] != "":
-                winner = row[0]
-                return winner, f"row-{row_idx}"
-        # verticals
-        for col_idx in range(len(self.board_state)):
-            col = []
-            for row in self.board_state:
-                col.append(row[col_idx])
-
-            if col.count(col[0]) == 3 and col[0] != "":
-                winner = col[0]
-                return winner, f"col-{col_idx}"
-        # diagonals
-        top_left_down = []
-        bottom_right_up = []
-
-        for i in range(3):
-            top_left_down.append(self.board_state[i][i])
-            bottom_right_up.append(self.board_state[2 - i][i])
-
-        if top_left_down.count(top_left_down[0]) == 3 and top_left_down[0] != "":
-            winner = top_left_down[0]
-            return winner, f"diag-tld"
-
-        if bottom_right_up.count(bottom_right_up[0]) == 3 and bottom_right_up[0] != "":
-            winner = bottom_right_up[0]
-            return winner, f"diag-bru"
+    def undo_move(self):
+        """
+        Take back the last move. Only the TileGrid of that piece is removed and the
+        selector is moved onto the freed cell. Returns False if there was nothing to undo.
+        """
+        index = self.history.undo()
+        if index is None:
+            return False
+        position = cell_position(index)
+        self.remove(self.played_pieces.pop())
+        self.board_state[position[1]][position[0]] = ""
+        self.x_mask &= ~(1 << index)
+        self.o_mask &= ~(1 << index)
+        self.turn = self.history.piece_at(len(self.history))
+
+        self.selector_position = position
+        self.place_tilegrid_at_board_position(self.selector_position, self.selector_tg, refresh=False)
+        return True
 
+    def redo_move(self):
+        """
+        Play the last undone move again. Returns False if there was nothing to redo.
+        """
+        index = self.history.redo()
+        if index is None:
+            return False
+        self.play_piece_at(self.turn, cell_position(index), refresh=False)
+        self.turn = "X" if self.turn == "O" else "O"
+        return True
+
+    def replay(self, first_turn, moves, selector):
+        """
+        Set the board up again from the cell indexes of a game in the order they
+        were played, like after restoring a checkpoint. Does not refresh.
+        """
+        self.reset_game(first_turn)
+        for index in moves:
+            self.history.push(index)
+            self.play_piece_at(self.turn, cell_position(index), refresh=False)
+            self.turn = "X" if self.turn == "O" else "O"
+        self.selector_position = cell_position(selector)
+        self.place_tilegrid_at_board_position(self.selector_position, self.selector_tg, refresh=False)
+
+    def check_winner(self):
+        for line_mask, line_type in WIN_LINES:
+            if self.x_mask & line_mask == line_mask:
+                return "X", line_type
+            if self.o_mask & line_mask == line_mask:
+                return "O", line_type
         return None
 
+    def can_complete_a_line(self, piece):
+        """
+        Whether piece can still complete any line with the moves it has left.
+        A line is out of reach once the other player has a piece in it, or when
+        it needs more pieces than the player still gets to place.
+        """
+        own_mask, other_mask = (self.x_mask, self.o_mask) if piece == "X" else (self.o_mask, self.x_mask)
+        empty_count = 9 - len(self.history)
+        if self.turn == piece:
+            moves_left = (empty_count + 1) // 2
+        else:
+            moves_left = empty_count // 2
+        for line_mask, _ in WIN_LINES:
+            if line_mask & other_mask:
+                continue
+            if 3 - _bit_count(line_mask & own_mask) <= moves_left:
+                return True
+        return False
+
+    def check_draw(self):
+        """
+        True when neither player can win anymore, which includes a full board.
+        """
+        return not self.can_complete_a_line("X") and not self.can_complete_a_line("O")
+
     def show_winner_line(self, line_type):
         # if self.winner_line_bmp is None:
         #     self.winner_line_bmp = displayio.Bitmap(120, 120, 2)
@@ -300,47 +418,197 @@ class TicTacToeGame(displayio.Group):
         if 0 <= board_position[0] <= 2 and 0 <= board_position[1] <= 2:
             tilegrid.x, tilegrid.y = self.selector_location_map[board_position[1]][board_position[0]]
             if refresh:
-                self.display.refresh()
+                refresh_display()
         else:
             print(f"position: {board_position} is out of bounds")
 
 
 # create the game instance
-game = TicTacToeGame(display)
+game = TicTacToeGame(display, first_turn=match.starting_player)
 
 # add it to main group
 tictactoe_group.append(game)
 
 # button keys setup
 buttons = keypad.Keys((board.SW_UP, board.SW_DOWN, board.SW_A, board.SW_B, board.SW_C), value_when_pressed=True)
-pressed_buttons = []
+
+# packed copy of what the e-ink shows, updated on every refresh. OnDiskBitmaps
+# can not be read back, so they are loaded again from their files.
+shadow = ShadowDisplay(display)
+shadow.add_bitmap_file(game.selector_bmp, "selector.bmp", game.selector_shader)
+shadow.add_bitmap_file(game.x_bmp, "x.bmp", game.x_shader)
+shadow.add_bitmap_file(game.o_bmp, "o.bmp", game.o_shader)
 
 badge_group = displayio.Group()
+# renders name, title, icon and the QR code of the page from /badge.json,
+# None without one
+qr_encoder = QREncoder(ECC_M)
+# encoded QR codes by text. They only change with the address, so pages
+# evicted from the cache are rendered again without encoding them again
+qr_codes = {}
+
+
+def encode_qr(text):
+    code = qr_codes.get(text)
+    if code is None:
+        # the encoder reuses its image for the next code, keep a copy
+        image = qr_encoder.encode(text)
+        code = FrameBuffer(image.width, image.height)
+        code.copy_from(image)
+        qr_codes[text] = code
+    return code
+
+
+badge_composer = BadgeComposer.load(CONFIG_PATH, qr_encoder=encode_qr)
+
+
+def contact_page():
+    """
+    The badge from the config when there is one, the fixed badge.BMP otherwise.
+    """
+    path = badge_composer.bitmap_path(network.address) if badge_composer is not None else "badge.BMP"
+    if path is None:
+        # could not be saved, show the render from memory
+        bitmap, pixel_shader = badge_composer.to_bitmap()
+        return bitmap, pixel_shader, badge_composer.frame, None
+    bitmap, pixel_shader = load_image(path)
+    image, mask = shadow.pack(bitmap, path, pixel_shader)
+    return bitmap, pixel_shader, image, mask
+
+
+def rendered_page(config):
+    composer = BadgeComposer(config, qr_encoder=encode_qr)
+    frame = composer.render(network.address)
+    bitmap, palette = composer.to_bitmap(frame)
+    return bitmap, palette, frame, None
+
+
+def qr_page():
+    if network.address is None:
+        return rendered_page({"name": "Play along", "title": "Waiting for the network"})
+    url = f"http://{network.address}:{network.port}/"
+    return rendered_page({"name": "Play along", "title": url, "qr": url})
+
+
+def stats_page():
+    return rendered_page({"name": "Tic Tac Toe",
+                          "lines": [f"X wins: {match_log.totals['X']}", f"O wins: {match_log.totals['O']}",
+                                    f"Draws: {match_log.totals['draw']}",
+                                    f"Best of {match.best_of}, draws count: X {match.wins['X']} O {match.wins['O']}"]})
+
+
+BADGE_PAGES = [("contact", contact_page), ("qr", qr_page), ("stats", stats_page)]
+# "schedule": a list of lines in /badge.json adds a schedule page
+if badge_composer is not None and badge_composer.config.get("schedule"):
+    BADGE_PAGES.append(("schedule", lambda: rendered_page({"name": "Schedule",
+                                                           "lines": badge_composer.config["schedule"]})))
+
+# a full screen page is a 5 KB Bitmap plus its 5 KB packed copy in the
+# shadow, so this keeps about two pages decoded
+BADGE_PAGE_BUDGET = 24 * 1024
+BADGE_PREFETCH_DELAY = 2
+carousel = Carousel(badge_group, BADGE_PAGES, PageCache(BADGE_PAGE_BUDGET), shadow)
+
+# battery level in the top right corner, above the pages
+badge_battery = BatteryGlyph(x=display.width - 22, y=2)
+badge_group.append(badge_battery)
+
+# /screen.bmp and /screen.png, served from the shadow frame
+screen = ScreenCapture(shadow)
+
+match_log = MatchLog(microcontroller.nvm, offset=NVM_MATCH_LOG_OFFSET, size=NVM_MATCH_LOG_SIZE)
+if not match_log.loaded:
+    # start the log with the all time scores saved by earlier versions
+    try:
+        saved_score = nvm_helper.read_data()
+    except EOFError:
+        # No data in NVM
+        saved_score = {"X": 0, "O": 0}
+    match_log.clear(x_wins=saved_score["X"], o_wins=saved_score["O"])
+
+# the game and match are checkpointed to NVM, so a crash or watchdog reset
+# picks the game up where it was. Every NVM write erases a flash sector, so
+# changes are gathered for CHECKPOINT_DELAY seconds and written together
+checkpoint = Checkpoint(microcontroller.nvm, offset=NVM_CHECKPOINT_OFFSET, slots=16)
+checkpoint_state = GameState()
+CHECKPOINT_DELAY = 5
+CHECKPOINT_DUE = None
+
+
+def save_checkpoint():
+    """
+    Take a checkpoint of the game and match, written to NVM by
+    write_checkpoint() within CHECKPOINT_DELAY seconds.
+    """
+    global CHECKPOINT_DUE
+    checkpoint_state.state = machine.state
+    checkpoint_state.game_first_turn = game.history.first_turn
+    checkpoint_state.moves = game.history.moves[:len(game.history)]
+    checkpoint_state.selector = cell_index(game.selector_position)
+    checkpoint_state.match_first_turn = match.first_turn
+    checkpoint_state.wins["X"] = match.wins["X"]
+    checkpoint_state.wins["O"] = match.wins["O"]
+    checkpoint_state.draws = match.draws
+    checkpoint_state.games_played = match.games_played
+    checkpoint_state.match_number = match.number
+    if CHECKPOINT_DUE is None:
+        CHECKPOINT_DUE = time.monotonic() + CHECKPOINT_DELAY
+
+
+def write_checkpoint():
+    """
+    Write the last checkpoint taken once it is due, call every loop pass.
+    """
+    global CHECKPOINT_DUE
+    if CHECKPOINT_DUE is not None and time.monotonic() >= CHECKPOINT_DUE:
+        CHECKPOINT_DUE = None
+        checkpoint.save(checkpoint_state)
 
-badge_odb = displayio.OnDiskBitmap("badge.BMP")
-badge_tg = displayio.TileGrid(bitmap=badge_odb, pixel_shader=badge_odb.pixel_shader)
-badge_group.append(badge_tg)
 
-SESSION_SCORE_TEMPLATE_STR = "Score\nRound:\n X: {}\n O: {}"
+def restore_checkpoint(saved):
+    """
+    Carry on with the match of the saved GameState, and with its game unless
+    the badge screen was shown. Enters the state that was saved.
+    """
+    match.first_turn = saved.match_first_turn
+    match.wins["X"] = saved.wins["X"]
+    match.wins["O"] = saved.wins["O"]
+    match.draws = saved.draws
+    match.games_played = saved.games_played
+    match.number = saved.match_number
+    update_score_text()
+    if saved.state not in (STATE_TIC_TAC_TOE, STATE_TIC_TAC_TOE_GAMEOVER):
+        machine.transition(STATE_BADGE)
+        return
+    game.replay(saved.game_first_turn, saved.moves, saved.selector)
+    if saved.state == STATE_TIC_TAC_TOE_GAMEOVER:
+        winner = game.check_winner()
+        if winner:
+            game.show_winner_line(winner[1])
+        # the finished board stays up until the next game is started
+        machine.transition(STATE_TIC_TAC_TOE_GAMEOVER)
+        set_state(STATE_TIC_TAC_TOE)
+    else:
+        machine.transition(STATE_TIC_TAC_TOE)
+
+
+# games played of the most a match lasts, draws count as games, so a match of
+# best_of 3 is over after 3 games even when they were all draws
+SESSION_SCORE_TEMPLATE_STR = "G{}/{}:\n X: {}\n O: {}\n D: {}"
 session_score_text = label.Label(terminalio.FONT,
-                                 text=SESSION_SCORE_TEMPLATE_STR.format(session_score["X"], session_score["O"]),
+                                 text=SESSION_SCORE_TEMPLATE_STR.format(match.games_played, match.best_of,
+                                                                        match.wins["X"], match.wins["O"],
+                                                                        match.draws),
                                  color=BLACK, scale=2, line_spacing=1.1)
 
 session_score_text.anchor_point = (0, 0)
 session_score_text.anchored_position = (134, 2)
 tictactoe_group.append(session_score_text)
 
-all_time_score = None
-try:
-    all_time_score = nvm_helper.read_data()
-except EOFError:
-    # No data in NVM
-    all_time_score = {"X": 0, "O": 0}
-    nvm_helper.save_data(all_time_score, test_run=False)
-
-ALL_SCORE_TEMPLATE_STR = "\nAll:\n X: {}\n O: {}"
+ALL_SCORE_TEMPLATE_STR = "All:\n X: {}\n O: {}\n D: {}"
 all_score_text = label.Label(terminalio.FONT,
-                             text=ALL_SCORE_TEMPLATE_STR.format(all_time_score["X"], all_time_score["O"]),
+                             text=ALL_SCORE_TEMPLATE_STR.format(match_log.totals["X"], match_log.totals["O"],
+                                                                match_log.totals["draw"]),
                              color=BLACK, scale=2, line_spacing=1.1)
 
 all_score_text.anchor_point = (1.0, 0)
@@ -354,11 +622,30 @@ ip_text.anchor_point = (1.0, 1.0)
 ip_text.anchored_position = (display.width-2, display.height-2)
 tictactoe_group.append(ip_text)
 
+ttt_battery = BatteryGlyph(x=136, y=display.height - 12)
+tictactoe_group.append(ttt_battery)
+
 def set_state(new_state):
     if new_state == STATE_BADGE:
         display.root_group = badge_group
     elif new_state == STATE_TIC_TAC_TOE:
         display.root_group = tictactoe_group
+    refresh_display()
+
+
+def refresh_display():
+    global REFRESH_PENDING, LAST_REFRESH
+    if time.monotonic() < LAST_REFRESH + power_profile.refresh_interval:
+        # saving the battery, the main loop refreshes once the interval is up
+        REFRESH_PENDING = True
+        return
+    REFRESH_PENDING = False
+    # e-ink refreshes are slow and flash the screen, skip them when the
+    # picture would not change
+    if shadow.update() is None:
+        return
+    screen.invalidate()
+    LAST_REFRESH = time.monotonic()
     try:
         display.refresh()
     except RuntimeError as e:
@@ -368,144 +655,532 @@ def set_state(new_state):
         display.refresh()
 
 
-set_state(CURRENT_STATE)
-pixel_brightness_base_value = 0
-brightness = 0.2
+# compiled from templates/index.html with compile_templates.py
+INDEX_TEMPLATE = Template("/templates/index.tpl")
+
+# (frozen, colour) of the LEDs while the badge is shown, kept while the game
+# uses them
+BADGE_LIGHTS = (False, animations.color)
+
+# a colour picker sends a request per step it is dragged, the colour is only
+# written to NVM once it was left alone for COLOR_SAVE_DELAY seconds
+COLOR_SAVE_DELAY = 10
+COLOR_SAVE_DUE = None
+PICKED_COLOR = None
 
 
-def pixel_brightness():
-    global pixel_brightness_base_value
-    pixel_brightness_current_value = ((pixel_brightness_base_value % 10) / 10) + 0.2
-    pixel_brightness_base_value += 2
-    print(pixel_brightness_current_value)
-    return pixel_brightness_current_value
+def set_color(color):
+    """
+    Show a solid colour on the NeoPixels and remember it for the next boot.
+    While the game is shown it waits until the badge is back.
+    """
+    global BADGE_LIGHTS, COLOR_SAVE_DUE, PICKED_COLOR
+    if machine.state == STATE_BADGE:
+        animations.fill(color)
+    else:
+        BADGE_LIGHTS = (True, color)
+    PICKED_COLOR = color
+    COLOR_SAVE_DUE = time.monotonic() + COLOR_SAVE_DELAY
+
 
+def write_color():
+    """
+    Save the colour picked last to NVM once it stopped changing, call every
+    loop pass. Nothing is written when NVM holds that colour already.
+    """
+    global COLOR_SAVE_DUE
+    if COLOR_SAVE_DUE is not None and time.monotonic() >= COLOR_SAVE_DUE:
+        COLOR_SAVE_DUE = None
+        save_color(microcontroller.nvm, NVM_LAST_COLOR_OFFSET, PICKED_COLOR)
 
-INDEX_TEMPLATE = None
-with open("static/index.html", "r") as f:
-    INDEX_TEMPLATE = f.read()
 
-COLOR_PICKER_TEMPLATE = None
-with open("static/color_picker.html", "r") as f:
-    COLOR_PICKER_TEMPLATE = f.read()
+def badge_color():
+    """
+    The colour the badge shows, or will show again once the game is left.
+    """
+    if machine.state == STATE_BADGE:
+        return animations.color
+    return BADGE_LIGHTS[1]
 
 
 @server.route("/", (GET, POST))
 def index_handler(request: Request):
-    if request.method == GET:
-
-        hex_rgb = request.query_params.get("neopixel_color")
-        if hex_rgb is not None:
-            hex_rgb = hex_rgb.replace("%23", "0x")
-            # print(f"hex rgb: {hex(int(hex_rgb, 16))}")
-            pixels.brightness = brightness
-            animations.freeze()
-            animations.fill(int(hex_rgb, 16))
-        else:
-            hex_rgb = ""
-
-    return Response(request, INDEX_TEMPLATE.format(hex_rgb.replace("0x", "#"),
-                                                   all_time_score['X'],
-                                                   all_time_score['O']), content_type="text/html")
-
-print(str(wifi.radio.ipv4_address))
-server.start()
-
-while True:
-    server.poll()
-    event = buttons.events.get()
-    if event:
-        if event.pressed:
-            if event.key_number not in pressed_buttons:
-                pressed_buttons.append(event.key_number)
-        elif event.released:
-            if event.key_number in pressed_buttons:
-                pressed_buttons.remove(event.key_number)
-    try:
-        if CURRENT_STATE == STATE_TIC_TAC_TOE:
-            if event:
-                print(event)
-
-                if BUTTON_A in pressed_buttons and \
-                        event.key_number == BUTTON_C and event.released:
-                    print("A held and C pressed")
-                    session_score["X"] = 0
-                    session_score["O"] = 0
-                    CURRENT_STATE = STATE_BADGE
-                    set_state(CURRENT_STATE)
-                    LAST_STATE_CHANGE = time.monotonic()
-                    continue
-
-                if event.key_number == 0 and event.released:
-                    game.move_selector_up()
-                elif event.key_number == 1 and event.released:
-                    game.move_selector_down()
-                elif event.key_number == 2 and event.released:
-                    game.move_selector_left()
-                elif event.key_number == 4 and event.released:
-                    game.move_selector_right()
-                elif event.key_number == 3 and event.released:
-
-                    if game.board_state[game.selector_position[1]][game.selector_position[0]] == "":
-                        game.play_current_move()
-                        winner = game.check_winner()
-                        if winner:
-                            print("WINNER:")
-                            print(winner)
-                            session_score[winner[0]] += 1
-                            all_time_score[winner[0]] += 1
-                            nvm_helper.save_data(all_time_score, test_run=False)
-
-                            game.show_winner_line(winner[1])
-                            CURRENT_STATE = STATE_TIC_TAC_TOE_GAMEOVER
-                            session_score_text.text = SESSION_SCORE_TEMPLATE_STR.format(session_score["X"],
-                                                                                        session_score["O"])
-                            all_score_text.text = ALL_SCORE_TEMPLATE_STR.format(all_time_score["X"],
-                                                                                all_time_score["O"])
-                            display.refresh()
-                            continue
-                        else:
-                            display.refresh()
-                    else:
-                        print("Can't play at an occupied space.")
-        elif CURRENT_STATE == STATE_TIC_TAC_TOE_GAMEOVER:
-            if event:
-                if event.released:
-                    game.reset_game()
-                    CURRENT_STATE = STATE_TIC_TAC_TOE
-                    display.refresh()
-                    continue
-        elif CURRENT_STATE == STATE_BADGE:
-            animations.animate()
-            if event:
-                if event.key_number == BUTTON_UP and event.released:
-                    print(f"free mem: {gc.mem_free()}")
-                    animations.resume()
-                    animations.next()
-                if event.key_number == BUTTON_DOWN and event.released:
-                    animations.resume()
-                    animations.previous()
-                if event.key_number == BUTTON_B and event.released:
-                    animations.freeze()
-                    animations.fill(BLACK)
-                if event.key_number == BUTTON_C and event.released:
-                    brightness = pixel_brightness()
-                    pixels.brightness = brightness
-                if LAST_STATE_CHANGE + CHANGE_STATE_BTN_COOLDOWN < time.monotonic():
-                    print(f"badged state event: {event}")
-                    if BUTTON_A in pressed_buttons and \
-                            event.key_number == BUTTON_C and event.released:
-                        print("A held and C pressed")
-                        CURRENT_STATE = STATE_TIC_TAC_TOE
-                        session_score_text.text = SESSION_SCORE_TEMPLATE_STR.format(session_score["X"],
-                                                                                    session_score["O"])
-                        set_state(CURRENT_STATE)
-                        for _element in game:
-                            print(type(_element))
-                            print(_element)
+    color_param = request.query_params.get("neopixel_color")
+    if color_param is not None:
+        color = parse_color(color_param)
+        if color is None:
+            return Response(request, "Invalid color", status=BAD_REQUEST_400)
+        set_color(color)
+
+    return TemplateResponse(request, INDEX_TEMPLATE, {"color": format_color(badge_color()),
+                                                      "x_wins": match_log.totals["X"],
+                                                      "o_wins": match_log.totals["O"],
+                                                      "draws": match_log.totals["draw"]})
+
+
+@server.route("/api/color", (GET, POST))
+def color_handler(request: Request):
+    color_param = request.query_params.get("color")
+    if color_param is not None:
+        color = parse_color(color_param)
+        if color is None:
+            return JSONResponse(request, {"error": "invalid color"}, status=BAD_REQUEST_400)
+        set_color(color)
+    return JSONResponse(request, {"color": format_color(badge_color()),
+                                  "presets": {name: format_color(color) for name, color in PRESETS.items()}})
+
+
+def enter_badge(previous_state):
+    # the colour or animations from before the game
+    frozen, color = BADGE_LIGHTS
+    animations.stop_effect()
+    if frozen:
+        animations.fill(color)
+    else:
+        animations.color = color
+        animations.resume()
+    if carousel.stale:
+        # changed while the game was shown
+        carousel.show()
+    set_state(STATE_BADGE)
+
+
+def enter_tic_tac_toe(previous_state):
+    global BADGE_LIGHTS
+    if previous_state == STATE_TIC_TAC_TOE_GAMEOVER:
+        if match.decided:
+            match.reset()
+            update_score_text()
+        game.reset_game(match.starting_player)
+        show_turn()
+        save_checkpoint()
+        refresh_display()
+    else:
+        # the LEDs follow the game while it is shown, and go back to what
+        # the badge showed when it is left
+        BADGE_LIGHTS = (animations.frozen, animations.color)
+        animations.fill(BLACK)
+        show_turn()
+        update_score_text()
+        save_checkpoint()
+        set_state(STATE_TIC_TAC_TOE)
+
+
+def show_turn():
+    animations.play_effect(TURN, piece_color(game.turn))
+
+
+def update_score_text():
+    session_score_text.text = SESSION_SCORE_TEMPLATE_STR.format(match.games_played, match.best_of,
+                                                                match.wins["X"], match.wins["O"], match.draws)
+    all_score_text.text = ALL_SCORE_TEMPLATE_STR.format(match_log.totals["X"], match_log.totals["O"],
+                                                        match_log.totals["draw"])
+
+
+def leave_tic_tac_toe(event):
+    global LAST_STATE_CHANGE
+    print("A held and C pressed")
+    # leaving the game abandons the current match, one with no games played
+    # yet just stays open
+    if match.games_played:
+        match.reset()
+    game.reset_game(match.starting_player)
+    machine.transition(STATE_BADGE)
+    save_checkpoint()
+    LAST_STATE_CHANGE = time.monotonic()
+
+
+def play_move(event):
+    if game.board_state[game.selector_position[1]][game.selector_position[0]] != "":
+        print("Can't play at an occupied space.")
+        return
+
+    game.play_current_move()
+    finish_move()
+
+
+def finish_move():
+    winner = game.check_winner()
+    if winner:
+        print("WINNER:")
+        print(winner)
+        game.show_winner_line(winner[1])
+        table, direction = win_effect(game.winner_line_map[winner[1]])
+        animations.play_effect(table, piece_color(winner[0]), direction)
+        end_game(winner[0])
+    elif game.check_draw():
+        print("DRAW, no line can be completed anymore")
+        animations.play_effect(DRAW_PULSE, DRAW_COLOR)
+        end_game(None)
+    else:
+        show_turn()
+    save_checkpoint()
+    refresh_display()
+
+
+def end_game(winner):
+    match_over = match.record(winner)
+    match_log.append(winner, game.history.first_turn, len(game.history), match.number, match_end=match_over)
+    # only played while the badge pages are not on screen
+    carousel.invalidate("stats", reload=False)
+    if match_over:
+        print(f"{match.winner} wins the match" if match.winner else "the match is drawn")
+    machine.transition(STATE_TIC_TAC_TOE_GAMEOVER)
+    update_score_text()
+
+
+def undo_move(event):
+    if game.undo_move():
+        show_turn()
+        save_checkpoint()
+        refresh_display()
+
+
+def redo_move(event):
+    if game.redo_move():
+        finish_move()
+
+
+def restart_game(event):
+    print("B long press, restarting game")
+    game.reset_game(match.starting_player)
+    show_turn()
+    save_checkpoint()
+    refresh_display()
+
+
+def new_game(event):
+    machine.transition(STATE_TIC_TAC_TOE)
+
+
+def next_animation(event):
+    print(f"free mem: {gc.mem_free()}")
+    animations.resume()
+    animations.next()
+
+
+def previous_animation(event):
+    animations.resume()
+    animations.previous()
+
+
+def next_page(event):
+    global LAST_PAGE_CHANGE
+    carousel.next()
+    refresh_display()
+    LAST_PAGE_CHANGE = time.monotonic()
+
+
+def previous_page(event):
+    global LAST_PAGE_CHANGE
+    carousel.previous()
+    refresh_display()
+    LAST_PAGE_CHANGE = time.monotonic()
+
+
+def lights_off(event):
+    animations.freeze()
+    animations.fill(BLACK)
+
+
+def change_brightness(event):
+    brightness.step_up()
+    print(f"brightness level {brightness.level} of {brightness.levels}")
+
+
+def start_tic_tac_toe(event):
+    if LAST_STATE_CHANGE + CHANGE_STATE_BTN_COOLDOWN < time.monotonic():
+        print("A held and C pressed")
+        machine.transition(STATE_TIC_TAC_TOE)
+
+
+# state machine setup, the main loop below never needs to change when
+# states or bindings are added here.
+machine = StateMachine()
+machine.add_state(STATE_BADGE, on_enter=enter_badge, on_tick=animations.animate)
+machine.add_state(STATE_TIC_TAC_TOE, on_enter=enter_tic_tac_toe, on_tick=animations.animate)
+machine.add_state(STATE_TIC_TAC_TOE_GAMEOVER, on_tick=animations.animate)
+
+machine.on(STATE_TIC_TAC_TOE, (BUTTON_A, BUTTON_C), GESTURE_CHORD, leave_tic_tac_toe)
+machine.on(STATE_TIC_TAC_TOE, BUTTON_UP, GESTURE_TAP, lambda event: game.move_selector_up())
+machine.on(STATE_TIC_TAC_TOE, BUTTON_DOWN, GESTURE_TAP, lambda event: game.move_selector_down())
+machine.on(STATE_TIC_TAC_TOE, BUTTON_A, GESTURE_TAP, lambda event: game.move_selector_left())
+machine.on(STATE_TIC_TAC_TOE, BUTTON_C, GESTURE_TAP, lambda event: game.move_selector_right())
+machine.on(STATE_TIC_TAC_TOE, BUTTON_B, GESTURE_TAP, play_move)
+machine.on(STATE_TIC_TAC_TOE, BUTTON_B, GESTURE_LONG_PRESS, restart_game)
+machine.on(STATE_TIC_TAC_TOE, BUTTON_A, GESTURE_LONG_PRESS, undo_move)
+machine.on(STATE_TIC_TAC_TOE, BUTTON_C, GESTURE_LONG_PRESS, redo_move)
+
+for _button in (BUTTON_UP, BUTTON_DOWN, BUTTON_A, BUTTON_B, BUTTON_C):
+    machine.on(STATE_TIC_TAC_TOE_GAMEOVER, _button, GESTURE_TAP, new_game)
+
+machine.on(STATE_BADGE, BUTTON_UP, GESTURE_TAP, next_animation)
+machine.on(STATE_BADGE, BUTTON_DOWN, GESTURE_TAP, previous_animation)
+machine.on(STATE_BADGE, BUTTON_UP, GESTURE_LONG_PRESS, next_page)
+machine.on(STATE_BADGE, BUTTON_DOWN, GESTURE_LONG_PRESS, previous_page)
+machine.on(STATE_BADGE, BUTTON_B, GESTURE_TAP, lights_off)
+machine.on(STATE_BADGE, BUTTON_C, GESTURE_TAP, change_brightness)
+machine.on(STATE_BADGE, (BUTTON_A, BUTTON_C), GESTURE_CHORD, start_tic_tac_toe)
+machine.compile()
+
+# long press B restarts a game, long press A and C undo and redo a move,
+# long press UP and DOWN flip badge pages, A and C pressed together switch
+# between badge and game. A and C start that chord, so their long presses
+# count on release, holding one before pressing the other stays a chord.
+gestures = GestureRecognizer(long_press_mask=key_mask(BUTTON_UP, BUTTON_DOWN, BUTTON_A, BUTTON_B, BUTTON_C),
+                             chord_mask=key_mask(BUTTON_A, BUTTON_C))
+gesture = Gesture()
 
+
+def lights_idle():
+    global LIGHTS_BEFORE_IDLE
+    if not power_profile.leds:
+        # off already
+        return
+    LIGHTS_BEFORE_IDLE = (animations.frozen, animations.color)
+    animations.stop_effect()
+    animations.freeze()
+    pixels.fill(0)
+    pixels.show()
+
+
+def lights_active():
+    if not power_profile.leds:
+        return
+    frozen, color = LIGHTS_BEFORE_IDLE
+    if animations.color != color:
+        # the request that woke the badge picked a colour, it is showing already
+        return
+    if frozen:
+        # shows the filled colour again
+        animations.redraw()
+    else:
+        animations.resume()
+
+
+# after a minute without buttons or web clients the LEDs go off and the loop
+# polls ten times a second instead of spinning
+LIGHTS_BEFORE_IDLE = (False, 0)
+idle = IdleManager(idle_after=60, idle_interval=0.1, on_idle=lights_idle, on_active=lights_active)
+
+
+@server.route("/api/power", GET)
+def power_handler(request: Request):
+    stats = idle.stats()
+    stats["battery_volts"] = round(battery.voltage, 2) if battery.voltage is not None else None
+    stats["battery_level"] = battery.level
+    stats["profile"] = power_profile.name
+    return JSONResponse(request, stats)
+
+
+def battery_level_changed(level):
+    ttt_battery.level = level
+    badge_battery.level = level
+    # only refreshes if the glyph is on screen
+    refresh_display()
+
+
+def apply_profile(profile):
+    """
+    Switch the LEDs, loop timing and refresh rate to a battery profile.
+    """
+    global power_profile
+    print(f"power profile {profile.name}")
+    was_lit = power_profile.leds and not idle.idle
+    if was_lit and not profile.leds:
+        lights_idle()
+    power_profile = profile
+    idle.active_interval = profile.active_interval
+    idle.idle_interval = profile.idle_interval
+    idle.idle_after = profile.idle_after
+    if not was_lit and profile.leds and not idle.idle:
+        lights_active()
+
+
+power_profile = PROFILE_FULL
+
+
+@server.route("/api/brightness", (GET, POST))
+def brightness_handler(request: Request):
+    level = request.query_params.get("level")
+    if level is not None:
+        try:
+            brightness.level = int(level)
+        except ValueError:
+            return JSONResponse(request, {"error": "level must be a number"}, status=BAD_REQUEST_400)
+    return JSONResponse(request, {"level": brightness.level, "levels": brightness.levels,
+                                  "percent": brightness.percent})
+
+
+@server.route("/api/scenes", (GET, POST))
+def scenes_handler(request: Request):
+    if request.method == POST:
+        params = request.query_params
+        try:
+            delete_index = params.get("delete")
+            if delete_index is not None:
+                scene_playlist.delete(int(delete_index))
+            else:
+                color = None
+                if params.get("color") is not None:
+                    color = parse_color(params.get("color"))
+                    if color is None:
+                        raise ValueError("invalid color")
+                scene = Scene(animation=ANIMATION_NAMES[params.get("animation", "rainbow")],
+                              step_ms=int(params.get("step_ms", 100)), color=color,
+                              duration=int(params.get("duration", 45)))
+                if not 1 <= scene.step_ms <= 0xFFFF or not 0 <= scene.duration <= 0xFF:
+                    raise ValueError("step_ms or duration out of range")
+                scene_playlist.write(int(params.get("index", len(scene_playlist))), scene)
+        except (KeyError, ValueError, IndexError) as error:
+            return JSONResponse(request, {"error": str(error)}, status=BAD_REQUEST_400)
+        except OSError:
+            return JSONResponse(request, {"error": "filesystem is read only"}, status=Status(403, "Forbidden"))
+        if scene_player.index < 0:
+            scene_player.advance()
+
+    scenes = []
+    scene = Scene()
+    for index in range(len(scene_playlist)):
+        scenes.append(scene_playlist.read(index, scene).to_dict())
+    return JSONResponse(request, {"scenes": scenes, "playing": scene_player.index})
+
+
+@server.route("/screen.bmp", GET)
+def screen_bmp_handler(request: Request):
+    return screen.bmp_response(request)
+
+
+@server.route("/screen.png", GET)
+def screen_png_handler(request: Request):
+    return screen.png_response(request)
+
+
+@server.route("/api/undo", POST)
+def undo_handler(request: Request):
+    if machine.state != STATE_TIC_TAC_TOE or not game.undo_move():
+        return JSONResponse(request, {"undone": None}, status=Status(409, "Conflict"))
+    show_turn()
+    save_checkpoint()
+    refresh_display()
+    return JSONResponse(request, {"undone": game.selector_position})
+
+
+@server.route("/api/redo", POST)
+def redo_handler(request: Request):
+    if machine.state != STATE_TIC_TAC_TOE or not game.redo_move():
+        return JSONResponse(request, {"redone": None}, status=Status(409, "Conflict"))
+    finish_move()
+    return JSONResponse(request, {"redone": cell_position(game.history.moves[len(game.history) - 1])})
+
+
+def address_changed(address):
+    """
+    Restart the web server on the new address and update the IP label and
+    badge QR code. The badge pages are only rendered again right away while
+    they are on screen, and refresh_display() skips the refresh when nothing
+    on screen changed.
+    """
+    print(f"IP address: {address}")
+    server.stop()
+    if address is not None:
+        server.start(port=network.port)
+    ip_text.text = f"IP: {address}" if address is not None else "IP: offline"
+    # the QR codes hold the address, encode and render them for the new one
+    qr_codes.clear()
+    on_badge = machine.state == STATE_BADGE
+    carousel.invalidate("qr", reload=on_badge)
+    if badge_composer is not None and badge_composer.qr_text(address) is not None:
+        carousel.invalidate("contact", reload=on_badge)
+    # nothing is on screen yet while the network starts up at boot
+    if machine.state is not None:
+        refresh_display()
+
+
+# also reachable as http://badge.local:5000
+network = NetworkManager(wifi.radio, hostname="badge", port=5000, storage=microcontroller.nvm,
+                         offset=NVM_NETWORK_OFFSET, on_address_change=address_changed)
+network.start()
+
+# with no network to join, host one and answer every DNS lookup with the
+# badge so phones open the page as a captive portal
+dns = None
+if network.address is None:
+    network.start_access_point(os.getenv("BADGE_AP_SSID", "TicTacToe-Badge"), os.getenv("BADGE_AP_PASSWORD"))
+    dns = DNSResponder(pool, network.address)
+    dns.start()
+
+carousel.show(0)
+
+# pick the match back up, and the game when a crash or watchdog reset
+# interrupted one
+saved_game = checkpoint.load()
+if saved_game is not None:
+    print(f"restoring checkpoint, {len(saved_game.moves)} moves into match {saved_game.match_number}")
+    restore_checkpoint(saved_game)
+else:
+    # after a power loss only the game log is left to go on
+    match.resume(match_log)
+    update_score_text()
+    machine.transition(STATE_BADGE)
+
+# show the colour last picked on the web page instead of the animations
+last_color = load_color(microcontroller.nvm, NVM_LAST_COLOR_OFFSET)
+if last_color is not None:
+    set_color(last_color)
+
+# samples the battery every 30 seconds
+battery = BatteryMonitor(interval=30000)
+battery.update(force=True)
+ttt_battery.level = badge_battery.level = battery.level
+apply_profile(battery.profile)
+battery.on_level_change = battery_level_changed
+battery.on_profile_change = apply_profile
+
+
+def loop_step():
+    network.update()
+    battery.update()
+    write_checkpoint()
+    write_color()
+    if REFRESH_PENDING and time.monotonic() >= LAST_REFRESH + power_profile.refresh_interval:
+        refresh_display()
+    if server.poll() or server.open_connections:
+        idle.activity()
+    if dns is not None:
+        dns.poll()
+    had_input = False
+    try:
+        # every queued event reaches the gesture recogniser before update(),
+        # or a release that waited out a slow pass, like an e-ink refresh,
+        # would be taken for a long press
+        event = buttons.events.get()
+        while event:
+            had_input = True
+            idle.activity()
+            gestures.feed(event)
+            machine.dispatch(event)
+            event = buttons.events.get()
+        gestures.update(ticks_ms())
+        if not had_input:
+            # per state work like LED frames only runs when there is no input to handle
+            machine.tick()
+            if machine.state == STATE_BADGE and LAST_PAGE_CHANGE + BADGE_PREFETCH_DELAY < time.monotonic():
+                # decode the next badge page ahead of the next flip
+                carousel.prefetch()
+        while gestures.events.get_into(gesture):
+            machine.dispatch_gesture(gesture)
     except RuntimeError as e:
         print("Caught Runtime error, probably refreshed too soon.")
         print(e)
         time.sleep(display.time_to_refresh + 0.6)
         display.refresh()
+    idle.wait()
+
+
+# a hung or repeatedly failing loop resets the badge, which then carries on
+# from the checkpoint
+supervisor = LoopSupervisor(timeout=8, max_errors=3, error_window=60)
+if supervisor.watchdog_reset:
+    print("restarted by the watchdog")
+supervisor.run(loop_step)
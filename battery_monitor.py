@@ -0,0 +1,166 @@
+"""
+Battery voltage monitoring and the performance profiles that follow it.
+
+The Badger 2040 W measures its supply through a divider of 3 on an ADC pin.
+BatteryMonitor averages a few readings every interval milliseconds, sorts the
+voltage into a level from 0 (empty) to LEVELS - 1 (full) for the battery
+glyph, and picks the Profile for it from the thresholds. Callbacks only run
+when the level or the profile changes, so nothing is redrawn between changes.
+"""
+import analogio
+import board
+import displayio
+import vectorio
+
+from adafruit_ticks import ticks_ms, ticks_add, ticks_diff
+
+LEVELS = 5
+
+
+class Profile:
+    """
+    How hard the badge works. leds is whether the LED animations run,
+    active_interval and idle_interval the main loop pass times of the
+    IdleManager, idle_after its seconds until idle, and refresh_interval the
+    least seconds between display refreshes.
+    """
+
+    def __init__(self, name, leds=True, active_interval=0.0, idle_interval=0.1, idle_after=60,
+                 refresh_interval=0):
+        self.name = name
+        self.leds = leds
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.idle_after = idle_after
+        self.refresh_interval = refresh_interval
+
+    def __repr__(self):
+        return f"<Profile {self.name}>"
+
+
+PROFILE_FULL = Profile("full")
+PROFILE_SAVER = Profile("saver", active_interval=0.02, idle_interval=0.25, idle_after=20)
+PROFILE_LOW = Profile("low", leds=False, active_interval=0.05, idle_interval=0.5, idle_after=10,
+                      refresh_interval=10)
+
+# (lowest volts, profile), highest first, for a single cell LiPo
+DEFAULT_THRESHOLDS = ((3.7, PROFILE_FULL), (3.5, PROFILE_SAVER), (0.0, PROFILE_LOW))
+
+
+def battery_pin():
+    """
+    The ADC pin of the battery divider, None on boards without one.
+    """
+    for name in ("VBAT_SENSE", "VOLTAGE_MONITOR", "A3"):
+        pin = getattr(board, name, None)
+        if pin is not None:
+            return pin
+    return None
+
+
+class BatteryMonitor:
+    """
+    empty and full are the volts of level 0 and the top level. A profile is
+    only left again once the voltage is hysteresis volts past its threshold,
+    so a reading that wavers around a threshold does not flip profiles.
+    """
+
+    def __init__(self, pin=None, divider=3, empty=3.3, full=4.1, thresholds=DEFAULT_THRESHOLDS,
+                 hysteresis=0.05, samples=8, interval=30000, on_level_change=None, on_profile_change=None):
+        if pin is None:
+            pin = battery_pin()
+        self._adc = analogio.AnalogIn(pin) if pin is not None else None
+        self.divider = divider
+        self.empty = empty
+        self.full = full
+        self.thresholds = thresholds
+        self.hysteresis = hysteresis
+        self.samples = samples
+        self.interval = interval
+        self.on_level_change = on_level_change
+        self.on_profile_change = on_profile_change
+        self.voltage = None
+        self.level = LEVELS - 1
+        self.profile = thresholds[0][1]
+        self._next_sample = ticks_ms()
+
+    def read_voltage(self):
+        total = 0
+        for _ in range(self.samples):
+            total += self._adc.value
+        return total / self.samples * self._adc.reference_voltage / 65535 * self.divider
+
+    def update(self, now=None, force=False):
+        """
+        Sample the battery if interval has passed since the last sample.
+        """
+        if self._adc is None:
+            return
+        if now is None:
+            now = ticks_ms()
+        if not force and ticks_diff(now, self._next_sample) < 0:
+            return
+        self._next_sample = ticks_add(now, self.interval)
+        self.voltage = self.read_voltage()
+
+        fraction = (self.voltage - self.empty) / (self.full - self.empty)
+        level = min(max(int(fraction * LEVELS), 0), LEVELS - 1)
+        if level != self.level:
+            self.level = level
+            if self.on_level_change is not None:
+                self.on_level_change(level)
+
+        profile = self._pick_profile()
+        if profile is not self.profile:
+            self.profile = profile
+            if self.on_profile_change is not None:
+                self.on_profile_change(profile)
+
+    def _pick_profile(self):
+        current = 0
+        for i, (_, profile) in enumerate(self.thresholds):
+            if profile is self.profile:
+                current = i
+        for i, (volts, profile) in enumerate(self.thresholds):
+            # moving up to a better profile needs the extra margin
+            margin = self.hysteresis if i < current else 0
+            if self.voltage >= volts + margin:
+                return profile
+        return self.thresholds[-1][1]
+
+
+class BatteryGlyph(displayio.Group):
+    """
+    A small battery outline filled to a level, width x height pixels with
+    the terminal on the right.
+    """
+
+    def __init__(self, x=0, y=0, width=20, height=10, level=LEVELS - 1):
+        super().__init__(x=x, y=y)
+        palette = displayio.Palette(2)
+        palette[0] = 0x000000
+        palette[1] = 0xFFFFFF
+        body = width - 2
+        self.append(vectorio.Rectangle(pixel_shader=palette, color_index=0, width=body, height=height, x=0, y=0))
+        self.append(vectorio.Rectangle(pixel_shader=palette, color_index=1, width=body - 2, height=height - 2,
+                                       x=1, y=1))
+        self.append(vectorio.Rectangle(pixel_shader=palette, color_index=0, width=2, height=height // 2,
+                                       x=body, y=height // 4))
+        self._inside = body - 4
+        self._fill = vectorio.Rectangle(pixel_shader=palette, color_index=0, width=self._inside, height=height - 4,
+                                        x=2, y=2)
+        self.append(self._fill)
+        self.level = level
+
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, level):
+        self._level = level
+        if level <= 0:
+            self._fill.hidden = True
+        else:
+            self._fill.hidden = False
+            self._fill.width = max(self._inside * level // (LEVELS - 1), 1)
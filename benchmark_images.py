@@ -0,0 +1,79 @@
+"""
+Compare OnDiskBitmap with RLE images on the badge. Copy it over as code.py
+together with the .bmp and .rle files and watch the serial console.
+
+For each image it prints the file sizes, the time to load it, and the time
+display.refresh() takes with 9 copies of it on screen, which is when
+displayio reads the pixels. OnDiskBitmaps are read from the filesystem during
+every refresh, RLE images only once when they are loaded.
+"""
+import gc
+import os
+import time
+
+import board
+import displayio
+
+from rle_image import load_rle
+
+IMAGES = ("x.bmp", "o.bmp", "selector.bmp", "pimoroni_badgerw_badge.bmp")
+LOADS = 10
+
+display = board.DISPLAY
+
+
+def file_size(path):
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return None
+
+
+def time_loads(load):
+    gc.collect()
+    free = gc.mem_free()
+    start = time.monotonic_ns()
+    for _ in range(LOADS):
+        result = load()
+    elapsed = (time.monotonic_ns() - start) // LOADS // 1000
+    gc.collect()
+    return result, elapsed, free - gc.mem_free()
+
+
+def time_refresh(bitmap, pixel_shader):
+    group = displayio.Group()
+    for i in range(9):
+        tile_grid = displayio.TileGrid(bitmap, pixel_shader=pixel_shader)
+        tile_grid.x = (i % 3) * min(bitmap.width, display.width // 3)
+        tile_grid.y = (i // 3) * min(bitmap.height, display.height // 3)
+        group.append(tile_grid)
+    display.root_group = group
+    # e-ink panels refuse refreshes that come too soon after the last one
+    time.sleep(display.time_to_refresh)
+    start = time.monotonic_ns()
+    display.refresh()
+    return (time.monotonic_ns() - start) // 1000
+
+
+def load_on_disk(path):
+    bitmap = displayio.OnDiskBitmap(path)
+    return bitmap, bitmap.pixel_shader
+
+
+for bmp_path in IMAGES:
+    rle_path = bmp_path.rsplit(".", 1)[0] + ".rle"
+    if file_size(bmp_path) is None or file_size(rle_path) is None:
+        print(f"{bmp_path}: missing, run compile_images.py and copy both files")
+        continue
+    print(f"{bmp_path}: {file_size(bmp_path)} bytes, {rle_path}: {file_size(rle_path)} bytes")
+
+    (bitmap, shader), load_us, ram = time_loads(lambda: load_on_disk(bmp_path))
+    refresh_us = time_refresh(bitmap, shader)
+    print(f"  OnDiskBitmap  load {load_us} us, refresh {refresh_us} us, {ram} bytes RAM")
+
+    (bitmap, shader), load_us, ram = time_loads(lambda: load_rle(rle_path))
+    refresh_us = time_refresh(bitmap, shader)
+    print(f"  RLE           load {load_us} us, refresh {refresh_us} us, {ram} bytes RAM")
+
+display.root_group = None
+print("done")
@@ -16,7 +16,8 @@ import socketpool
 import wifi
 
 import foamyguy_nvm_helper as nvm_helper
-from adafruit_httpserver import Server, Route, as_route, Request, Response, FileResponse, GET, POST
+from color_params import parse_color, format_color
+from adafruit_httpserver import Server, Route, as_route, Request, Response, FileResponse, BAD_REQUEST_400, GET, POST
 
 pool = socketpool.SocketPool(wifi.radio)
 server = Server(pool, "/static", debug=True)
@@ -368,14 +369,15 @@ def change_neopixel_color_handler_query_params(request: Request):
     """Changes the color of the built-in NeoPixel using query/GET params."""
     if request.method == GET:
 
-        hex_rgb = request.query_params.get("neopixel_color")
-        if hex_rgb is not None:
-            hex_rgb = hex_rgb.replace("%23", "0x")
-            # print(f"hex rgb: {hex(int(hex_rgb, 16))}")
-            pixels.fill(int(hex_rgb, 16))
-        else:
-            hex_rgb = ""
-        return Response(request, COLOR_PICKER_TEMPLATE.format(hex_rgb.replace("0x", "#")), content_type="text/html")
+        color_param = request.query_params.get("neopixel_color")
+        hex_rgb = ""
+        if color_param is not None:
+            color = parse_color(color_param)
+            if color is None:
+                return Response(request, "Invalid color", status=BAD_REQUEST_400)
+            pixels.fill(color)
+            hex_rgb = format_color(color)
+        return Response(request, COLOR_PICKER_TEMPLATE.format(hex_rgb), content_type="text/html")
 
 
 @server.route("/", GET)
@@ -0,0 +1,80 @@
+"""
+Perceptual brightness control for the NeoPixels.
+
+Brightness is chosen from a few levels that look evenly spaced to the eye.
+Each level is turned into a 256 entry lookup table that applies gamma
+correction, the brightness level and a current limit in one step, so colour
+writes only cost one table lookup per channel. The float math only runs when
+the level changes.
+"""
+
+GAMMA = 2.2
+
+# roughly what one WS2812 channel draws at full duty
+MA_PER_CHANNEL = 20
+
+
+class Brightness:
+    """
+    Holds the current brightness level, 1 to levels, and the lookup table for
+    it. lut is updated in place, so it can be shared with LedEngine. max_ma
+    caps the current the whole strip can draw with every channel at 255.
+    on_change is called after the table was rebuilt.
+    """
+
+    def __init__(self, pixel_count, levels=6, level=2, max_ma=400, gamma=GAMMA, on_change=None):
+        self.pixel_count = pixel_count
+        self.levels = levels
+        self.max_ma = max_ma
+        self.gamma = gamma
+        self.on_change = on_change
+        self.lut = bytearray(256)
+        self._level = 0
+        self.level = level
+
+    @property
+    def level(self):
+        return self._level
+
+    @level.setter
+    def level(self, value):
+        value = min(max(int(value), 1), self.levels)
+        if value == self._level:
+            return
+        self._level = value
+        self._build()
+        if self.on_change is not None:
+            self.on_change()
+
+    @property
+    def percent(self):
+        """
+        Perceived brightness in percent.
+        """
+        return self._level * 100 // self.levels
+
+    @property
+    def max_output(self):
+        """
+        Highest value the lookup table sends to the strip after the current cap.
+        """
+        full = self.max_ma * 255 // (self.pixel_count * 3 * MA_PER_CHANNEL)
+        return min(full, 255)
+
+    def step_up(self):
+        """
+        Go one level brighter, wrapping around to the dimmest level.
+        Returns the new level.
+        """
+        self.level = self._level % self.levels + 1
+        return self._level
+
+    def _build(self):
+        # gamma is applied to the colour value scaled by the perceived level,
+        # so equal level steps look equally far apart
+        peak = 255.0 * ((self._level / self.levels) ** self.gamma)
+        scale = min(1.0, self.max_output / peak) if peak else 0.0
+        top = peak * scale
+        lut = self.lut
+        for v in range(256):
+            lut[v] = int(top * ((v / 255) ** self.gamma) + 0.5)
@@ -0,0 +1,130 @@
+"""
+Tiny DNS responder for access point mode.
+
+Every A query is answered with the badge's own address, whatever name was
+asked for, so phones joining the badge's network land on its web page and
+show it as a captive portal. Other query types get an empty answer.
+
+The reply is built in place in the buffer the query was received into, so no
+objects are created per packet beyond the address the socket hands back.
+pool can be a socketpool.SocketPool on the badge, or the socket module on a
+computer for testing.
+"""
+import errno
+
+DNS_PORT = 53
+
+_HEADER_SIZE = 12
+_TYPE_A = 1
+_TYPE_ANY = 255
+_CLASS_IN = 1
+_ANSWER_SIZE = 16
+
+
+class DNSResponder:
+    """
+    Answers queries on port with address, a dotted IPv4 string. Call poll()
+    every loop iteration.
+    """
+
+    def __init__(self, pool, address, port=DNS_PORT, ttl=60, buffer_size=512, max_packets=4):
+        self.pool = pool
+        self.port = port
+        self.ttl = ttl
+        self.max_packets = max_packets
+        self.answered = 0
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._address = bytearray(4)
+        self.address = address
+        self._socket = None
+
+    @property
+    def address(self):
+        return ".".join(str(part) for part in self._address)
+
+    @address.setter
+    def address(self, value):
+        parts = value.split(".")
+        if len(parts) != 4:
+            raise ValueError("address must be a dotted IPv4 address")
+        for i, part in enumerate(parts):
+            self._address[i] = int(part)
+
+    def start(self, host="0.0.0.0"):
+        self._socket = self.pool.socket(self.pool.AF_INET, self.pool.SOCK_DGRAM)
+        self._socket.bind((host, self.port))
+        self._socket.setblocking(False)
+
+    def stop(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def poll(self):
+        """
+        Answer up to max_packets waiting queries.
+        """
+        if self._socket is None:
+            return
+        for _ in range(self.max_packets):
+            try:
+                size, client_address = self._socket.recvfrom_into(self._buffer)
+            except OSError as error:
+                if error.errno == errno.EAGAIN:
+                    return
+                raise
+            length = self.build_reply(size)
+            if length:
+                try:
+                    self._socket.sendto(self._view[:length], client_address)
+                    self.answered += 1
+                except OSError:
+                    pass
+
+    def build_reply(self, size):
+        """
+        Turn the query in the first size bytes of the buffer into a reply.
+        Returns the reply length, or 0 if the packet should be ignored.
+        """
+        buffer = self._buffer
+        if size < _HEADER_SIZE:
+            return 0
+        # only standard queries with a single question
+        if buffer[2] & 0xF8 or buffer[4] or buffer[5] != 1:
+            return 0
+        position = _HEADER_SIZE
+        while position < size and buffer[position]:
+            if buffer[position] & 0xC0:
+                return 0
+            position += buffer[position] + 1
+        # zero length root label, then type and class
+        end = position + 5
+        if end > size or end + _ANSWER_SIZE > len(buffer):
+            return 0
+        query_type = (buffer[position + 1] << 8) | buffer[position + 2]
+        query_class = (buffer[position + 3] << 8) | buffer[position + 4]
+        answer = query_class == _CLASS_IN and query_type in (_TYPE_A, _TYPE_ANY)
+
+        # response, authoritative, keep recursion desired, no error
+        buffer[2] = 0x84 | (buffer[2] & 0x01)
+        buffer[3] = 0
+        buffer[6] = 0
+        buffer[7] = 1 if answer else 0
+        buffer[8:12] = b"\x00\x00\x00\x00"
+        if not answer:
+            return end
+
+        # name is a pointer to the question, then type A, class IN, ttl and
+        # the 4 byte address
+        buffer[end:end + 2] = b"\xc0\x0c"
+        buffer[end + 2:end + 6] = b"\x00\x01\x00\x01"
+        ttl = self.ttl
+        buffer[end + 6] = (ttl >> 24) & 0xFF
+        buffer[end + 7] = (ttl >> 16) & 0xFF
+        buffer[end + 8] = (ttl >> 8) & 0xFF
+        buffer[end + 9] = ttl & 0xFF
+        buffer[end + 10] = 0
+        buffer[end + 11] = 4
+        buffer[end + 12:end + 16] = self._address
+        return end + _ANSWER_SIZE
@@ -0,0 +1,173 @@
+"""
+Game checkpoints, so a crash or watchdog reset does not lose the game in
+progress or the match scores.
+
+A checkpoint is one 16 byte record: the screen, the moves of the current game
+4 bits each, the selector and the match. Records go round a ring of slots
+with a sequence number and a check byte, and the newest valid slot is the one
+restored. A save is a single slice write of one record and is skipped when
+nothing changed since the last one.
+
+On NVM that is written in place, like EEPROM, the ring spreads the wear over
+the slots and a reset part way through a save falls back to the save before.
+microcontroller.nvm on the RP2040 is a single flash sector that every write
+erases and rewrites, however small, so there a save costs milliseconds and
+the whole sector's wear, and the ring spreads nothing. Callers should save at
+quiet moments, not after every move.
+"""
+import struct
+import time
+
+# sequence, flags, move count and selector, moves, X wins, O wins, draws,
+# games played, match number, check
+_SLOT_FORMAT = "<HBB5sBBBBHB"
+SLOT_SIZE = struct.calcsize(_SLOT_FORMAT)
+_CHECK_SEED = 0x5A
+
+_FLAG_STATE_MASK = 0x03
+_FLAG_GAME_O_FIRST = 0x04
+_FLAG_MATCH_O_FIRST = 0x08
+
+
+def _check(record):
+    total = _CHECK_SEED
+    for i in range(SLOT_SIZE - 1):
+        total += record[i]
+    return total & 0xFF
+
+
+def _plausible(record):
+    flags, counts = record[2], record[3]
+    count = counts & 0x0F
+    if flags & _FLAG_STATE_MASK == 3 or count > 9 or counts >> 4 > 8:
+        return False
+    played = 0
+    for i in range(count):
+        index = (record[4 + (i >> 1)] >> (4 if i & 1 else 0)) & 0x0F
+        if index > 8 or played & (1 << index):
+            return False
+        played |= 1 << index
+    return True
+
+
+class GameState:
+    """
+    What a checkpoint holds. state is the screen, a small int chosen by the
+    caller, moves a bytearray of cell indexes in the order they were played.
+    """
+
+    def __init__(self):
+        self.state = 0
+        self.game_first_turn = "X"
+        self.moves = bytearray()
+        self.selector = 0
+        self.match_first_turn = "X"
+        self.wins = {"X": 0, "O": 0}
+        self.draws = 0
+        self.games_played = 0
+        self.match_number = 0
+
+
+class Checkpoint:
+    """
+    slots records of SLOT_SIZE from offset in storage, which needs slice reads
+    and writes like microcontroller.nvm.
+    """
+
+    def __init__(self, storage, offset=0, slots=16):
+        self.storage = storage
+        self.offset = offset
+        self.slots = slots
+        self._record = bytearray(SLOT_SIZE)
+        self._moves = bytearray(5)
+        # matches no record, flags never has its high bits set
+        self._last = bytearray(b"\xff" * SLOT_SIZE)
+        self._sequence = 0
+        self._next_slot = 0
+        self.saves = 0
+        self.skipped = 0
+        self.last_save_us = 0
+
+    @property
+    def size(self):
+        return self.slots * SLOT_SIZE
+
+    def load(self):
+        """
+        Returns the GameState of the newest valid slot, or None when there
+        is no checkpoint.
+        """
+        newest = None
+        for slot in range(self.slots):
+            start = self.offset + slot * SLOT_SIZE
+            record = self.storage[start:start + SLOT_SIZE]
+            if record[SLOT_SIZE - 1] != _check(record) or not _plausible(record):
+                # never written, cut short, or RAM that held something else
+                continue
+            sequence = struct.unpack_from("<H", record)[0]
+            # sequence numbers wrap, newer is less than half the range ahead
+            if newest is None or 0 < ((sequence - newest[0]) & 0xFFFF) < 0x8000:
+                newest = (sequence, slot, record)
+        if newest is None:
+            return None
+        sequence, slot, record = newest
+        self._sequence = sequence
+        self._next_slot = (slot + 1) % self.slots
+        self._last[:] = record
+        return self._unpack(record)
+
+    def save(self, game_state):
+        """
+        Write game_state to the next slot, unless it is what the last save
+        wrote. Returns True if it was written.
+        """
+        start_ns = time.monotonic_ns()
+        record = self._record
+        self._pack(game_state, record)
+        # compare without the sequence number and check
+        if record[2:SLOT_SIZE - 1] == self._last[2:SLOT_SIZE - 1]:
+            self.skipped += 1
+            return False
+        self._sequence = (self._sequence + 1) & 0xFFFF
+        struct.pack_into("<H", record, 0, self._sequence)
+        record[SLOT_SIZE - 1] = _check(record)
+        start = self.offset + self._next_slot * SLOT_SIZE
+        self.storage[start:start + SLOT_SIZE] = record
+        self._next_slot = (self._next_slot + 1) % self.slots
+        self._last[:] = record
+        self.saves += 1
+        self.last_save_us = (time.monotonic_ns() - start_ns) // 1000
+        return True
+
+    def _pack(self, game_state, record):
+        flags = game_state.state & _FLAG_STATE_MASK
+        if game_state.game_first_turn == "O":
+            flags |= _FLAG_GAME_O_FIRST
+        if game_state.match_first_turn == "O":
+            flags |= _FLAG_MATCH_O_FIRST
+        moves = self._moves
+        for i in range(len(moves)):
+            moves[i] = 0
+        for i, index in enumerate(game_state.moves):
+            moves[i >> 1] |= index << (4 if i & 1 else 0)
+        struct.pack_into(_SLOT_FORMAT, record, 0, 0, flags, len(game_state.moves) | (game_state.selector << 4),
+                         moves, game_state.wins["X"] & 0xFF, game_state.wins["O"] & 0xFF, game_state.draws & 0xFF,
+                         game_state.games_played & 0xFF, game_state.match_number & 0xFFFF, 0)
+
+    @staticmethod
+    def _unpack(record):
+        _, flags, counts, moves, x_wins, o_wins, draws, games_played, match_number, _ = \
+            struct.unpack_from(_SLOT_FORMAT, record)
+        game_state = GameState()
+        game_state.state = flags & _FLAG_STATE_MASK
+        game_state.game_first_turn = "O" if flags & _FLAG_GAME_O_FIRST else "X"
+        game_state.match_first_turn = "O" if flags & _FLAG_MATCH_O_FIRST else "X"
+        count = counts & 0x0F
+        game_state.moves = bytearray((moves[i >> 1] >> (4 if i & 1 else 0)) & 0x0F for i in range(count))
+        game_state.selector = counts >> 4
+        game_state.wins["X"] = x_wins
+        game_state.wins["O"] = o_wins
+        game_state.draws = draws
+        game_state.games_played = games_played
+        game_state.match_number = match_number
+        return game_state
@@ -0,0 +1,129 @@
+"""
+Parsing, presets and persistence for colours passed to the web interface.
+
+parse_color() accepts "#rrggbb", "%23rrggbb" (the url encoded form a colour
+input submits), "rrggbb", "r,g,b" with plain or url encoded commas, and the
+preset names. It walks the characters once and builds the integer as it goes,
+with no intermediate strings, and returns None for anything malformed instead
+of raising.
+"""
+
+PRESETS = {
+    "off": 0x000000,
+    "white": 0xFFFFFF,
+    "red": 0xFF0000,
+    "orange": 0xFF6600,
+    "yellow": 0xFFCC00,
+    "green": 0x00FF00,
+    "cyan": 0x00FFFF,
+    "blue": 0x0000FF,
+    "purple": 0x9900FF,
+    "pink": 0xFF0066,
+}
+
+# marker byte in front of the saved colour, so blank NVM reads as no colour
+_SAVED_MARKER = 0xC0
+SAVED_COLOR_SIZE = 4
+
+
+def _hex_value(code):
+    # code is the ord() of a character
+    if 48 <= code <= 57:
+        return code - 48
+    if 97 <= code <= 102:
+        return code - 87
+    if 65 <= code <= 70:
+        return code - 55
+    return -1
+
+
+def _parse_hex(text, start):
+    if len(text) - start != 6:
+        return None
+    color = 0
+    for i in range(start, start + 6):
+        value = _hex_value(ord(text[i]))
+        if value < 0:
+            return None
+        color = (color << 4) | value
+    return color
+
+
+def _parse_rgb(text):
+    color = 0
+    channel = 0
+    digits = 0
+    channels = 0
+    i = 0
+    length = len(text)
+    while i <= length:
+        if i == length or text[i] == ",":
+            separator_length = 1
+        elif text[i] == "%" and i + 2 < length and text[i + 1] == "2" and text[i + 2] in "cC":
+            separator_length = 3
+        else:
+            code = ord(text[i]) - 48
+            if not 0 <= code <= 9 or digits == 3:
+                return None
+            channel = channel * 10 + code
+            digits += 1
+            i += 1
+            continue
+
+        if digits == 0 or channel > 255 or channels == 3:
+            return None
+        color = (color << 8) | channel
+        channels += 1
+        channel = 0
+        digits = 0
+        i += separator_length
+    if channels != 3:
+        return None
+    return color
+
+
+def parse_color(text):
+    """
+    Parse a colour parameter into an int 0xRRGGBB, or return None if it is
+    not a valid colour.
+    """
+    if not text:
+        return None
+    if text in PRESETS:
+        return PRESETS[text]
+    if text[0] == "#":
+        return _parse_hex(text, 1)
+    if text[0] == "%" and text.startswith("%23"):
+        return _parse_hex(text, 3)
+    if "," in text or "%" in text:
+        return _parse_rgb(text)
+    return _parse_hex(text, 0)
+
+
+def format_color(color):
+    """
+    Format a colour as "#rrggbb", the form a colour input expects.
+    """
+    return "#{:06x}".format(color)
+
+
+def load_color(storage, offset):
+    """
+    Read the colour saved by save_color(), or None if none was saved.
+    """
+    saved = storage[offset:offset + SAVED_COLOR_SIZE]
+    if saved[0] != _SAVED_MARKER:
+        return None
+    return (saved[1] << 16) | (saved[2] << 8) | saved[3]
+
+
+def save_color(storage, offset, color):
+    """
+    Save color at offset in storage, such as microcontroller.nvm. Nothing is
+    written when the same colour is already saved.
+    """
+    if load_color(storage, offset) == color:
+        return False
+    storage[offset:offset + SAVED_COLOR_SIZE] = bytes((_SAVED_MARKER, (color >> 16) & 0xFF,
+                                                       (color >> 8) & 0xFF, color & 0xFF))
+    return True
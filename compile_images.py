@@ -0,0 +1,115 @@
+"""
+Convert BMPs into the run length encoded .rle images rle_image.py loads.
+Runs on a computer, not on the badge:
+
+    python compile_images.py x.bmp o.bmp selector.bmp
+
+writes x.rle next to each source. Images with two colours are stored with
+1 bit per run colour and up to 128 pixels per run byte, images with three or
+four colours with 2 bits and up to 64 pixels. Copy the .rle files to the
+badge along with the code, the .bmp files can then be left off.
+
+File layout, all little endian:
+
+    "RLE1", width (H), height (H), bits (B), colour count (B)
+    colour count x 3 bytes red, green, blue
+    run bytes, colour index in the top bits and length - 1 in the rest,
+    covering the pixels row by row, runs carry on into the next row
+"""
+import struct
+import sys
+
+# must match rle_image.py, which can not be imported off the badge
+_HEADER_FORMAT = "<4sHHBB"
+_HEADER_MAGIC = b"RLE1"
+
+
+def read_bmp(path):
+    """
+    Read an uncompressed 1, 4, 8 or 24 bit BMP. Returns (width, height,
+    palette, pixels), pixels a list of rows of colour indexes into palette,
+    a list of 0xRRGGBB colours.
+    """
+    with open(path, "rb") as bmp_file:
+        data = bmp_file.read()
+    if data[:2] != b"BM":
+        raise ValueError(f"{path} is not a BMP")
+    data_offset = struct.unpack_from("<I", data, 10)[0]
+    header_size, width, height = struct.unpack_from("<Iii", data, 14)
+    bits, compression = struct.unpack_from("<HI", data, 28)
+    if compression not in (0, 3) or bits not in (1, 4, 8, 24):
+        raise ValueError(f"{path}: only uncompressed 1, 4, 8 and 24 bit BMPs are supported")
+    bottom_up = height > 0
+    height = abs(height)
+    stride = ((width * bits + 31) // 32) * 4
+    palette = []
+    if bits <= 8:
+        for offset in range(14 + header_size, min(data_offset, 14 + header_size + (4 << bits)), 4):
+            blue, green, red = data[offset:offset + 3]
+            palette.append((red << 16) | (green << 8) | blue)
+
+    rows = []
+    for y in range(height):
+        start = data_offset + (height - 1 - y if bottom_up else y) * stride
+        row = []
+        for x in range(width):
+            if bits == 24:
+                blue, green, red = data[start + x * 3:start + x * 3 + 3]
+                row.append((red << 16) | (green << 8) | blue)
+            else:
+                bit = x * bits
+                row.append((data[start + (bit >> 3)] >> (8 - bits - (bit & 7))) & ((1 << bits) - 1))
+        rows.append(row)
+    if bits == 24:
+        # index the colours, darkest first like the usual 1-bit palette
+        colors = sorted(set(color for row in rows for color in row),
+                        key=lambda c: (c >> 16) * 299 + ((c >> 8) & 0xFF) * 587 + (c & 0xFF) * 114)
+        lookup = {color: i for i, color in enumerate(colors)}
+        rows = [[lookup[color] for color in row] for row in rows]
+        palette = colors
+    else:
+        # keep the indexes of the file, code may make one of them transparent
+        used = max(max(row) for row in rows) + 1
+        palette = palette[:used]
+    return width, height, palette, rows
+
+
+def compile_image(width, height, palette, rows):
+    """
+    Return the .rle form of an image from read_bmp().
+    """
+    if len(palette) > 4:
+        raise ValueError(f"{len(palette)} colours, at most 4 fit in a 2-bit image")
+    bits = 1 if len(palette) <= 2 else 2
+    max_run = 1 << (8 - bits)
+    runs = bytearray()
+    color = None
+    length = 0
+    for row in rows:
+        for index in row:
+            if index == color and length < max_run:
+                length += 1
+                continue
+            if color is not None:
+                runs.append((color << (8 - bits)) | (length - 1))
+            color = index
+            length = 1
+    runs.append((color << (8 - bits)) | (length - 1))
+    header = struct.pack(_HEADER_FORMAT, _HEADER_MAGIC, width, height, bits, len(palette))
+    colors = b"".join(struct.pack(">I", color)[1:] for color in palette)
+    return header + colors + runs
+
+
+def main(paths):
+    for path in paths:
+        compiled = compile_image(*read_bmp(path))
+        output_path = path.rsplit(".", 1)[0] + ".rle"
+        with open(output_path, "wb") as output_file:
+            output_file.write(compiled)
+        with open(path, "rb") as source_file:
+            source_length = len(source_file.read())
+        print(f"{path} ({source_length} bytes) -> {output_path} ({len(compiled)} bytes)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,72 @@
+"""
+Compile HTML templates with {{ name }} slots into the .tpl files
+page_templates.py streams. Runs on a computer, not on the badge:
+
+    python compile_templates.py templates/index.html
+
+writes templates/index.tpl next to each source. Copy the .tpl files to the
+badge along with the code.
+"""
+import re
+import struct
+import sys
+
+# must match page_templates.py, which can not be imported off the badge
+_HEADER_FORMAT = "<4sBBxx"
+_HEADER_MAGIC = b"TPL1"
+HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+_PART_FORMAT = "<BxHI"
+PART_SIZE = struct.calcsize(_PART_FORMAT)
+STATIC_PART = 0xFF
+
+SLOT_PATTERN = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+
+def compile_template(source):
+    """
+    Return the compiled form of the template text source.
+    """
+    pieces = []
+    slots = []
+    position = 0
+    for match in SLOT_PATTERN.finditer(source):
+        if match.start() > position:
+            pieces.append(source[position:match.start()].encode("utf-8"))
+        name = match.group(1)
+        if name not in slots:
+            slots.append(name)
+        pieces.append(slots.index(name))
+        position = match.end()
+    if position < len(source):
+        pieces.append(source[position:].encode("utf-8"))
+
+    if len(pieces) > 255 or len(slots) > 255:
+        raise ValueError("too many parts or slots")
+    slot_table = b"".join(bytes((len(name),)) + name.encode("utf-8") for name in slots)
+    offset = HEADER_SIZE + len(pieces) * PART_SIZE + len(slot_table)
+    part_table = bytearray()
+    static_text = bytearray()
+    for piece in pieces:
+        if isinstance(piece, int):
+            part_table += struct.pack(_PART_FORMAT, piece, 0, 0)
+        else:
+            if len(piece) > 0xFFFF:
+                raise ValueError("static text between slots is longer than 64k")
+            part_table += struct.pack(_PART_FORMAT, STATIC_PART, len(piece), offset + len(static_text))
+            static_text += piece
+    header = struct.pack(_HEADER_FORMAT, _HEADER_MAGIC, len(pieces), len(slots))
+    return header + part_table + slot_table + static_text
+
+
+def main(paths):
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as source_file:
+            compiled = compile_template(source_file.read())
+        output_path = path.rsplit(".", 1)[0] + ".tpl"
+        with open(output_path, "wb") as output_file:
+            output_file.write(compiled)
+        print(f"{path} -> {output_path} ({len(compiled)} bytes)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,280 @@
+"""
+Packed 1-bit framebuffers.
+
+Pixels are stored 8 to a byte, most significant bit first, 1 for white, with
+rows padded to a multiple of 4 bytes. That is the layout of a 1-bit BMP row,
+so rows can be copied to and from BMP files as they are. Drawing works on
+whole bytes and only touches single bits at the edges of a span. Bytes are
+used as the word size because on CircuitPython integers wider than 30 bits
+are allocated on the heap.
+
+Every write marks the rows it touched as dirty, so consumers like the refresh
+scheduler and screenshots can tell what changed without comparing pixels.
+"""
+import struct
+
+WHITE = 1
+BLACK = 0
+
+# masks for the pixels from a bit offset to the end of a byte
+_LEFT_MASKS = bytes(0xFF >> bit for bit in range(8))
+
+BMP_HEADER_SIZE = 62
+
+
+def luminance_is_white(color, threshold=128):
+    return ((color >> 16) * 299 + ((color >> 8) & 0xFF) * 587 + (color & 0xFF) * 114) >= threshold * 1000
+
+
+class FrameBuffer:
+    """
+    A width x height 1-bit image.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.stride = ((width + 31) // 32) * 4
+        self.buffer = bytearray(self.stride * height)
+        self.view = memoryview(self.buffer)
+        self.dirty = bytearray(height)
+        self._white_row = b"\xff" * self.stride
+        self._black_row = bytes(self.stride)
+
+    def row(self, y):
+        start = y * self.stride
+        return self.view[start:start + self.stride]
+
+    def mark_dirty(self, top, bottom):
+        """
+        Mark rows top up to but not including bottom as changed.
+        """
+        dirty = self.dirty
+        for y in range(max(top, 0), min(bottom, self.height)):
+            dirty[y] = 1
+
+    def clear_dirty(self):
+        dirty = self.dirty
+        for y in range(self.height):
+            dirty[y] = 0
+
+    def dirty_range(self):
+        """
+        Returns (top, bottom) of the dirty rows, or None when none are dirty.
+        """
+        top = None
+        bottom = 0
+        for y in range(self.height):
+            if self.dirty[y]:
+                if top is None:
+                    top = y
+                bottom = y + 1
+        return None if top is None else (top, bottom)
+
+    def fill(self, color):
+        pattern = self._white_row if color else self._black_row
+        view = self.view
+        stride = self.stride
+        for y in range(self.height):
+            view[y * stride:(y + 1) * stride] = pattern
+        self.mark_dirty(0, self.height)
+
+    def get_pixel(self, x, y):
+        return (self.buffer[y * self.stride + (x >> 3)] >> (7 - (x & 7))) & 1
+
+    def set_pixel(self, x, y, color):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return
+        index = y * self.stride + (x >> 3)
+        bit = 0x80 >> (x & 7)
+        if color:
+            self.buffer[index] |= bit
+        else:
+            self.buffer[index] &= ~bit & 0xFF
+        self.dirty[y] = 1
+
+    def fill_span(self, y, start, end, color):
+        """
+        Set pixels start up to but not including end of row y to color.
+        """
+        if not 0 <= y < self.height:
+            return
+        start = max(start, 0)
+        end = min(end, self.width)
+        if start >= end:
+            return
+        buffer = self.buffer
+        base = y * self.stride
+        first = start >> 3
+        last = (end - 1) >> 3
+        left = _LEFT_MASKS[start & 7]
+        right = (0xFF00 >> (((end - 1) & 7) + 1)) & 0xFF
+        if first == last:
+            mask = left & right
+            if color:
+                buffer[base + first] |= mask
+            else:
+                buffer[base + first] &= ~mask & 0xFF
+        else:
+            if color:
+                buffer[base + first] |= left
+                buffer[base + last] |= right
+            else:
+                buffer[base + first] &= ~left & 0xFF
+                buffer[base + last] &= ~right & 0xFF
+            if last - first > 1:
+                pattern = self._white_row if color else self._black_row
+                self.view[base + first + 1:base + last] = memoryview(pattern)[:last - first - 1]
+        self.dirty[y] = 1
+
+    def fill_rect(self, x, y, width, height, color):
+        for row in range(max(y, 0), min(y + height, self.height)):
+            self.fill_span(row, x, x + width, color)
+
+    def blit(self, source, x, y, mask=None):
+        """
+        Copy source, another FrameBuffer, with its top left corner at x, y.
+        Only pixels set in mask, a FrameBuffer the size of source, are copied
+        when it is given.
+        """
+        if x < 0 or x + source.width > self.width:
+            # clipped on the left or right, rare enough to go pixel by pixel
+            self._blit_pixels(source, x, y, mask)
+            return
+        shift = x & 7
+        first = x >> 3
+        source_bytes = (source.width + 7) >> 3
+        # the last source byte may hold padding bits
+        last_mask = (0xFF00 >> (((source.width - 1) & 7) + 1)) & 0xFF
+        buffer = self.buffer
+        source_buffer = source.buffer
+        mask_buffer = mask.buffer if mask is not None else None
+        top = max(y, 0)
+        bottom = min(y + source.height, self.height)
+        for row in range(top, bottom):
+            source_base = (row - y) * source.stride
+            base = row * self.stride + first
+            for i in range(source_bytes):
+                value = source_buffer[source_base + i]
+                bits = 0xFF if mask_buffer is None else mask_buffer[source_base + i]
+                if i == source_bytes - 1:
+                    bits &= last_mask
+                if not bits:
+                    continue
+                high_bits = bits >> shift
+                buffer[base + i] = (buffer[base + i] & ~high_bits & 0xFF) | ((value >> shift) & high_bits)
+                if shift:
+                    low_bits = (bits << (8 - shift)) & 0xFF
+                    if low_bits:
+                        buffer[base + i + 1] = (buffer[base + i + 1] & ~low_bits & 0xFF) | \
+                            ((value << (8 - shift)) & low_bits)
+        self.mark_dirty(top, bottom)
+
+    def _blit_pixels(self, source, x, y, mask):
+        for sy in range(source.height):
+            for sx in range(source.width):
+                if mask is None or mask.get_pixel(sx, sy):
+                    self.set_pixel(x + sx, y + sy, source.get_pixel(sx, sy))
+
+    def bmp_header(self):
+        """
+        Header and black and white palette of a bottom up 1-bit BMP of this
+        image, the rows follow in the order from the last to the first.
+        """
+        image_size = self.stride * self.height
+        return struct.pack("<2sIHHI", b"BM", BMP_HEADER_SIZE + image_size, 0, 0, BMP_HEADER_SIZE) + \
+            struct.pack("<IiiHHIIiiII", 40, self.width, self.height, 1, 1, 0, image_size, 2835, 2835, 2, 2) + \
+            b"\x00\x00\x00\x00\xff\xff\xff\x00"
+
+    def save_bmp(self, path):
+        with open(path, "wb") as bmp_file:
+            bmp_file.write(self.bmp_header())
+            for y in range(self.height - 1, -1, -1):
+                bmp_file.write(self.row(y))
+
+    def copy_from(self, other):
+        self.buffer[:] = other.buffer
+        self.mark_dirty(0, self.height)
+
+    def diff(self, other, rows=None):
+        """
+        XOR compare with other, a FrameBuffer of the same size. Rows that
+        differ are flagged in rows, a bytearray of height, when given.
+        Returns the changed area as (x, y, width, height), or None when the
+        two are the same.
+        """
+        buffer = self.buffer
+        other_buffer = other.buffer
+        stride = self.stride
+        left = stride
+        right = -1
+        top = None
+        bottom = 0
+        for y in range(self.height):
+            base = y * stride
+            changed = False
+            for i in range(stride):
+                if buffer[base + i] ^ other_buffer[base + i]:
+                    changed = True
+                    left = min(left, i)
+                    right = max(right, i)
+            if rows is not None:
+                rows[y] = 1 if changed else 0
+            if changed:
+                if top is None:
+                    top = y
+                bottom = y + 1
+        if top is None:
+            return None
+        x = left * 8
+        return x, top, min((right + 1) * 8, self.width) - x, bottom - top
+
+
+def load_bmp(path, colors=None, transparent=None, threshold=128):
+    """
+    Load an uncompressed 1, 4, 8 or 24 bit BMP into a FrameBuffer. colors
+    overrides the palette from the file, for example with the colours of an
+    OnDiskBitmap's pixel_shader, and palette indexes in transparent are left
+    out of the mask. Returns (image, mask), mask is None when nothing is
+    transparent.
+    """
+    with open(path, "rb") as bmp_file:
+        header = bmp_file.read(54)
+        data_offset = struct.unpack_from("<I", header, 10)[0]
+        header_size, width, height = struct.unpack_from("<Iii", header, 14)
+        bits = struct.unpack_from("<H", header, 28)[0]
+        bottom_up = height > 0
+        height = abs(height)
+        if colors is None and bits <= 8:
+            bmp_file.seek(14 + header_size)
+            palette = bmp_file.read(4 << bits)
+            colors = [(palette[i + 2] << 16) | (palette[i + 1] << 8) | palette[i] for i in range(0, len(palette), 4)]
+        shades = [1 if luminance_is_white(color, threshold) else 0 for color in colors] if colors else None
+
+        image = FrameBuffer(width, height)
+        mask = FrameBuffer(width, height) if transparent else None
+        if mask is not None:
+            mask.fill(WHITE)
+        stride = ((width * bits + 31) // 32) * 4
+        row = bytearray(stride)
+        for y in range(height):
+            bmp_file.seek(data_offset + (height - 1 - y if bottom_up else y) * stride)
+            bmp_file.readinto(row)
+            if bits == 1 and shades == [0, 1] and not transparent:
+                # already in our layout
+                image.view[y * image.stride:y * image.stride + stride] = row
+                continue
+            for x in range(width):
+                if bits == 24:
+                    base = x * 3
+                    color = (row[base + 2] << 16) | (row[base + 1] << 8) | row[base]
+                    shade = 1 if luminance_is_white(color, threshold) else 0
+                else:
+                    bit = x * bits
+                    index = (row[bit >> 3] >> (8 - bits - (bit & 7))) & ((1 << bits) - 1)
+                    shade = shades[index]
+                    if transparent and index in transparent:
+                        mask.set_pixel(x, y, BLACK)
+                image.set_pixel(x, y, shade)
+    image.clear_dirty()
+    return image, mask
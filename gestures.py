@@ -0,0 +1,201 @@
+"""
+Gesture recogniser built on top of keypad.Keys events.
+
+Turns raw press and release events into taps, double taps, long presses and
+chords. Recognised gestures are put into a bounded GestureQueue that works like
+the keypad EventQueue, and can be dispatched with StateMachine.dispatch_gesture().
+"""
+from array import array
+
+from adafruit_ticks import ticks_diff
+
+from state_machine import EDGE_RELEASED, KEY_COUNT
+
+# Gesture kinds. They use the edge slots after the raw keypad edges so they can
+# be bound on a StateMachine just like EDGE_PRESSED and EDGE_RELEASED.
+GESTURE_TAP = EDGE_RELEASED + 1
+GESTURE_DOUBLE_TAP = EDGE_RELEASED + 2
+GESTURE_LONG_PRESS = EDGE_RELEASED + 3
+GESTURE_CHORD = EDGE_RELEASED + 4
+
+
+class Gesture:
+    """
+    A recognised gesture. kind is one of the GESTURE_ constants, key_number is
+    the button, for chords the highest numbered button involved. mask holds the
+    bits of every button that is part of the gesture.
+    """
+
+    def __init__(self, kind=0, key_number=0, mask=0):
+        self.kind = kind
+        self.key_number = key_number
+        self.mask = mask
+
+    def __repr__(self):
+        return f"<Gesture: kind {self.kind} key_number {self.key_number} mask {self.mask}>"
+
+
+class GestureQueue:
+    """
+    Fixed size ring buffer of packed gestures. When full, new gestures are
+    dropped and overflowed is set, same as keypad.EventQueue.
+    """
+
+    def __init__(self, max_events=16):
+        self._buffer = array("H", [0] * max_events)
+        self._head = 0
+        self._count = 0
+        self.overflowed = False
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+        self.overflowed = False
+
+    def put(self, kind, key_number, mask):
+        if self._count == len(self._buffer):
+            self.overflowed = True
+            return False
+        tail = (self._head + self._count) % len(self._buffer)
+        self._buffer[tail] = (kind << 8) | (key_number << 5) | mask
+        self._count += 1
+        return True
+
+    def get_into(self, gesture):
+        """
+        Fill gesture with the oldest queued gesture. Returns False if the queue
+        was empty.
+        """
+        if self._count == 0:
+            return False
+        packed = self._buffer[self._head]
+        self._head = (self._head + 1) % len(self._buffer)
+        self._count -= 1
+        gesture.kind = packed >> 8
+        gesture.key_number = (packed >> 5) & 0x07
+        gesture.mask = packed & 0x1F
+        return True
+
+    def get(self):
+        """
+        Return the oldest queued gesture, or None if the queue is empty.
+        """
+        gesture = Gesture()
+        if self.get_into(gesture):
+            return gesture
+        return None
+
+
+class GestureRecognizer:
+    """
+    Feed it keypad events and call update() every loop iteration so long
+    presses and single taps waiting on a possible double tap are emitted on
+    time.
+
+    Only keys in long_press_mask report long presses, and only keys in
+    double_tap_mask wait double_tap_ms before reporting a tap, so other keys
+    tap with no added latency. Pressing a key while others are held forms a
+    chord, however long they have been held, unless one of them already
+    reported a long press. Keys in chord_mask, the ones chords start with,
+    report their long press on release instead, so holding one before pressing
+    the rest of the chord is not taken for a long press. Keys that took part in
+    a chord or a long press do not also report a tap when they are released.
+    """
+
+    def __init__(self, long_press_mask=0, double_tap_mask=0, chord_mask=0, long_press_ms=800,
+                 double_tap_ms=300, min_tap_ms=20, max_events=16):
+        self.long_press_mask = long_press_mask
+        self.double_tap_mask = double_tap_mask
+        self.chord_mask = chord_mask
+        self.long_press_ms = long_press_ms
+        self.double_tap_ms = double_tap_ms
+        self.min_tap_ms = min_tap_ms
+
+        self.events = GestureQueue(max_events)
+
+        self.pressed_mask = 0
+        self._consumed_mask = 0
+        self._pending_tap_mask = 0
+        self._press_time = array("L", [0] * KEY_COUNT)
+        self._tap_time = array("L", [0] * KEY_COUNT)
+
+    def reset(self):
+        """
+        Forget all held keys and pending taps, for example after a state change.
+        """
+        self._consumed_mask = self.pressed_mask
+        self._pending_tap_mask = 0
+        self.events.clear()
+
+    def feed(self, event):
+        """
+        Process one keypad event.
+        """
+        key_number = event.key_number
+        key_bit = 1 << key_number
+        now = event.timestamp
+
+        if event.pressed:
+            held_mask = self.pressed_mask
+            self.pressed_mask |= key_bit
+            self._press_time[key_number] = now
+            if held_mask and not held_mask & self._consumed_mask:
+                self._consumed_mask |= self.pressed_mask
+                self.events.put(GESTURE_CHORD, _highest_key(self.pressed_mask), self.pressed_mask)
+            return
+
+        self.pressed_mask &= ~key_bit
+        if self._consumed_mask & key_bit:
+            self._consumed_mask &= ~key_bit
+            return
+        held_ms = ticks_diff(now, self._press_time[key_number])
+        if held_ms < self.min_tap_ms:
+            return
+        if self.long_press_mask & self.chord_mask & key_bit and held_ms >= self.long_press_ms:
+            self.events.put(GESTURE_LONG_PRESS, key_number, key_bit)
+            return
+
+        if not self.double_tap_mask & key_bit:
+            self.events.put(GESTURE_TAP, key_number, key_bit)
+        elif self._pending_tap_mask & key_bit and \
+                ticks_diff(now, self._tap_time[key_number]) <= self.double_tap_ms:
+            self._pending_tap_mask &= ~key_bit
+            self.events.put(GESTURE_DOUBLE_TAP, key_number, key_bit)
+        else:
+            self._pending_tap_mask |= key_bit
+            self._tap_time[key_number] = now
+
+    def update(self, now):
+        """
+        Emit time based gestures. now is the current ticks_ms(), the same
+        clock keypad event timestamps use.
+        """
+        waiting = (self.pressed_mask & self.long_press_mask & ~self.chord_mask & ~self._consumed_mask) | \
+            self._pending_tap_mask
+        if not waiting:
+            return
+        for key_number in range(KEY_COUNT):
+            key_bit = 1 << key_number
+            if not waiting & key_bit:
+                continue
+            if self._pending_tap_mask & key_bit:
+                if ticks_diff(now, self._tap_time[key_number]) > self.double_tap_ms:
+                    self._pending_tap_mask &= ~key_bit
+                    self.events.put(GESTURE_TAP, key_number, key_bit)
+            elif ticks_diff(now, self._press_time[key_number]) >= self.long_press_ms:
+                self._consumed_mask |= key_bit
+                self.events.put(GESTURE_LONG_PRESS, key_number, key_bit)
+
+
+def _highest_key(mask):
+    key_number = 0
+    while mask > 1:
+        mask >>= 1
+        key_number += 1
+    return key_number
@@ -0,0 +1,137 @@
+"""
+Inactivity tracking and power saving for a badge worn all day.
+
+The main loop reports input with activity() and calls wait() once per pass.
+After idle_after seconds without input the manager goes idle, on_idle can
+turn the NeoPixels off, and wait() sleeps idle_interval per pass instead of
+letting the loop spin, so the web server and buttons are polled less often.
+Input makes it active again straight away. Variants without a network can go
+further with light_sleep() or deep_sleep(), which stop the CPU until one of
+the buttons is pressed.
+
+The time spent working and waiting gives the duty cycle, and with the
+currents below a rough estimate of the average power.
+"""
+import time
+
+import alarm
+
+# rough currents of the board in mA, measure your own for better estimates
+BUSY_MA = 45
+WAIT_MA = 25
+SLEEP_MA = 2
+
+
+def _pin_alarms(pins, value):
+    return [alarm.pin.PinAlarm(pin, value=value, pull=True) for pin in pins]
+
+
+class IdleManager:
+    """
+    Times are in seconds. sleep_after is when should_sleep() starts to
+    return True, None for never.
+    """
+
+    def __init__(self, idle_after=60, sleep_after=None, active_interval=0.0, idle_interval=0.1,
+                 on_idle=None, on_active=None, voltage=3.7):
+        self.idle_after = idle_after
+        self.sleep_after = sleep_after
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.on_idle = on_idle
+        self.on_active = on_active
+        self.voltage = voltage
+        self.idle = False
+        now = time.monotonic_ns()
+        self._last_activity = now
+        self._pass_start = now
+        self.busy_ns = 0
+        self.wait_ns = 0
+        self.sleep_ns = 0
+        self.sleeps = 0
+
+    def activity(self):
+        """
+        Call on any input, button events or web requests.
+        """
+        self._last_activity = time.monotonic_ns()
+        if self.idle:
+            self.idle = False
+            if self.on_active is not None:
+                self.on_active()
+
+    @property
+    def inactive_seconds(self):
+        return (time.monotonic_ns() - self._last_activity) / 1e9
+
+    def should_sleep(self):
+        return self.sleep_after is not None and self.inactive_seconds >= self.sleep_after
+
+    def wait(self):
+        """
+        Call once at the end of every main loop pass. Goes idle when it is
+        time to and sleeps what is left of the pass interval.
+        """
+        now = time.monotonic_ns()
+        self.busy_ns += now - self._pass_start
+        if not self.idle and (now - self._last_activity) >= self.idle_after * 1_000_000_000:
+            self.idle = True
+            if self.on_idle is not None:
+                self.on_idle()
+        interval = self.idle_interval if self.idle else self.active_interval
+        remaining = interval - (time.monotonic_ns() - self._pass_start) / 1e9
+        if remaining > 0:
+            time.sleep(remaining)
+        end = time.monotonic_ns()
+        self.wait_ns += end - now
+        self._pass_start = end
+
+    def light_sleep(self, pins, value=True):
+        """
+        Stop until one of pins reads value, then carry on where it left off.
+        The pins must not be in use, deinit() a keypad.Keys on them first.
+        Returns the alarm that woke the board.
+        """
+        start = time.monotonic_ns()
+        self.sleeps += 1
+        woken_by = alarm.light_sleep_until_alarms(*_pin_alarms(pins, value))
+        end = time.monotonic_ns()
+        self.sleep_ns += end - start
+        self._pass_start = end
+        self.activity()
+        return woken_by
+
+    def deep_sleep(self, pins, value=True):
+        """
+        Power down until one of pins reads value, code.py then starts over.
+        Does not return.
+        """
+        alarm.exit_and_deep_sleep_until_alarms(*_pin_alarms(pins, value))
+
+    @property
+    def duty_cycle(self):
+        """
+        Fraction of the time the CPU was working.
+        """
+        total = self.busy_ns + self.wait_ns + self.sleep_ns
+        return self.busy_ns / total if total else 1.0
+
+    @property
+    def average_ma(self):
+        total = self.busy_ns + self.wait_ns + self.sleep_ns
+        if not total:
+            return BUSY_MA
+        return (self.busy_ns * BUSY_MA + self.wait_ns * WAIT_MA + self.sleep_ns * SLEEP_MA) / total
+
+    def stats(self):
+        return {
+            "idle": self.idle,
+            "inactive_s": round(self.inactive_seconds, 1),
+            "duty_cycle": round(self.duty_cycle, 3),
+            "busy_s": round(self.busy_ns / 1e9, 1),
+            "wait_s": round(self.wait_ns / 1e9, 1),
+            "sleep_s": round(self.sleep_ns / 1e9, 1),
+            "sleeps": self.sleeps,
+            "average_ma": round(self.average_ma, 1),
+            "average_mw": round(self.average_ma * self.voltage, 1),
+        }
@@ -0,0 +1,108 @@
+"""
+Keyframe tables for LED effects that react to game events.
+
+Each effect is a bytes object of 6 byte keyframes:
+
+    duration, mask, flags, r, g, b
+
+duration is in 10 ms units, 0 holds the keyframe until another effect is
+played. mask has one bit per pixel, bit 0 is the first pixel. Keyframes with
+FLAG_FADE blend from the previous keyframe colour over their duration, and
+FLAG_EFFECT_COLOR keyframes use the colour passed to LedEngine.play_effect()
+instead of their own r, g, b.
+
+The tables are plain bytes built once at import, LedEngine.play_effect() walks
+them without creating any objects per frame.
+"""
+
+KEYFRAME_SIZE = 6
+
+FLAG_FADE = 0x01
+FLAG_EFFECT_COLOR = 0x02
+
+# chase directions for play_effect()
+CHASE_FORWARD = 0
+CHASE_REVERSE = 1
+
+# piece colours
+X_COLOR = 0xFF0000
+O_COLOR = 0x0000FF
+DRAW_COLOR = 0xFFFFFF
+
+ALL_PIXELS = 0xFF
+
+
+def keyframes(*frames):
+    """
+    Pack (duration_ms, mask, flags, color) tuples into an effect table.
+    """
+    table = bytearray(len(frames) * KEYFRAME_SIZE)
+    for i, (duration_ms, mask, flags, color) in enumerate(frames):
+        base = i * KEYFRAME_SIZE
+        # any non zero duration lasts at least one unit, 0 means hold
+        table[base] = min(max(duration_ms // 10, 1), 255) if duration_ms else 0
+        table[base + 1] = mask
+        table[base + 2] = flags
+        table[base + 3] = (color >> 16) & 0xFF
+        table[base + 4] = (color >> 8) & 0xFF
+        table[base + 5] = color & 0xFF
+    return bytes(table)
+
+
+# whose turn it is, fade in and hold
+TURN = keyframes(
+    (200, ALL_PIXELS, FLAG_FADE | FLAG_EFFECT_COLOR, 0),
+    (0, ALL_PIXELS, FLAG_EFFECT_COLOR, 0),
+)
+
+_BLINK_AND_HOLD = [
+    (150, 0, 0, 0),
+    (150, ALL_PIXELS, FLAG_EFFECT_COLOR, 0),
+    (150, 0, 0, 0),
+    (150, ALL_PIXELS, FLAG_EFFECT_COLOR, 0),
+    (0, ALL_PIXELS, FLAG_EFFECT_COLOR, 0),
+]
+
+# fill from the first pixel to the last, blink twice and hold
+WIN_CHASE = keyframes(*([(40, (1 << (i + 1)) - 1, FLAG_EFFECT_COLOR, 0) for i in range(8)] + _BLINK_AND_HOLD))
+
+# fill outwards from the middle, for lines that run along the strip's
+# short axis
+WIN_OUTWARD = keyframes(*([(60, mask, FLAG_EFFECT_COLOR, 0) for mask in (0x18, 0x3C, 0x7E, 0xFF)]
+                           + _BLINK_AND_HOLD))
+
+# three slow breaths, then stay dark
+DRAW_PULSE = keyframes(
+    (10, ALL_PIXELS, 0, 0),
+    (500, ALL_PIXELS, FLAG_FADE | FLAG_EFFECT_COLOR, 0),
+    (500, ALL_PIXELS, FLAG_FADE, 0),
+    (500, ALL_PIXELS, FLAG_FADE | FLAG_EFFECT_COLOR, 0),
+    (500, ALL_PIXELS, FLAG_FADE, 0),
+    (500, ALL_PIXELS, FLAG_FADE | FLAG_EFFECT_COLOR, 0),
+    (500, ALL_PIXELS, FLAG_FADE, 0),
+    (0, 0, 0, 0),
+)
+
+
+def piece_color(piece):
+    return X_COLOR if piece == "X" else O_COLOR
+
+
+def win_effect(line_points):
+    """
+    Pick the win effect and chase direction for a winning line, given as the
+    polygon points from winner_line_map. The strip runs left to right, so
+    rows chase left to right, diagonals chase away from their top end and
+    columns fill outwards from the middle.
+    Returns (table, direction).
+    """
+    start_x, start_y = line_points[0]
+    end_x, end_y = line_points[2]
+    dx = end_x - start_x
+    dy = end_y - start_y
+    if abs(dx) < abs(dy) // 2:
+        return WIN_OUTWARD, CHASE_FORWARD
+    if dx * dy < 0:
+        # top end is on the right
+        return WIN_CHASE, CHASE_REVERSE
+    return WIN_CHASE, CHASE_FORWARD
@@ -0,0 +1,403 @@
+"""
+Frame budgeted NeoPixel animation engine.
+
+A lighter stand in for adafruit_led_animation's AnimationSequence. Colours come
+from a colour wheel precomputed into a bytearray, brightness is applied with a
+byte lookup table instead of floating point math, and frames are rendered
+into a bytearray of the engine's own and copied to the strip once per frame. Animations are driven from elapsed time, so
+a late frame is skipped instead of every missed frame being rendered to catch
+up. Keyframe effects from led_effects play through the same frame scheduler.
+"""
+import random
+
+from adafruit_ticks import ticks_ms, ticks_add, ticks_diff
+
+from led_effects import KEYFRAME_SIZE, FLAG_FADE, FLAG_EFFECT_COLOR, CHASE_REVERSE
+
+# animation types
+ANIM_COMET = 0
+ANIM_RAINBOW = 1
+ANIM_SPARKLE = 2
+ANIM_CHASE = 3
+ANIM_SOLID = 4
+
+# default sequence, (animation, milliseconds per step), matching the
+# AnimationSequence this replaces
+DEFAULT_SEQUENCE = (
+    (ANIM_COMET, 100),
+    (ANIM_RAINBOW, 8),
+    (ANIM_SPARKLE, 100),
+    (ANIM_CHASE, 100),
+)
+
+
+def make_wheel():
+    """
+    Precompute the 256 colours of the colour wheel as packed r, g, b bytes.
+    """
+    wheel = bytearray(256 * 3)
+    for pos in range(256):
+        if pos < 85:
+            r, g, b = 255 - pos * 3, pos * 3, 0
+        elif pos < 170:
+            r, g, b = 0, 255 - (pos - 85) * 3, (pos - 85) * 3
+        else:
+            r, g, b = (pos - 170) * 3, 0, 255 - (pos - 170) * 3
+        wheel[pos * 3] = r
+        wheel[pos * 3 + 1] = g
+        wheel[pos * 3 + 2] = b
+    return wheel
+
+
+WHEEL = make_wheel()
+
+
+class LedEngine:
+    """
+    Plays a sequence of animations on a NeoPixel strip.
+
+    The pixels object is switched to brightness 1.0 and auto_write False, the
+    engine scales colours itself and calls show() once per rendered frame.
+    Scaling uses a 256 entry lookup table, either built from the brightness
+    float or a shared lut such as Brightness.lut, call redraw() after changing
+    a shared lut.
+    frame_ms is the target time between frames. If rendering a frame takes
+    longer than budget_ms the following frames are spaced out further, so the
+    LEDs never hold up button handling in the main loop.
+    """
+
+    def __init__(self, pixels, sequence=DEFAULT_SEQUENCE, advance_interval=45, brightness=0.2,
+                 lut=None, frame_ms=20, budget_ms=4, tail_length=11, num_sparkles=5, chase_size=5,
+                 chase_spacing=3):
+        self.pixels = pixels
+        pixels.brightness = 1.0
+        pixels.auto_write = False
+        self.count = len(pixels)
+        # r, g, b of every pixel at the current brightness, PixelBuf has no
+        # buffer of its own to write into
+        self.buf = bytearray(self.count * 3)
+
+        self.sequence = list(sequence)
+        self.advance_interval = advance_interval
+        self.frame_ms = frame_ms
+        self.budget_ms = budget_ms
+        self.tail_length = tail_length
+        self.num_sparkles = num_sparkles
+        self.chase_size = chase_size
+        self.chase_spacing = chase_spacing
+
+        # comet tail levels, 255 at the head fading towards the end of the tail
+        self._tail = bytearray(tail_length)
+        for i in range(tail_length):
+            self._tail[i] = 255 * (tail_length - i) // tail_length
+
+        self.color = 0xFFFFFF
+        self.index = 0
+        self.frozen = False
+        self.frames_rendered = 0
+        self.frames_skipped = 0
+        self._elapsed = 0
+        self._last_step = -1
+        self._started = ticks_ms()
+        self._last_tick = self._started
+        self._next_frame = self._started
+
+        # next()/previous() and the advance_interval call on_advance with the
+        # direction when it is set, see led_scenes.ScenePlayer
+        self.on_advance = None
+
+        # with a scene colour the animations use it in place of the colour wheel
+        self._wheel = WHEEL
+        self._solid_wheel = None
+        self._scene_color = None
+
+        # keyframe effect being played, see play_effect()
+        self.effect = None
+        self._effect_color = 0
+        self._effect_reverse = False
+        self._keyframe = 0
+        self._keyframe_start = 0
+        self._keyframe_color = 0
+        self._previous_color = 0
+
+        # brightness lookup, scaled[v] is v at the current brightness
+        if lut is None:
+            self.scaled = bytearray(256)
+            self.brightness = brightness
+        else:
+            self.scaled = lut
+            self._brightness = None
+
+    @property
+    def brightness(self):
+        return self._brightness
+
+    @brightness.setter
+    def brightness(self, value):
+        self._brightness = min(max(value, 0.0), 1.0)
+        level = int(self._brightness * 256)
+        for v in range(256):
+            self.scaled[v] = (v * level) >> 8
+        self.redraw()
+
+    def redraw(self):
+        """
+        Show the current frame again with the brightness lookup table.
+        """
+        # render again even if the animation step did not change
+        self._last_step = -1
+        if self.frozen and self.effect is None:
+            self.fill(self.color)
+
+    @property
+    def animation(self):
+        return self.sequence[self.index][0]
+
+    @property
+    def scene_color(self):
+        return self._scene_color
+
+    @scene_color.setter
+    def scene_color(self, color):
+        self._scene_color = color
+        if color is None:
+            self._wheel = WHEEL
+        else:
+            if self._solid_wheel is None:
+                self._solid_wheel = bytearray(256 * 3)
+            for pos in range(0, 256 * 3, 3):
+                self._solid_wheel[pos] = (color >> 16) & 0xFF
+                self._solid_wheel[pos + 1] = (color >> 8) & 0xFF
+                self._solid_wheel[pos + 2] = color & 0xFF
+            self._wheel = self._solid_wheel
+        self._last_step = -1
+
+    def _start(self, index):
+        self.index = index % len(self.sequence)
+        self._elapsed = 0
+        self._last_step = -1
+        self._started = self._last_tick = self._next_frame = ticks_ms()
+
+    def _advance(self, direction):
+        if self.on_advance is not None and self.on_advance(direction):
+            self._start(0)
+        else:
+            self._start(self.index + direction)
+
+    def next(self):
+        self._advance(1)
+
+    def previous(self):
+        self._advance(-1)
+
+    def freeze(self):
+        self.frozen = True
+
+    def resume(self):
+        self.frozen = False
+        self._last_step = -1
+        self._last_tick = self._next_frame = ticks_ms()
+
+    def play_effect(self, table, color=0, direction=0):
+        """
+        Play a keyframe table from led_effects on top of the animations or the
+        filled colour. color is used by the FLAG_EFFECT_COLOR keyframes,
+        direction CHASE_REVERSE mirrors the pixel masks. When the table runs
+        out the strip goes back to what it showed before.
+        """
+        self.effect = table
+        self._effect_color = color
+        self._effect_reverse = direction == CHASE_REVERSE
+        self._keyframe = 0
+        self._keyframe_start = self._next_frame = ticks_ms()
+        self._keyframe_color = self._keyframe_color_at(0)
+        self._previous_color = 0
+        self._last_step = -1
+
+    def stop_effect(self):
+        self.effect = None
+        self._last_step = -1
+        if self.frozen:
+            self.fill(self.color)
+
+    def _keyframe_color_at(self, keyframe):
+        base = keyframe * KEYFRAME_SIZE
+        table = self.effect
+        if table[base + 2] & FLAG_EFFECT_COLOR:
+            return self._effect_color
+        return (table[base + 3] << 16) | (table[base + 4] << 8) | table[base + 5]
+
+    def _effect_step(self, now):
+        """
+        Move on to the keyframe that is current at now. Returns a number that
+        changes whenever the pixels would change, or None once the effect ended.
+        """
+        table = self.effect
+        while True:
+            duration = table[self._keyframe * KEYFRAME_SIZE] * 10
+            if duration == 0 or ticks_diff(now, self._keyframe_start) < duration:
+                break
+            self._previous_color = self._keyframe_color
+            self._keyframe += 1
+            self._keyframe_start = ticks_add(self._keyframe_start, duration)
+            if self._keyframe * KEYFRAME_SIZE >= len(table):
+                self.stop_effect()
+                return None
+            self._keyframe_color = self._keyframe_color_at(self._keyframe)
+
+        if duration and table[self._keyframe * KEYFRAME_SIZE + 2] & FLAG_FADE:
+            level = ticks_diff(now, self._keyframe_start) * 256 // duration
+        else:
+            level = 256
+        return (self._keyframe << 9) | level
+
+    def _render_effect(self, step):
+        level = step & 0x1FF
+        mask = self.effect[self._keyframe * KEYFRAME_SIZE + 1]
+        color = self._keyframe_color
+        r, g, b = (color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF
+        if level < 256:
+            previous = self._previous_color
+            inverse = 256 - level
+            r = (r * level + ((previous >> 16) & 0xFF) * inverse) >> 8
+            g = (g * level + ((previous >> 8) & 0xFF) * inverse) >> 8
+            b = (b * level + (previous & 0xFF) * inverse) >> 8
+        count = self.count
+        for i in range(count):
+            bit = count - 1 - i if self._effect_reverse else i
+            if mask >> bit & 1:
+                self.set_pixel(i, r, g, b)
+            else:
+                self.set_pixel(i, 0, 0, 0)
+
+    def set_pixel(self, i, r, g, b):
+        """
+        Write one pixel into the buffer through the brightness table. Nothing is
+        shown until show() is called.
+        """
+        base = i * 3
+        scaled = self.scaled
+        self.buf[base] = scaled[r]
+        self.buf[base + 1] = scaled[g]
+        self.buf[base + 2] = scaled[b]
+
+    def show(self):
+        buf = self.buf
+        pixels = self.pixels
+        for i in range(self.count):
+            base = i * 3
+            pixels[i] = (buf[base], buf[base + 1], buf[base + 2])
+        pixels.show()
+
+    def fill(self, color):
+        """
+        Freeze the animations and show one colour, an int 0xRRGGBB or an
+        (r, g, b) tuple.
+        """
+        if isinstance(color, int):
+            r, g, b = (color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF
+        else:
+            r, g, b = color
+        self.color = (r << 16) | (g << 8) | b
+        self.frozen = True
+        for i in range(self.count):
+            self.set_pixel(i, r, g, b)
+        self.show()
+
+    def animate(self):
+        """
+        Drop in for AnimationSequence.animate(), call it every loop iteration.
+        """
+        return self.tick(ticks_ms())
+
+    def tick(self, now):
+        """
+        Render a frame if one is due at now, a ticks_ms() value. Returns True
+        if a frame was shown.
+        """
+        if self.frozen and self.effect is None:
+            return False
+        late = ticks_diff(now, self._next_frame)
+        if late < 0:
+            return False
+        if late >= self.frame_ms:
+            self.frames_skipped += late // self.frame_ms
+
+        if self.effect is not None:
+            self._last_tick = now
+            step = self._effect_step(now)
+            if step is None:
+                return True
+        else:
+            self._elapsed += ticks_diff(now, self._last_tick)
+            self._last_tick = now
+            if self.advance_interval and ticks_diff(now, self._started) >= self.advance_interval * 1000:
+                self._advance(1)
+            animation, step_ms = self.sequence[self.index]
+            step = self._elapsed // step_ms
+
+        if step == self._last_step:
+            # nothing would change, skip the render and the write to the strip
+            self._next_frame = ticks_add(now, self.frame_ms)
+            return False
+        self._last_step = step
+        if self.effect is not None:
+            self._render_effect(step)
+        else:
+            self.render(animation, step)
+        self.show()
+        self.frames_rendered += 1
+
+        # a slow frame spaces out the next ones instead of eating loop time
+        cost = ticks_diff(ticks_ms(), now)
+        self._next_frame = ticks_add(now, self.frame_ms * (1 + cost // self.budget_ms))
+        return True
+
+    def render(self, animation, step):
+        """
+        Write frame number step of animation into the pixel buffer.
+        """
+        count = self.count
+        wheel = self._wheel
+        if animation == ANIM_RAINBOW:
+            for i in range(count):
+                pos = ((step + i * 256 // count) & 0xFF) * 3
+                self.set_pixel(i, wheel[pos], wheel[pos + 1], wheel[pos + 2])
+        elif animation == ANIM_COMET:
+            # head bounces between the ends, the tail trails behind it
+            span = count + self.tail_length
+            travel = (step + self.tail_length) % (span * 2)
+            reverse = travel >= span
+            head = span - 1 - (travel - span) if reverse else travel
+            head -= self.tail_length
+            pos = (step * 8 & 0xFF) * 3
+            r, g, b = wheel[pos], wheel[pos + 1], wheel[pos + 2]
+            tail = self._tail
+            for i in range(count):
+                distance = i - head if reverse else head - i
+                if 0 <= distance < self.tail_length:
+                    level = tail[distance]
+                    self.set_pixel(i, r * level >> 8, g * level >> 8, b * level >> 8)
+                else:
+                    self.set_pixel(i, 0, 0, 0)
+        elif animation == ANIM_SPARKLE:
+            # dim rainbow with a few random pixels at full brightness
+            for i in range(count):
+                pos = ((step + i * 256 // count) & 0xFF) * 3
+                self.set_pixel(i, wheel[pos] >> 3, wheel[pos + 1] >> 3, wheel[pos + 2] >> 3)
+            for _ in range(self.num_sparkles):
+                i = random.randint(0, count - 1)
+                pos = ((step + i * 256 // count) & 0xFF) * 3
+                self.set_pixel(i, wheel[pos], wheel[pos + 1], wheel[pos + 2])
+        elif animation == ANIM_CHASE:
+            period = self.chase_size + self.chase_spacing
+            for i in range(count):
+                if (i + step) % period < self.chase_size:
+                    pos = ((step * 8 + i * 256 // count) & 0xFF) * 3
+                    self.set_pixel(i, wheel[pos], wheel[pos + 1], wheel[pos + 2])
+                else:
+                    self.set_pixel(i, 0, 0, 0)
+        else:
+            color = self.color
+            for i in range(count):
+                self.set_pixel(i, (color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF)
@@ -0,0 +1,209 @@
+"""
+User defined LED scenes stored as a compact binary playlist file.
+
+The file is an 8 byte header followed by 8 byte scene records:
+
+    header: magic b"SCN1", scene count (uint16), 2 reserved bytes
+    scene:  animation, flags, milliseconds per step (uint16), r, g, b,
+            duration in seconds
+
+Scenes are read one record at a time into a preallocated buffer, so a long
+playlist costs no more RAM than a short one. Writing needs a filesystem that
+is writable from code, see storage.remount() in boot.py, otherwise the edit
+functions raise OSError.
+"""
+import struct
+
+from led_engine import ANIM_COMET, ANIM_RAINBOW, ANIM_SPARKLE, ANIM_CHASE, ANIM_SOLID
+
+PLAYLIST_PATH = "/scenes.bin"
+
+_HEADER_FORMAT = "<4sHxx"
+_HEADER_MAGIC = b"SCN1"
+HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+
+_SCENE_FORMAT = "<BBHBBBB"
+SCENE_SIZE = struct.calcsize(_SCENE_FORMAT)
+
+# scene flags
+FLAG_USE_COLOR = 0x01
+
+ANIMATION_NAMES = {
+    "comet": ANIM_COMET,
+    "rainbow": ANIM_RAINBOW,
+    "sparkle": ANIM_SPARKLE,
+    "chase": ANIM_CHASE,
+    "solid": ANIM_SOLID,
+}
+
+
+def animation_name(animation):
+    for name, value in ANIMATION_NAMES.items():
+        if value == animation:
+            return name
+    return None
+
+
+class Scene:
+    """
+    One playlist entry. color is an int 0xRRGGBB, or None to keep the
+    animation's rainbow colours.
+    """
+
+    def __init__(self, animation=ANIM_RAINBOW, step_ms=100, color=None, duration=45):
+        self.animation = animation
+        self.step_ms = step_ms
+        self.color = color
+        self.duration = duration
+
+    def pack_into(self, buffer):
+        flags = 0
+        color = 0
+        if self.color is not None:
+            flags |= FLAG_USE_COLOR
+            color = self.color
+        struct.pack_into(_SCENE_FORMAT, buffer, 0, self.animation, flags, self.step_ms,
+                         (color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF, self.duration)
+
+    def unpack_from(self, buffer):
+        self.animation, flags, self.step_ms, r, g, b, self.duration = struct.unpack_from(_SCENE_FORMAT, buffer)
+        self.color = (r << 16) | (g << 8) | b if flags & FLAG_USE_COLOR else None
+        return self
+
+    def to_dict(self):
+        return {
+            "animation": animation_name(self.animation),
+            "step_ms": self.step_ms,
+            "color": None if self.color is None else "#{:06x}".format(self.color),
+            "duration": self.duration,
+        }
+
+
+class ScenePlaylist:
+    """
+    Random access to the scene records of a playlist file.
+    """
+
+    def __init__(self, path=PLAYLIST_PATH):
+        self.path = path
+        self._buffer = bytearray(max(HEADER_SIZE, SCENE_SIZE))
+        self._view = memoryview(self._buffer)
+
+    def __len__(self):
+        try:
+            with open(self.path, "rb") as playlist_file:
+                return self._read_count(playlist_file)
+        except OSError:
+            return 0
+
+    def _read_count(self, playlist_file):
+        playlist_file.seek(0)
+        if playlist_file.readinto(self._view[:HEADER_SIZE]) != HEADER_SIZE:
+            return 0
+        magic, count = struct.unpack_from(_HEADER_FORMAT, self._buffer)
+        if magic != _HEADER_MAGIC:
+            return 0
+        return count
+
+    def _write_count(self, playlist_file, count):
+        struct.pack_into(_HEADER_FORMAT, self._buffer, 0, _HEADER_MAGIC, count)
+        playlist_file.seek(0)
+        playlist_file.write(self._view[:HEADER_SIZE])
+
+    def read(self, index, scene=None):
+        """
+        Read scene number index into scene, or a new Scene. Returns None if the
+        playlist does not have that many scenes.
+        """
+        try:
+            with open(self.path, "rb") as playlist_file:
+                if not 0 <= index < self._read_count(playlist_file):
+                    return None
+                playlist_file.seek(HEADER_SIZE + index * SCENE_SIZE)
+                if playlist_file.readinto(self._view[:SCENE_SIZE]) != SCENE_SIZE:
+                    return None
+        except OSError:
+            return None
+        if scene is None:
+            scene = Scene()
+        return scene.unpack_from(self._buffer)
+
+    def _open_for_update(self):
+        try:
+            return open(self.path, "r+b")
+        except OSError:
+            playlist_file = open(self.path, "w+b")
+            self._write_count(playlist_file, 0)
+            return playlist_file
+
+    def write(self, index, scene):
+        """
+        Replace scene number index, or append it when index is the current
+        scene count.
+        """
+        with self._open_for_update() as playlist_file:
+            count = self._read_count(playlist_file)
+            if not 0 <= index <= count:
+                raise IndexError("scene index out of range")
+            scene.pack_into(self._buffer)
+            playlist_file.seek(HEADER_SIZE + index * SCENE_SIZE)
+            playlist_file.write(self._view[:SCENE_SIZE])
+            if index == count:
+                self._write_count(playlist_file, count + 1)
+
+    def delete(self, index):
+        """
+        Remove scene number index, moving the following scenes up one record
+        at a time.
+        """
+        with self._open_for_update() as playlist_file:
+            count = self._read_count(playlist_file)
+            if not 0 <= index < count:
+                raise IndexError("scene index out of range")
+            record = self._view[:SCENE_SIZE]
+            for i in range(index + 1, count):
+                playlist_file.seek(HEADER_SIZE + i * SCENE_SIZE)
+                playlist_file.readinto(record)
+                playlist_file.seek(HEADER_SIZE + (i - 1) * SCENE_SIZE)
+                playlist_file.write(record)
+            self._write_count(playlist_file, count - 1)
+
+
+class ScenePlayer:
+    """
+    Plays a ScenePlaylist on a LedEngine, loading the next scene from the file
+    when the current one has run for its duration. Falls back to the engine's
+    own sequence while the playlist is empty.
+    """
+
+    def __init__(self, engine, playlist):
+        self.engine = engine
+        self.playlist = playlist
+        self.index = -1
+        self.scene = Scene()
+        self._fallback_sequence = engine.sequence
+        self._fallback_interval = engine.advance_interval
+        self._slot = [(ANIM_RAINBOW, 100)]
+        engine.on_advance = self.advance
+
+    def advance(self, direction=1):
+        """
+        Move direction scenes forward, or backward when negative. Returns False
+        when there was no playlist to play from.
+        """
+        count = len(self.playlist)
+        if count == 0:
+            self.index = -1
+            self.engine.sequence = self._fallback_sequence
+            self.engine.advance_interval = self._fallback_interval
+            self.engine.scene_color = None
+            return False
+        self.index = (self.index + direction) % count
+        self.playlist.read(self.index, self.scene)
+        self._slot[0] = (self.scene.animation, max(self.scene.step_ms, 1))
+        self.engine.sequence = self._slot
+        self.engine.advance_interval = self.scene.duration
+        self.engine.scene_color = self.scene.color
+        if self.scene.color is not None:
+            self.engine.color = self.scene.color
+        return True
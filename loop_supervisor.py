@@ -0,0 +1,75 @@
+"""
+Runs the main loop under the hardware watchdog.
+
+Each pass of the loop feeds the watchdog, so a loop that hangs resets the
+board after timeout seconds. An exception in a pass is printed and the next
+pass runs, and only when more than max_errors of them happen within
+error_window seconds is the board reset, as something is stuck failing.
+Either way the badge comes back by itself, with the game restored from its
+last checkpoint, instead of sitting dead until a power cycle.
+
+timeout can be at most about 8 seconds on the RP2040, so every single pass
+and blocking call, like an e-ink refresh or joining Wi-Fi, must stay below it.
+"""
+import time
+import traceback
+
+import microcontroller
+from watchdog import WatchDogMode
+
+
+class LoopSupervisor:
+    """
+    Call run() with a function that does one pass of the loop.
+    """
+
+    def __init__(self, timeout=8.0, max_errors=3, error_window=60):
+        self.timeout = timeout
+        self.max_errors = max_errors
+        self.error_window = error_window
+        self.watchdog = microcontroller.watchdog
+        self.errors = 0
+        self._error_times = []
+
+    @property
+    def watchdog_reset(self):
+        """
+        Whether the last reset was the watchdog's.
+        """
+        return microcontroller.cpu.reset_reason == microcontroller.ResetReason.WATCHDOG
+
+    def start(self):
+        self.watchdog.timeout = self.timeout
+        self.watchdog.mode = WatchDogMode.RESET
+        self.watchdog.feed()
+
+    def stop(self):
+        try:
+            self.watchdog.deinit()
+        except (NotImplementedError, RuntimeError):
+            # some ports can not stop the watchdog once it runs
+            pass
+
+    def run(self, step):
+        self.start()
+        try:
+            while True:
+                self.watchdog.feed()
+                try:
+                    step()
+                except Exception as error:  # pylint: disable=broad-except
+                    self._failed(error)
+        except KeyboardInterrupt:
+            # ctrl-C to the REPL, which must not be reset under the user
+            self.stop()
+            raise
+
+    def _failed(self, error):
+        traceback.print_exception(error, error, error.__traceback__)
+        self.errors += 1
+        now = time.monotonic()
+        self._error_times = [at for at in self._error_times if now - at < self.error_window]
+        self._error_times.append(now)
+        if len(self._error_times) > self.max_errors:
+            print(f"{len(self._error_times)} errors in {self.error_window} seconds, resetting")
+            microcontroller.reset()
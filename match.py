@@ -0,0 +1,249 @@
+"""
+Best-of-N match play and a persisted log of finished games.
+
+Match decides who starts each game, alternating deterministically, and tracks
+the standings of the current series. A series is best_of games long, draws
+included, and ends early once a player has won a majority of them. MatchLog stores every finished game as a
+fixed size record in a ring buffer inside any bytearray like storage, usually
+a slice of microcontroller.nvm. Its header keeps running totals that are
+updated with each record, so the standings never need the history re-scanned.
+"""
+import struct
+
+OUTCOME_X = 1
+OUTCOME_O = 2
+OUTCOME_DRAW = 3
+
+_OUTCOME_CODES = {"X": OUTCOME_X, "O": OUTCOME_O, None: OUTCOME_DRAW}
+
+# magic, version, record count, next record slot, X wins, O wins, draws, matches played
+_HEADER_FORMAT = "<4sBxHHIIII"
+_HEADER_MAGIC = b"TTTM"
+_HEADER_VERSION = 1
+HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+
+# outcome and flags, number of moves, match number
+_RECORD_FORMAT = "<BBH"
+RECORD_SIZE = struct.calcsize(_RECORD_FORMAT)
+
+# record flag bits, stored above the outcome code
+_FLAG_O_STARTED = 0x04
+_FLAG_MATCH_END = 0x08
+
+
+def _other(player):
+    return "O" if player == "X" else "X"
+
+
+class Match:
+    """
+    A best_of game series. The player that starts alternates every game, and
+    every new match is started by the player that did not start the last one.
+
+    A match is over when a player has won best_of // 2 + 1 games, or after
+    best_of games. Draws count as games played, so they can not drag a match
+    on forever. When the games run out the player with more wins takes the
+    match, with equal wins it is drawn.
+    """
+
+    def __init__(self, best_of=3, first_turn="X"):
+        if best_of < 1 or best_of % 2 == 0:
+            raise ValueError("best_of must be a positive odd number")
+        self.best_of = best_of
+        self.first_turn = first_turn
+        self.number = 0
+        self.wins = {"X": 0, "O": 0}
+        self.draws = 0
+        self.games_played = 0
+
+    def reset(self):
+        """
+        Start a new match. The other player starts its first game.
+        """
+        self.first_turn = _other(self.first_turn)
+        self.number += 1
+        self.wins["X"] = 0
+        self.wins["O"] = 0
+        self.draws = 0
+        self.games_played = 0
+
+    @property
+    def starting_player(self):
+        """
+        Who starts the next game of this match.
+        """
+        if self.games_played % 2 == 0:
+            return self.first_turn
+        return _other(self.first_turn)
+
+    @property
+    def wins_needed(self):
+        return self.best_of // 2 + 1
+
+    @property
+    def winner(self):
+        """
+        The player that won the match, or None while it is undecided or when
+        it was drawn.
+        """
+        for player in ("X", "O"):
+            if self.wins[player] >= self.wins_needed:
+                return player
+        if self.games_played >= self.best_of and self.wins["X"] != self.wins["O"]:
+            return "X" if self.wins["X"] > self.wins["O"] else "O"
+        return None
+
+    @property
+    def decided(self):
+        """
+        True once a player has won enough games or best_of games were played.
+        """
+        return self.games_played >= self.best_of or \
+            max(self.wins["X"], self.wins["O"]) >= self.wins_needed
+
+    def record(self, winner):
+        """
+        Record the outcome of a game, winner is "X", "O" or None for a draw.
+        Returns True if this game decided the match.
+        """
+        if winner is None:
+            self.draws += 1
+        else:
+            self.wins[winner] += 1
+        self.games_played += 1
+        return self.decided
+
+    def resume(self, log):
+        """
+        Pick the standings of the last match back up from the games in a
+        MatchLog, like after a power loss. When its last game ended the
+        match, the next match is set up instead.
+        """
+        if log.count == 0:
+            return
+        _, _, _, number, match_end = log.read(0)
+        first_turn = "X"
+        wins = {"X": 0, "O": 0}
+        draws = 0
+        games = 0
+        for age in range(log.count):
+            winner, starter, _, match_number, _ = log.read(age)
+            if match_number != number:
+                break
+            if winner is None:
+                draws += 1
+            else:
+                wins[winner] += 1
+            games += 1
+            # the oldest game of the match is read last
+            first_turn = starter
+        self.number = number
+        self.first_turn = first_turn
+        self.wins["X"] = wins["X"]
+        self.wins["O"] = wins["O"]
+        self.draws = draws
+        self.games_played = games
+        if match_end:
+            self.reset()
+
+
+class MatchLog:
+    """
+    Ring buffer of fixed size game records with running totals in the header.
+
+    storage needs to support slice reads and writes, like microcontroller.nvm.
+    Only the bytes between offset and offset + size are used.
+    """
+
+    def __init__(self, storage, offset=0, size=1024):
+        self.storage = storage
+        self.offset = offset
+        self.capacity = (size - HEADER_SIZE) // RECORD_SIZE
+        if self.capacity < 1:
+            raise ValueError("size is too small for a single record")
+        self._header = bytearray(HEADER_SIZE)
+        self._record = bytearray(RECORD_SIZE)
+        self.count = 0
+        self._next_slot = 0
+        self.totals = {"X": 0, "O": 0, "draw": 0}
+        self.matches = 0
+        self.loaded = self._load()
+
+    def _load(self):
+        self._header[:] = self.storage[self.offset:self.offset + HEADER_SIZE]
+        magic, version, count, next_slot, x_wins, o_wins, draws, matches = \
+            struct.unpack_from(_HEADER_FORMAT, self._header)
+        if magic != _HEADER_MAGIC or version != _HEADER_VERSION or next_slot >= self.capacity:
+            return False
+        self.count = min(count, self.capacity)
+        self._next_slot = next_slot
+        self.totals["X"] = x_wins
+        self.totals["O"] = o_wins
+        self.totals["draw"] = draws
+        self.matches = matches
+        return True
+
+    def _pack_header(self):
+        struct.pack_into(_HEADER_FORMAT, self._header, 0, _HEADER_MAGIC, _HEADER_VERSION,
+                         self.count, self._next_slot, self.totals["X"], self.totals["O"],
+                         self.totals["draw"], self.matches)
+
+    def _save_header(self):
+        self._pack_header()
+        self.storage[self.offset:self.offset + HEADER_SIZE] = self._header
+
+    def clear(self, x_wins=0, o_wins=0, draws=0):
+        """
+        Forget all records. The totals can be seeded, for example with scores
+        that were kept before the log existed.
+        """
+        self.count = 0
+        self._next_slot = 0
+        self.totals["X"] = x_wins
+        self.totals["O"] = o_wins
+        self.totals["draw"] = draws
+        self.matches = 0
+        self._save_header()
+        self.loaded = True
+
+    def append(self, winner, starter, moves, match_number, match_end=False):
+        """
+        Store one finished game and update the running totals.
+        """
+        flags = _OUTCOME_CODES[winner]
+        if starter == "O":
+            flags |= _FLAG_O_STARTED
+        if match_end:
+            flags |= _FLAG_MATCH_END
+            self.matches += 1
+        struct.pack_into(_RECORD_FORMAT, self._record, 0, flags, moves, match_number & 0xFFFF)
+        end = self.offset + HEADER_SIZE + (self._next_slot + 1) * RECORD_SIZE
+
+        self.totals["draw" if winner is None else winner] += 1
+        self._next_slot = (self._next_slot + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self._pack_header()
+
+        # the header and record go out in one write, as every write to flash
+        # erases and rewrites the whole sector however few bytes it changes
+        span = bytearray(self.storage[self.offset:end])
+        span[:HEADER_SIZE] = self._header
+        span[len(span) - RECORD_SIZE:] = self._record
+        self.storage[self.offset:end] = span
+
+    def read(self, age):
+        """
+        Read a record, age 0 is the most recent game. Returns a tuple of
+        (winner, starter, moves, match_number, match_end), winner is None for
+        a draw.
+        """
+        if not 0 <= age < self.count:
+            raise IndexError("record out of range")
+        slot = (self._next_slot - 1 - age) % self.capacity
+        start = self.offset + HEADER_SIZE + slot * RECORD_SIZE
+        self._record[:] = self.storage[start:start + RECORD_SIZE]
+        flags, moves, match_number = struct.unpack_from(_RECORD_FORMAT, self._record)
+        outcome = flags & 0x03
+        winner = "X" if outcome == OUTCOME_X else "O" if outcome == OUTCOME_O else None
+        starter = "O" if flags & _FLAG_O_STARTED else "X"
+        return winner, starter, moves, match_number, bool(flags & _FLAG_MATCH_END)
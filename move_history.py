@@ -0,0 +1,92 @@
+"""
+Compact undo/redo history for a tic-tac-toe game.
+
+Moves are stored as cell indexes, row * 3 + column, in a 9 byte bytearray. The
+piece of each move is not stored, players alternate so it follows from the
+player that made the first move.
+"""
+
+BOARD_CELLS = 9
+
+
+def cell_index(position):
+    """
+    Convert a board position [column, row] to a cell index.
+    """
+    return position[1] * 3 + position[0]
+
+
+def cell_position(index):
+    """
+    Convert a cell index back into a board position [column, row].
+    """
+    return [index % 3, index // 3]
+
+
+class MoveHistory:
+    """
+    Played moves up to length, plus undone moves after it that can be redone
+    until a new move is pushed.
+    """
+
+    def __init__(self, first_turn="X"):
+        self.moves = bytearray(BOARD_CELLS)
+        self.first_turn = first_turn
+        self.length = 0
+        self._redo_length = 0
+
+    def clear(self, first_turn=None):
+        if first_turn is not None:
+            self.first_turn = first_turn
+        self.length = 0
+        self._redo_length = 0
+
+    def __len__(self):
+        return self.length
+
+    def piece_at(self, move_number):
+        """
+        Which piece, X or O, made the move at move_number.
+        """
+        if move_number % 2 == 0:
+            return self.first_turn
+        return "O" if self.first_turn == "X" else "X"
+
+    def push(self, index):
+        """
+        Record a move at cell index. Any undone moves are forgotten.
+        """
+        if self.length >= BOARD_CELLS:
+            raise IndexError("history is full")
+        self.moves[self.length] = index
+        self.length += 1
+        self._redo_length = self.length
+
+    @property
+    def can_undo(self):
+        return self.length > 0
+
+    @property
+    def can_redo(self):
+        return self._redo_length > self.length
+
+    def undo(self):
+        """
+        Step back one move and return its cell index, or None if there is
+        nothing to undo.
+        """
+        if not self.can_undo:
+            return None
+        self.length -= 1
+        return self.moves[self.length]
+
+    def redo(self):
+        """
+        Step forward one undone move and return its cell index, or None if
+        there is nothing to redo.
+        """
+        if not self.can_redo:
+            return None
+        index = self.moves[self.length]
+        self.length += 1
+        return index
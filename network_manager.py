@@ -0,0 +1,165 @@
+"""
+Keeps the badge on Wi-Fi and reachable by name.
+
+The badge advertises itself over mDNS as <hostname>.local with its web server
+as an _http._tcp service, so phones can find it without reading the IP off the
+screen. When the connection drops it reconnects with exponential backoff,
+using the credentials from settings.toml. The BSSID and channel of the last
+access point are cached in storage, such as microcontroller.nvm, so a
+reconnect can skip the channel scan.
+
+wifi.radio.connect() blocks until it succeeds or times out, so reconnect
+attempts are kept short with connect_timeout and spaced out by the backoff.
+
+Where there is no network to join, start_access_point() makes the badge host
+its own, see captive_dns for pointing the phones that join at the badge.
+"""
+import os
+
+import mdns
+from adafruit_ticks import ticks_ms, ticks_add, ticks_diff
+
+# marker, channel, 6 byte BSSID
+NETWORK_CACHE_SIZE = 8
+_CACHE_MARKER = 0xB5
+
+
+class NetworkManager:
+    """
+    Call update() every loop iteration, it only looks at the radio every
+    check_interval milliseconds. on_address_change is called with the new IP
+    address as a str, or None when the connection is lost, and only when it
+    differs from the last one reported.
+    """
+
+    def __init__(self, radio, hostname="badge", port=5000, storage=None, offset=0, on_address_change=None,
+                 min_backoff=1, max_backoff=64, connect_timeout=5, check_interval=1000):
+        self.radio = radio
+        self.hostname = hostname
+        self.port = port
+        self.storage = storage
+        self.offset = offset
+        self.on_address_change = on_address_change
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+        self.check_interval = check_interval
+        self.address = None
+        self.access_point = False
+        self.reconnects = 0
+        self._ssid = os.getenv("CIRCUITPY_WIFI_SSID")
+        self._password = os.getenv("CIRCUITPY_WIFI_PASSWORD")
+        self._backoff = min_backoff
+        self._next_attempt = ticks_ms()
+        self._next_check = self._next_attempt
+        self._use_cache = True
+        self._mdns = None
+
+    def start(self):
+        try:
+            self.radio.hostname = self.hostname
+        except (AttributeError, ValueError):
+            pass
+        self.update(force=True)
+
+    def start_access_point(self, ssid, password=None, port=80):
+        """
+        Stop joining networks and host one called ssid instead, open when
+        there is no password. port is the web server port to advertise,
+        captive portal checks only look at port 80.
+        """
+        self.access_point = True
+        self.port = port
+        if password:
+            self.radio.start_ap(ssid, password)
+        else:
+            self.radio.start_ap(ssid)
+        self._report(str(self.radio.ipv4_address_ap))
+
+    def _advertise(self):
+        try:
+            if self._mdns is None:
+                self._mdns = mdns.Server(self.radio)
+                self._mdns.hostname = self.hostname
+            self._mdns.advertise_service(service_type="_http", protocol="_tcp", port=self.port)
+        except (RuntimeError, OSError) as e:
+            print(f"mDNS unavailable: {e}")
+
+    def load_cache(self):
+        """
+        Return (bssid, channel) of the last access point, or (None, 0).
+        """
+        if self.storage is None:
+            return None, 0
+        cache = self.storage[self.offset:self.offset + NETWORK_CACHE_SIZE]
+        if cache[0] != _CACHE_MARKER:
+            return None, 0
+        return bytes(cache[2:8]), cache[1]
+
+    def _save_cache(self):
+        if self.storage is None:
+            return
+        ap_info = self.radio.ap_info
+        if ap_info is None:
+            return
+        cache = bytes((_CACHE_MARKER, ap_info.channel)) + bytes(ap_info.bssid)
+        # nvm wears out, only write when the access point changed
+        if self.storage[self.offset:self.offset + NETWORK_CACHE_SIZE] != cache:
+            self.storage[self.offset:self.offset + NETWORK_CACHE_SIZE] = cache
+
+    def _report(self, address):
+        if address == self.address:
+            return
+        self.address = address
+        if address is not None:
+            self._advertise()
+        if self.on_address_change is not None:
+            self.on_address_change(address)
+
+    def _check_address(self):
+        """
+        Report the radio's address, return False when it has none.
+        """
+        ipv4_address = self.radio.ipv4_address
+        if ipv4_address is None:
+            return False
+        address = str(ipv4_address)
+        if address != self.address:
+            self._save_cache()
+            self._backoff = self.min_backoff
+            self._use_cache = True
+        self._report(address)
+        return True
+
+    def update(self, now=None, force=False):
+        if now is None:
+            now = ticks_ms()
+        if self.access_point or not force and ticks_diff(now, self._next_check) < 0:
+            return
+        self._next_check = ticks_add(now, self.check_interval)
+        if self._check_address():
+            return
+
+        self._report(None)
+        if self._ssid is None or ticks_diff(now, self._next_attempt) < 0:
+            return
+        self._connect()
+        if self._check_address():
+            return
+        # time moved on while connect() blocked
+        self._next_attempt = ticks_add(ticks_ms(), self._backoff * 1000)
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def _connect(self):
+        bssid, channel = self.load_cache() if self._use_cache else (None, 0)
+        self.reconnects += 1
+        try:
+            if bssid is not None:
+                self.radio.connect(self._ssid, self._password, channel=channel, bssid=bssid,
+                                   timeout=self.connect_timeout)
+            else:
+                self.radio.connect(self._ssid, self._password, timeout=self.connect_timeout)
+        except (ConnectionError, OSError) as e:
+            print(f"Wi-Fi reconnect failed: {e}")
+            # the access point may have moved, scan all channels next time
+            self._use_cache = bssid is None
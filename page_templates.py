@@ -0,0 +1,125 @@
+"""
+Precompiled HTML templates streamed straight from flash.
+
+Templates are written with named slots like {{ color }}, any other braces are
+left alone, so CSS and JavaScript work as usual. compile_templates.py splits
+a template into static parts and slots ahead of time and writes a .tpl file:
+
+    header: magic b"TPL1", part count, slot count, 2 reserved bytes
+    part:   slot index or 0xFF for static text, reserved byte, length (uint16),
+            file offset of the static text (uint32)
+    slots:  one length byte and the utf-8 name per slot
+    the static text of all parts
+
+Only the part table and slot names are loaded. TemplateResponse copies the
+static text from the file and the slot values into the web server's send
+buffer a chunk at a time, so the page is never held in RAM as a whole.
+"""
+import struct
+
+from web_server import Response, OK_200
+
+_HEADER_FORMAT = "<4sBBxx"
+_HEADER_MAGIC = b"TPL1"
+HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+
+_PART_FORMAT = "<BxHI"
+PART_SIZE = struct.calcsize(_PART_FORMAT)
+
+STATIC_PART = 0xFF
+
+
+def escape(text):
+    """
+    Escape text for use in HTML.
+    """
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    return text
+
+
+class Template:
+    """
+    The part table and slot names of a compiled template, loaded once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as template_file:
+            header = template_file.read(HEADER_SIZE)
+            magic, self.part_count, slot_count = struct.unpack_from(_HEADER_FORMAT, header)
+            if magic != _HEADER_MAGIC:
+                raise ValueError(f"{path} is not a compiled template")
+            self.parts = template_file.read(self.part_count * PART_SIZE)
+            slots = []
+            for _ in range(slot_count):
+                length = template_file.read(1)[0]
+                slots.append(str(template_file.read(length), "utf-8"))
+            self.slots = tuple(slots)
+
+    def part(self, index):
+        """
+        Returns (slot, length, offset) of part number index.
+        """
+        return struct.unpack_from(_PART_FORMAT, self.parts, index * PART_SIZE)
+
+
+class TemplateResponse(Response):
+    """
+    A response rendering template with values, a dict with an entry for every
+    slot. Values are converted with str() and escaped, unless the slot name
+    ends in "_html".
+    """
+
+    def __init__(self, request, template, values, status=OK_200, headers=None, content_type="text/html"):
+        super().__init__(request, b"", status=status, headers=headers, content_type=content_type)
+        self.template = template
+        self._values = []
+        for name in template.slots:
+            value = str(values[name])
+            if not name.endswith("_html"):
+                value = escape(value)
+            self._values.append(value.encode("utf-8"))
+        self._file = open(template.path, "rb")
+        self._part = 0
+        self._offset = 0
+
+    @property
+    def body_length(self):
+        return None
+
+    def read_chunk(self, buffer):
+        filled = 0
+        size = len(buffer)
+        template = self.template
+        while filled < size and self._part < template.part_count:
+            slot, length, offset = template.part(self._part)
+            if slot != STATIC_PART:
+                value = self._values[slot]
+                length = len(value)
+            take = min(length - self._offset, size - filled)
+            if slot == STATIC_PART:
+                self._file.seek(offset + self._offset)
+                take = self._file.readinto(buffer[filled:filled + take])
+                if not take:
+                    # the file was cut short, skip to the next part instead
+                    # of waiting for text that will never come
+                    take = 0
+                    self._offset = length
+            else:
+                buffer[filled:filled + take] = memoryview(value)[self._offset:self._offset + take]
+            filled += take
+            self._offset += take
+            if self._offset >= length:
+                self._part += 1
+                self._offset = 0
+        return filled
+
+    def close(self):
+        self._file.close()
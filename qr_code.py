@@ -0,0 +1,365 @@
+"""
+QR codes for the badge URL, so visitors can scan it instead of typing it in.
+
+Only what a short URL needs: byte mode, versions 1 to 4 (up to 78 bytes at
+ECC level L, 62 at M) and ECC levels L and M. All buffers are allocated once
+for the largest version and reused, and the modules are drawn into a packed
+FrameBuffer for the badge composer to scale onto the screen.
+"""
+from framebuffer import FrameBuffer, BLACK, WHITE
+
+ECC_L = "L"
+ECC_M = "M"
+
+# per version: (total codewords, alignment pattern centre, {level: (ecc codewords per block, blocks)})
+_VERSIONS = (
+    None,
+    (26, None, {ECC_L: (7, 1), ECC_M: (10, 1)}),
+    (44, 18, {ECC_L: (10, 1), ECC_M: (16, 1)}),
+    (70, 22, {ECC_L: (15, 1), ECC_M: (26, 1)}),
+    (100, 26, {ECC_L: (20, 1), ECC_M: (18, 2)}),
+)
+MAX_VERSION = 4
+# format information bits of each level
+_LEVEL_BITS = {ECC_L: 1, ECC_M: 0}
+
+QUIET_ZONE = 4
+
+# GF(256) with the QR polynomial x^8 + x^4 + x^3 + x^2 + 1
+_EXP = bytearray(512)
+_LOG = bytearray(256)
+_value = 1
+for _i in range(255):
+    _EXP[_i] = _value
+    _LOG[_value] = _i
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+for _i in range(255, 512):
+    _EXP[_i] = _EXP[_i - 255]
+
+# whether a module is dark under each mask pattern
+_MASKS = (
+    lambda row, column: (row + column) % 2 == 0,
+    lambda row, column: row % 2 == 0,
+    lambda row, column: column % 3 == 0,
+    lambda row, column: (row + column) % 3 == 0,
+    lambda row, column: (row // 2 + column // 3) % 2 == 0,
+    lambda row, column: (row * column) % 2 + (row * column) % 3 == 0,
+    lambda row, column: ((row * column) % 2 + (row * column) % 3) % 2 == 0,
+    lambda row, column: ((row + column) % 2 + (row * column) % 3) % 2 == 0,
+)
+
+
+def capacity(version, level=ECC_M):
+    """
+    Number of bytes that fit in a version at level.
+    """
+    total, _, levels = _VERSIONS[version]
+    ecc, blocks = levels[level]
+    # 4 bit mode and 8 bit length before the data
+    return total - ecc * blocks - 2
+
+
+def reed_solomon(data, generator, out):
+    """
+    Fill out with the len(out) error correction codewords of data, using the
+    generator polynomial of that degree without its leading 1.
+    """
+    degree = len(out)
+    for i in range(degree):
+        out[i] = 0
+    for byte in data:
+        factor = byte ^ out[0]
+        for i in range(degree - 1):
+            out[i] = out[i + 1]
+        out[degree - 1] = 0
+        if factor:
+            log_factor = _LOG[factor]
+            for i in range(degree):
+                if generator[i]:
+                    out[i] ^= _EXP[_LOG[generator[i]] + log_factor]
+
+
+def generator_polynomial(degree, out=None):
+    """
+    Coefficients of (x - a^0)...(x - a^(degree - 1)) without the leading 1.
+    """
+    if out is None:
+        out = bytearray(degree)
+    for i in range(degree):
+        out[i] = 0
+    out[degree - 1] = 1
+    root = 1
+    for _ in range(degree):
+        for i in range(degree):
+            product = _EXP[_LOG[out[i]] + _LOG[root]] if out[i] else 0
+            out[i] = product ^ (out[i + 1] if i + 1 < degree else 0)
+        root = _EXP[_LOG[root] + 1]
+    return out
+
+
+class QREncoder:
+    """
+    Encodes text into image, a FrameBuffer of the symbol with its quiet zone,
+    dark modules BLACK. The mask is picked with the penalty rules of the
+    standard unless mask is given, which is faster.
+    """
+
+    def __init__(self, level=ECC_M, mask=None):
+        self.level = level
+        self.mask = mask
+        self.version = None
+        self.size = 0
+        self.mask_used = None
+        size = 17 + 4 * MAX_VERSION
+        self._modules = bytearray(size * size)
+        # function patterns, which data and masks leave alone
+        self._reserved = bytearray(size * size)
+        total = _VERSIONS[MAX_VERSION][0]
+        self._codewords = bytearray(total)
+        self._data = bytearray(total)
+        self._generator = bytearray(total)
+        self._block = bytearray(total)
+        self._images = {}
+        self.image = None
+
+    def encode(self, text):
+        """
+        Encode text, str or bytes, and return image. Raises ValueError if it
+        does not fit in version 4.
+        """
+        data = text.encode("utf-8") if isinstance(text, str) else text
+        version = 1
+        while capacity(version, self.level) < len(data):
+            version += 1
+            if version > MAX_VERSION:
+                raise ValueError(f"{len(data)} bytes do not fit in a version {MAX_VERSION} QR code")
+        self.version = version
+        self.size = 17 + 4 * version
+        data_length = self._write_data(data, version)
+        self._write_codewords(version, data_length)
+        self._draw_function_patterns(version)
+        self._place_codewords(_VERSIONS[version][0])
+
+        mask = self.mask
+        if mask is None:
+            best = None
+            for candidate in range(8):
+                self._apply_mask(candidate)
+                self._draw_format(candidate)
+                score = self._penalty()
+                if best is None or score < best:
+                    best = score
+                    mask = candidate
+                # masks are an XOR, applying it again takes it off
+                self._apply_mask(candidate)
+        self._apply_mask(mask)
+        self._draw_format(mask)
+        self.mask_used = mask
+        return self._draw_image()
+
+    def _write_data(self, data, version):
+        # byte mode indicator 0100 and 8 bit length, then the bytes, all
+        # shifted by the 4 bits of the mode
+        total, _, levels = _VERSIONS[version]
+        ecc, blocks = levels[self.level]
+        data_length = total - ecc * blocks
+        out = self._data
+        out[0] = 0x40 | (len(data) >> 4)
+        previous = len(data)
+        for i, byte in enumerate(data):
+            out[i + 1] = ((previous << 4) | (byte >> 4)) & 0xFF
+            previous = byte
+        # the low 4 bits of the last byte, then the 4 bit terminator
+        out[len(data) + 1] = (previous << 4) & 0xFF
+        for i in range(len(data) + 2, data_length):
+            out[i] = 0xEC if (i - len(data)) % 2 == 0 else 0x11
+        return data_length
+
+    def _write_codewords(self, version, data_length):
+        # split into blocks, add error correction and interleave
+        ecc, blocks = _VERSIONS[version][2][self.level]
+        block_length = data_length // blocks
+        generator = memoryview(self._generator)[:ecc]
+        generator_polynomial(ecc, generator)
+        ecc_out = memoryview(self._block)[:ecc]
+        data = memoryview(self._data)
+        codewords = self._codewords
+        for block in range(blocks):
+            start = block * block_length
+            reed_solomon(data[start:start + block_length], generator, ecc_out)
+            for i in range(block_length):
+                codewords[i * blocks + block] = data[start + i]
+            for i in range(ecc):
+                codewords[data_length + i * blocks + block] = ecc_out[i]
+
+    def _set(self, row, column, dark):
+        index = row * self.size + column
+        self._modules[index] = 1 if dark else 0
+        self._reserved[index] = 1
+
+    def _draw_function_patterns(self, version):
+        size = self.size
+        for i in range(size * size):
+            self._modules[i] = 0
+            self._reserved[i] = 0
+        # finders with their separators
+        for top, left in ((0, 0), (0, size - 7), (size - 7, 0)):
+            for row in range(-1, 8):
+                for column in range(-1, 8):
+                    if 0 <= top + row < size and 0 <= left + column < size:
+                        ring = max(abs(row - 3), abs(column - 3))
+                        self._set(top + row, left + column, ring != 2 and ring != 4)
+        # timing patterns
+        for i in range(8, size - 8):
+            self._set(6, i, i % 2 == 0)
+            self._set(i, 6, i % 2 == 0)
+        # one alignment pattern, the others would overlap the finders below version 7
+        centre = _VERSIONS[version][1]
+        if centre is not None:
+            for row in range(-2, 3):
+                for column in range(-2, 3):
+                    self._set(centre + row, centre + column, max(abs(row), abs(column)) != 1)
+        # format areas, written by _draw_format, and the dark module
+        for i in range(9):
+            self._reserved[8 * size + i] = 1
+            self._reserved[i * size + 8] = 1
+        for i in range(8):
+            self._reserved[8 * size + size - 1 - i] = 1
+            self._reserved[(size - 1 - i) * size + 8] = 1
+        self._set(size - 8, 8, True)
+
+    def _place_codewords(self, total):
+        # two module wide columns from the bottom right, zigzagging up and down
+        size = self.size
+        modules = self._modules
+        reserved = self._reserved
+        codewords = self._codewords
+        bit = 0
+        bits = total * 8
+        upward = True
+        right = size - 1
+        while right > 0:
+            if right == 6:
+                # skip the vertical timing pattern
+                right -= 1
+            for step in range(size):
+                row = size - 1 - step if upward else step
+                for column in (right, right - 1):
+                    index = row * size + column
+                    if reserved[index]:
+                        continue
+                    # remainder bits after the last codeword stay light
+                    if bit < bits:
+                        modules[index] = (codewords[bit >> 3] >> (7 - (bit & 7))) & 1
+                        bit += 1
+            upward = not upward
+            right -= 2
+
+    def _apply_mask(self, mask):
+        size = self.size
+        modules = self._modules
+        reserved = self._reserved
+        pattern = _MASKS[mask]
+        for row in range(size):
+            base = row * size
+            for column in range(size):
+                if not reserved[base + column] and pattern(row, column):
+                    modules[base + column] ^= 1
+
+    def _draw_format(self, mask):
+        size = self.size
+        value = (_LEVEL_BITS[self.level] << 3) | mask
+        remainder = value
+        for _ in range(10):
+            remainder = (remainder << 1) ^ (0x537 if remainder >> 9 else 0)
+        bits = ((value << 10) | remainder) ^ 0x5412
+        for i in range(15):
+            dark = (bits >> i) & 1
+            # around the top left finder
+            if i < 6:
+                self._set(i, 8, dark)
+            elif i < 8:
+                self._set(i + 1, 8, dark)
+            elif i == 8:
+                self._set(8, 7, dark)
+            else:
+                self._set(8, 14 - i, dark)
+            # split between the other two finders
+            if i < 8:
+                self._set(8, size - 1 - i, dark)
+            else:
+                self._set(size - 15 + i, 8, dark)
+
+    def _penalty(self):
+        size = self.size
+        modules = self._modules
+        score = 0
+        dark = 0
+        for i in range(size):
+            row_run = 0
+            column_run = 0
+            row_previous = -1
+            column_previous = -1
+            # last 11 modules of the row and column as bits, for finder like patterns
+            row_window = 0
+            column_window = 0
+            for j in range(size):
+                row_module = modules[i * size + j]
+                column_module = modules[j * size + i]
+                dark += row_module
+                # runs of five or more
+                if row_module == row_previous:
+                    row_run += 1
+                    if row_run == 5:
+                        score += 3
+                    elif row_run > 5:
+                        score += 1
+                else:
+                    row_run = 1
+                    row_previous = row_module
+                if column_module == column_previous:
+                    column_run += 1
+                    if column_run == 5:
+                        score += 3
+                    elif column_run > 5:
+                        score += 1
+                else:
+                    column_run = 1
+                    column_previous = column_module
+                # 1:1:3:1:1 next to four light modules
+                row_window = ((row_window << 1) | row_module) & 0x7FF
+                column_window = ((column_window << 1) | column_module) & 0x7FF
+                if j >= 10:
+                    if row_window in (0x05D, 0x5D0):
+                        score += 40
+                    if column_window in (0x05D, 0x5D0):
+                        score += 40
+                # 2x2 blocks of one colour
+                if i < size - 1 and j < size - 1:
+                    index = i * size + j
+                    if modules[index + 1] == row_module and modules[index + size] == row_module and \
+                            modules[index + size + 1] == row_module:
+                        score += 3
+        # balance of dark and light
+        total = size * size
+        score += abs(dark * 20 - total * 10) // total * 10
+        return score
+
+    def _draw_image(self):
+        size = self.size
+        image = self._images.get(self.version)
+        if image is None:
+            image = FrameBuffer(size + 2 * QUIET_ZONE, size + 2 * QUIET_ZONE)
+            self._images[self.version] = image
+        image.fill(WHITE)
+        modules = self._modules
+        for row in range(size):
+            base = row * size
+            for column in range(size):
+                if modules[base + column]:
+                    image.set_pixel(column + QUIET_ZONE, row + QUIET_ZONE, BLACK)
+        image.clear_dirty()
+        self.image = image
+        return image
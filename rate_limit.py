@@ -0,0 +1,80 @@
+"""
+Per client token bucket rate limiting for the web server.
+
+Buckets live in a fixed size table keyed by client address. When a new client
+arrives and the table is full, the client seen longest ago gives up its entry,
+so memory use stays the same however many phones connect. Token counts are
+kept in thousandths of a token, so refilling needs no floats.
+"""
+from adafruit_ticks import ticks_ms, ticks_diff
+
+_SCALE = 1000
+
+
+class RateLimiter:
+    """
+    Allows each client burst requests at once, refilled at rate requests per
+    second. size is the number of clients tracked at the same time.
+    """
+
+    def __init__(self, size=16, rate=2, burst=10):
+        self.size = size
+        self.rate = rate
+        self.burst = burst
+        self._addresses = [None] * size
+        self._tokens = [0] * size
+        self._last_seen = [0] * size
+        self.evictions = 0
+        self.rejected = 0
+
+    def _slot(self, address, now):
+        oldest = 0
+        for i in range(self.size):
+            if self._addresses[i] == address:
+                return i
+            if self._addresses[i] is None:
+                oldest = i
+                break
+            if ticks_diff(self._last_seen[i], self._last_seen[oldest]) < 0:
+                oldest = i
+        if self._addresses[oldest] is not None:
+            self.evictions += 1
+        self._addresses[oldest] = address
+        self._tokens[oldest] = self.burst * _SCALE
+        self._last_seen[oldest] = now
+        return oldest
+
+    def allow(self, address, now=None):
+        """
+        Take a token for address. Returns False when it has none left.
+        """
+        if now is None:
+            now = ticks_ms()
+        i = self._slot(address, now)
+        elapsed = ticks_diff(now, self._last_seen[i])
+        full = self.burst * _SCALE
+        # elapsed is negative for entries so old the tick counter wrapped
+        tokens = full if elapsed < 0 else min(full, self._tokens[i] + elapsed * self.rate)
+        self._last_seen[i] = now
+        if tokens < _SCALE:
+            self._tokens[i] = tokens
+            self.rejected += 1
+            return False
+        self._tokens[i] = tokens - _SCALE
+        return True
+
+    def retry_after(self, address):
+        """
+        Whole seconds until address has a token again.
+        """
+        for i in range(self.size):
+            if self._addresses[i] == address:
+                missing = _SCALE - self._tokens[i]
+                if missing <= 0:
+                    return 0
+                return (missing + self.rate * _SCALE - 1) // (self.rate * _SCALE)
+        return 0
+
+    def clear(self):
+        for i in range(self.size):
+            self._addresses[i] = None
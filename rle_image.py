@@ -0,0 +1,64 @@
+"""
+Run length encoded 1 and 2-bit images, made from BMPs by compile_images.py.
+
+An OnDiskBitmap is read from the filesystem again on every refresh it is
+shown in. load_rle() reads the much smaller .rle file once and expands it
+into a displayio Bitmap in RAM, filling each run with bitmaptools instead of
+setting pixels one at a time.
+"""
+import struct
+
+import bitmaptools
+import displayio
+
+_HEADER_FORMAT = "<4sHHBB"
+_HEADER_MAGIC = b"RLE1"
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+
+
+def load_rle(path):
+    """
+    Returns (bitmap, palette) of the image at path.
+    """
+    with open(path, "rb") as rle_file:
+        data = rle_file.read()
+    magic, width, height, bits, color_count = struct.unpack_from(_HEADER_FORMAT, data)
+    if magic != _HEADER_MAGIC:
+        raise ValueError(f"{path} is not an RLE image")
+    palette = displayio.Palette(color_count)
+    for i in range(color_count):
+        offset = _HEADER_SIZE + i * 3
+        palette[i] = (data[offset] << 16) | (data[offset + 1] << 8) | data[offset + 2]
+
+    bitmap = displayio.Bitmap(width, height, 1 << bits)
+    shift = 8 - bits
+    length_mask = (1 << shift) - 1
+    x = 0
+    y = 0
+    for position in range(_HEADER_SIZE + color_count * 3, len(data)):
+        run = data[position]
+        color = run >> shift
+        length = (run & length_mask) + 1
+        while length:
+            take = min(length, width - x)
+            # a new Bitmap is all colour 0 already
+            if color:
+                bitmaptools.fill_region(bitmap, x, y, x + take, y + 1, color)
+            length -= take
+            x += take
+            if x == width:
+                x = 0
+                y += 1
+    return bitmap, palette
+
+
+def load_image(path):
+    """
+    Load the BMP at path from the .rle next to it when there is one, or as
+    an OnDiskBitmap otherwise. Returns (bitmap, pixel_shader).
+    """
+    try:
+        return load_rle(path.rsplit(".", 1)[0] + ".rle")
+    except OSError:
+        bitmap = displayio.OnDiskBitmap(path)
+        return bitmap, bitmap.pixel_shader
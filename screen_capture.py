@@ -0,0 +1,189 @@
+"""
+Screenshots of the e-ink display for the web interface.
+
+The screen is served as /screen.bmp and /screen.png straight from the packed
+rows of the ShadowDisplay frame, which are already laid out like BMP rows.
+Responses are streamed a piece at a time and never hold an encoded image in
+memory. The PNG checksums are remembered until invalidate() is called on the
+next display refresh, so repeated fetches only copy bytes.
+"""
+import struct
+
+from framebuffer import BMP_HEADER_SIZE
+from web_server import Response, OK_200
+
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None
+
+_CRC_TABLE = None
+
+
+def _crc32(data, crc=0):
+    global _CRC_TABLE  # pylint: disable=global-statement
+    if crc32 is not None:
+        return crc32(data, crc)
+    if _CRC_TABLE is None:
+        _CRC_TABLE = []
+        for n in range(256):
+            c = n
+            for _ in range(8):
+                c = (c >> 1) ^ 0xEDB88320 if c & 1 else c >> 1
+            _CRC_TABLE.append(c)
+    crc ^= 0xFFFFFFFF
+    for byte in data:
+        crc = _CRC_TABLE[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class ScreenCapture:
+    """
+    Serves the frame of shadow, a ShadowDisplay.
+    """
+
+    def __init__(self, shadow):
+        self.shadow = shadow
+        self.generation = 0
+        self.png_checksums = None
+
+    def invalidate(self):
+        """
+        Forget the PNG checksums, call this whenever the display refreshes.
+        """
+        self.generation += 1
+        self.png_checksums = None
+
+    def bmp_response(self, request):
+        return _BMPResponse(request, self)
+
+    def png_response(self, request):
+        return _PNGResponse(request, self)
+
+
+class _BMPResponse(Response):
+    """
+    A 1-bit bottom up BMP with a black and white palette, sent a row at a time.
+    """
+
+    def __init__(self, request, capture):
+        super().__init__(request, b"", status=OK_200, headers={"Cache-Control": "no-cache"},
+                         content_type="image/bmp")
+        # refreshes while this is sent must not change the rows under it
+        self.shadow = capture.shadow
+        frame = self.shadow.hold()
+        self.frame = frame
+        self._header = frame.bmp_header()
+
+    @property
+    def body_length(self):
+        return BMP_HEADER_SIZE + self.frame.stride * self.frame.height
+
+    def read_body(self, offset, buffer):
+        if offset < BMP_HEADER_SIZE:
+            return memoryview(self._header)[offset:offset + len(buffer)]
+        frame = self.frame
+        file_row, within = divmod(offset - BMP_HEADER_SIZE, frame.stride)
+        row = frame.row(frame.height - 1 - file_row)
+        return row[within:within + len(buffer)]
+
+    def close(self):
+        self.shadow.release(self.frame)
+
+
+def _chunk_header(length, kind):
+    return struct.pack(">I", length) + kind
+
+
+class _PNGResponse(Response):
+    """
+    A 1-bit greyscale PNG. CircuitPython can not deflate, so the pixel data
+    goes out as a stored zlib block, with the checksums worked out while the
+    rows are sent and remembered for later fetches of the same screen.
+    """
+
+    def __init__(self, request, capture):
+        super().__init__(request, b"", status=OK_200, headers={"Cache-Control": "no-cache"},
+                         content_type="image/png")
+        self.capture = capture
+        frame = capture.shadow.hold()
+        self.frame = frame
+        self._row_bytes = (frame.width + 7) // 8
+        # checksums of an earlier fetch of the same screen, if there was one
+        self._checksums = capture.png_checksums
+        self._generation = capture.generation
+        raw_length = (self._row_bytes + 1) * frame.height
+        # zlib header, then one final stored deflate block
+        zlib_header = b"\x78\x01\x01" + struct.pack("<HH", raw_length, raw_length ^ 0xFFFF)
+        ihdr = b"IHDR" + struct.pack(">IIBBBBB", frame.width, frame.height, 1, 0, 0, 0, 0)
+        self._idat_length = len(zlib_header) + raw_length + 4
+        self._prefix = _PNG_SIGNATURE + _chunk_header(13, b"") + ihdr + struct.pack(">I", _crc32(ihdr)) + \
+            _chunk_header(self._idat_length, b"IDAT") + zlib_header
+        self._raw_start = len(self._prefix)
+        self._raw_end = self._raw_start + raw_length
+        self._suffix = None
+        self._crc = _crc32(b"IDAT" + zlib_header)
+        self._adler_a = 1
+        self._adler_b = 0
+
+    @property
+    def body_length(self):
+        # prefix, rows, adler32, IDAT crc and the empty IEND chunk
+        return self._raw_end + 4 + 4 + 12
+
+    def read_body(self, offset, buffer):
+        if offset < self._raw_start:
+            return memoryview(self._prefix)[offset:offset + len(buffer)]
+        if offset >= self._raw_end:
+            if self._suffix is None:
+                self._suffix = self._build_suffix()
+            start = offset - self._raw_end
+            return memoryview(self._suffix)[start:start + len(buffer)]
+        return self._read_rows(offset - self._raw_start, buffer)
+
+    def _read_rows(self, position, buffer):
+        line_length = self._row_bytes + 1
+        filled = 0
+        while filled < len(buffer) and position < self._raw_end - self._raw_start:
+            y, within = divmod(position, line_length)
+            row = self.frame.row(y)
+            if within == 0:
+                buffer[filled] = 0  # filter type none
+                filled += 1
+                within = 1
+                position += 1
+            take = min(line_length - within, len(buffer) - filled)
+            buffer[filled:filled + take] = row[within - 1:within - 1 + take]
+            filled += take
+            position += take
+        data = buffer[:filled]
+        if self._checksums is None:
+            self._update_checksums(data)
+        return data
+
+    def close(self):
+        self.capture.shadow.release(self.frame)
+
+    def _update_checksums(self, data):
+        self._crc = _crc32(data, self._crc)
+        a = self._adler_a
+        b = self._adler_b
+        for byte in data:
+            a = (a + byte) % 65521
+            b = (b + a) % 65521
+        self._adler_a = a
+        self._adler_b = b
+
+    def _build_suffix(self):
+        if self._checksums is not None:
+            adler, crc = self._checksums
+        else:
+            adler = struct.pack(">I", (self._adler_b << 16) | self._adler_a)
+            crc = struct.pack(">I", _crc32(adler, self._crc))
+            # only if the screen did not change while this was sent
+            if self._generation == self.capture.generation:
+                self.capture.png_checksums = (adler, crc)
+        return adler + crc + _chunk_header(0, b"IEND") + struct.pack(">I", _crc32(b"IEND"))
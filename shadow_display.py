@@ -0,0 +1,211 @@
+"""
+A software copy of what the e-ink display shows.
+
+ShadowDisplay composites display.root_group into a packed FrameBuffer layer
+by layer: rectangles and polygons as byte wide spans, bitmaps as blits.
+update() does that into a back buffer and XOR compares it with the frame the
+display is showing, so callers learn what changed, or that nothing did and
+the refresh can be skipped, without walking the group tree themselves.
+
+displayio can not read OnDiskBitmaps back, so each one is registered with the
+file it was loaded from and kept as a packed image, as are bitmaps loaded
+from RLE images. Those are drawn at scale 1, the only scale the badge uses
+them at.
+"""
+import math
+
+import displayio
+import vectorio
+
+from framebuffer import FrameBuffer, load_bmp, luminance_is_white, WHITE
+
+
+class ShadowDisplay:
+    """
+    frame is the FrameBuffer of what the display shows after the last
+    update(), with the rows that update changed marked dirty.
+    """
+
+    def __init__(self, display, threshold=128):
+        self.display = display
+        self.threshold = threshold
+        self.frame = FrameBuffer(display.width, display.height)
+        self._back = FrameBuffer(display.width, display.height)
+        self._sprites = []
+        # frames handed out with hold() and not released yet
+        self._held = []
+        self._synced = False
+        self.updates = 0
+        self.unchanged = 0
+
+    def add_bitmap_file(self, bitmap, path, pixel_shader=None):
+        """
+        Register the file an OnDiskBitmap was loaded from. A displayio Bitmap
+        that was loaded from a file, like an RLE image, and is not drawn on
+        afterwards is packed once from memory instead, with pixel_shader.
+        """
+        image, mask = self.pack(bitmap, path, pixel_shader)
+        self.add_image(bitmap, image, mask)
+
+    def pack(self, bitmap, path, pixel_shader=None):
+        """
+        The packed (image, mask) add_bitmap_file() would register.
+        """
+        if isinstance(bitmap, displayio.Bitmap):
+            return self._pack_bitmap(bitmap, pixel_shader)
+        shader = bitmap.pixel_shader
+        colors = None
+        transparent = None
+        if isinstance(shader, displayio.Palette):
+            colors = [shader[i] for i in range(len(shader))]
+            transparent = [i for i in range(len(shader)) if shader.is_transparent(i)]
+        return load_bmp(path, colors=colors, transparent=transparent, threshold=self.threshold)
+
+    def add_image(self, bitmap, image, mask=None):
+        """
+        Draw bitmap as image, a FrameBuffer of it already packed.
+        """
+        self._sprites.append((bitmap, image, mask))
+
+    def remove_image(self, bitmap):
+        self._sprites = [sprite for sprite in self._sprites if sprite[0] is not bitmap]
+
+    def hold(self):
+        """
+        The current frame, kept as it is until release() even when later
+        updates swap it out, for responses that send it a piece at a time.
+        """
+        self._held.append(self.frame)
+        return self.frame
+
+    def release(self, frame):
+        for i, held in enumerate(self._held):
+            if held is frame:
+                self._held.pop(i)
+                return
+
+    def update(self):
+        """
+        Composite the root group and make it the current frame. Returns the
+        changed area as (x, y, width, height), or None if the display would
+        show the same picture as before.
+        """
+        back = self._back
+        for held in self._held:
+            if held is back:
+                # still being sent, draw into a new buffer and leave it be
+                back = FrameBuffer(back.width, back.height)
+                break
+        back.fill(WHITE)
+        group = self.display.root_group
+        if group is not None:
+            self._draw_group(back, group, 0, 0, 1)
+        changed = back.diff(self.frame, back.dirty)
+        if not self._synced:
+            self._synced = True
+            changed = (0, 0, back.width, back.height)
+            back.mark_dirty(0, back.height)
+        self._back = self.frame
+        self.frame = back
+        self.updates += 1
+        if changed is None:
+            self.unchanged += 1
+        return changed
+
+    def _pack_bitmap(self, bitmap, shader):
+        image = FrameBuffer(bitmap.width, bitmap.height)
+        mask = None
+        for y in range(bitmap.height):
+            for x in range(bitmap.width):
+                shade = self._shade(shader, bitmap[x, y])
+                if shade < 0:
+                    if mask is None:
+                        mask = FrameBuffer(bitmap.width, bitmap.height)
+                        mask.fill(WHITE)
+                    mask.set_pixel(x, y, 0)
+                else:
+                    image.set_pixel(x, y, shade)
+        image.clear_dirty()
+        return image, mask
+
+    def _shade(self, shader, index):
+        # 1 white, 0 black, -1 transparent
+        if isinstance(shader, displayio.Palette):
+            if shader.is_transparent(index):
+                return -1
+            return 1 if luminance_is_white(shader[index], self.threshold) else 0
+        return 1 if luminance_is_white(index, self.threshold) else 0
+
+    def _draw_group(self, frame, group, origin_x, origin_y, scale):
+        for layer in group:
+            if getattr(layer, "hidden", False):
+                continue
+            x = origin_x + layer.x * scale
+            y = origin_y + layer.y * scale
+            if isinstance(layer, displayio.Group):
+                self._draw_group(frame, layer, x, y, scale * layer.scale)
+            elif isinstance(layer, displayio.TileGrid):
+                self._draw_tile_grid(frame, layer, x, y, scale)
+            else:
+                shade = self._shade(layer.pixel_shader, getattr(layer, "color_index", 0))
+                if shade < 0:
+                    continue
+                if isinstance(layer, vectorio.Rectangle):
+                    frame.fill_rect(x, y, layer.width * scale, layer.height * scale, shade)
+                elif isinstance(layer, vectorio.Circle):
+                    radius = layer.radius * scale
+                    for dy in range(-radius, radius + 1):
+                        half = int(math.sqrt(radius * radius - dy * dy))
+                        frame.fill_span(y + dy, x - half, x + half + 1, shade)
+                elif isinstance(layer, vectorio.Polygon):
+                    self._draw_polygon(frame, layer.points, x, y, scale, shade)
+
+    def _draw_polygon(self, frame, points, origin_x, origin_y, scale, shade):
+        # even-odd fill, sampled at the centre of each row
+        top = min(point[1] for point in points) * scale + origin_y
+        bottom = max(point[1] for point in points) * scale + origin_y
+        crossings = []
+        for y in range(max(top, 0), min(bottom + 1, frame.height)):
+            local_y = (y + 0.5 - origin_y) / scale
+            crossings.clear()
+            for i, (x0, y0) in enumerate(points):
+                x1, y1 = points[i - 1]
+                if (y0 <= local_y < y1) or (y1 <= local_y < y0):
+                    crossings.append(x0 + (local_y - y0) * (x1 - x0) / (y1 - y0))
+            crossings.sort()
+            for i in range(0, len(crossings) - 1, 2):
+                frame.fill_span(y, origin_x + math.ceil(crossings[i] * scale - 0.5),
+                                origin_x + math.floor(crossings[i + 1] * scale - 0.5) + 1, shade)
+
+    def _draw_tile_grid(self, frame, tile_grid, x, y, scale):
+        bitmap = tile_grid.bitmap
+        for registered, image, mask in self._sprites:
+            if registered is bitmap:
+                frame.blit(image, x, y, mask)
+                return
+        if isinstance(bitmap, displayio.Bitmap):
+            self._draw_bitmap(frame, bitmap, tile_grid.pixel_shader, x, y, scale)
+
+    def _draw_bitmap(self, frame, bitmap, shader, x, y, scale):
+        # labels, one span per run of equal pixels
+        shades = None
+        if isinstance(shader, displayio.Palette):
+            shades = [self._shade(shader, i) for i in range(len(shader))]
+        for by in range(bitmap.height):
+            top = y + by * scale
+            if top + scale <= 0 or top >= frame.height:
+                continue
+            run_start = 0
+            run_shade = -2
+            for bx in range(bitmap.width + 1):
+                if bx < bitmap.width:
+                    value = bitmap[bx, by]
+                    shade = shades[value] if shades is not None else self._shade(shader, value)
+                else:
+                    shade = -2
+                if shade != run_shade:
+                    if run_shade >= 0:
+                        for row in range(top, top + scale):
+                            frame.fill_span(row, x + run_start * scale, x + bx * scale, run_shade)
+                    run_start = bx
+                    run_shade = shade
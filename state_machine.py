@@ -0,0 +1,165 @@
+"""
+Table driven state machine for the badge main loop.
+
+Handlers are registered per (state, keys, edge) and compiled into a flat
+dispatch table, so handling a button event is a single lookup no matter
+how many states or bindings exist.
+"""
+
+# Button edges. Index 0-1 come straight from keypad events, the rest are left
+# free for higher level gestures.
+EDGE_PRESSED = 0
+EDGE_RELEASED = 1
+EDGE_COUNT = 8
+
+# Number of buttons on the badge, UP, DOWN, A, B, C
+KEY_COUNT = 5
+MASK_COUNT = 1 << KEY_COUNT
+
+
+def key_mask(*key_numbers):
+    """
+    Build the bitmask for one key or a chord of several keys.
+    """
+    mask = 0
+    for key_number in key_numbers:
+        mask |= 1 << key_number
+    return mask
+
+
+def _table_index(state_idx, key_number, mask, edge):
+    return ((state_idx * KEY_COUNT + key_number) * MASK_COUNT + mask) * EDGE_COUNT + edge
+
+
+def _bit_count(value):
+    count = 0
+    while value:
+        value &= value - 1
+        count += 1
+    return count
+
+
+class StateMachine:
+    """
+    Dispatch button events to handlers based on the current state, the mask of
+    buttons involved and the edge of the event.
+
+    A binding on a single key also fires when other buttons are held at the same
+    time, unless a chord binding for that exact combination exists.
+    """
+
+    def __init__(self):
+        self.state = None
+        self.pressed_mask = 0
+        self._states = []
+        self._on_enter = {}
+        self._on_tick = {}
+        self._bindings = {}
+        self._table = None
+        self._tick = None
+        self._state_idx = 0
+
+    def add_state(self, state, on_enter=None, on_tick=None):
+        """
+        Register a state. on_enter is called with the previous state when the
+        machine moves into this state. on_tick is called every loop iteration
+        while this state is active.
+        """
+        if state in self._states:
+            raise ValueError(f"state {state} already added")
+        self._states.append(state)
+        self._on_enter[state] = on_enter
+        self._on_tick[state] = on_tick
+        self._table = None
+
+    def on(self, state, keys, edge, handler):
+        """
+        Bind handler to a key on the given edge while in state. keys may also be
+        a tuple for a chord, in which case the last key is the one that
+        triggers and the others must be held. The handler is called with the
+        keypad event.
+        """
+        if state not in self._states:
+            raise ValueError(f"unknown state {state}")
+        if isinstance(keys, int):
+            keys = (keys,)
+        self._bindings[(state, keys[-1], key_mask(*keys), edge)] = handler
+        self._table = None
+
+    def compile(self):
+        """
+        Precompute the dispatch table. Called automatically on first dispatch
+        after the bindings changed.
+        """
+        table = {}
+        for (state, trigger, mask, edge), handler in self._bindings.items():
+            state_idx = self._states.index(state)
+            bits = _bit_count(mask)
+            for full_mask in range(MASK_COUNT):
+                if full_mask & mask != mask:
+                    continue
+                idx = _table_index(state_idx, trigger, full_mask, edge)
+                current = table.get(idx)
+                # the most specific binding wins, exact chord before single key
+                if current is None or bits > current[0]:
+                    table[idx] = (bits, handler)
+        self._table = {idx: entry[1] for idx, entry in table.items()}
+        return self._table
+
+    def transition(self, new_state):
+        """
+        Move to new_state and run its on_enter callback.
+        """
+        previous_state = self.state
+        self.state = new_state
+        self._state_idx = self._states.index(new_state)
+        self._tick = self._on_tick[new_state]
+        on_enter = self._on_enter[new_state]
+        if on_enter is not None:
+            on_enter(previous_state)
+
+    def tick(self):
+        """
+        Run the on_tick callback of the current state, if it has one.
+        """
+        if self._tick is not None:
+            self._tick()
+
+    def lookup(self, key_number, mask, edge):
+        """
+        Return the handler for key_number with the buttons in mask held on the
+        given edge in the current state, or None.
+        """
+        if self._table is None:
+            self.compile()
+        return self._table.get(_table_index(self._state_idx, key_number, mask, edge))
+
+    def dispatch(self, event):
+        """
+        Track held buttons from a keypad event and call the handler bound to it.
+        Returns the handler result, or None if nothing was bound.
+        """
+        key_bit = 1 << event.key_number
+        if event.pressed:
+            self.pressed_mask |= key_bit
+            mask = self.pressed_mask
+            edge = EDGE_PRESSED
+        else:
+            mask = self.pressed_mask | key_bit
+            self.pressed_mask &= ~key_bit
+            edge = EDGE_RELEASED
+
+        handler = self.lookup(event.key_number, mask, edge)
+        if handler is None:
+            return None
+        return handler(event)
+
+    def dispatch_gesture(self, gesture):
+        """
+        Call the handler bound to a recognised gesture, using the gesture kind
+        as the edge. Returns the handler result, or None if nothing was bound.
+        """
+        handler = self.lookup(gesture.key_number, gesture.mask, gesture.kind)
+        if handler is None:
+            return None
+        return handler(gesture)
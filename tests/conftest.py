@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the modules live at the top of the repo, next to a code.py that must not
+# shadow the standard library's code module, so the repo goes last on the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,49 @@
+from brightness import Brightness
+
+
+def test_levels_look_evenly_spaced():
+    brightness = Brightness(1, levels=4, max_ma=1000)
+    tops = []
+    for level in range(1, 5):
+        brightness.level = level
+        tops.append(brightness.lut[255])
+    # gamma 2.2 of 1/4, 2/4, 3/4 and 4/4 of full
+    assert tops == [12, 55, 135, 255]
+
+
+def test_table_is_gamma_corrected():
+    brightness = Brightness(1, levels=1, max_ma=1000)
+    assert brightness.lut[0] == 0
+    assert brightness.lut[128] == 56
+    assert brightness.lut[255] == 255
+    assert all(a <= b for a, b in zip(brightness.lut, brightness.lut[1:]))
+
+
+def test_current_limit_caps_the_top_levels():
+    # 8 pixels with all channels at 255 would draw 480 mA
+    brightness = Brightness(8, levels=6, level=6, max_ma=400)
+    assert brightness.max_output == 212
+    assert brightness.lut[255] == 212
+    # the lower levels are under the cap already
+    brightness.level = 5
+    assert brightness.lut[255] == 171
+
+
+def test_level_is_clamped_and_step_up_wraps():
+    brightness = Brightness(8, levels=3, level=9)
+    assert brightness.level == 3
+    brightness.level = 0
+    assert brightness.level == 1
+    assert [brightness.step_up() for _ in range(3)] == [2, 3, 1]
+    assert brightness.percent == 33
+
+
+def test_table_is_updated_in_place():
+    changes = []
+    brightness = Brightness(8)
+    brightness.on_change = lambda: changes.append(brightness.lut[255])
+    lut = brightness.lut
+    brightness.level = 4
+    brightness.level = 4
+    assert brightness.lut is lut
+    assert changes == [105]
@@ -0,0 +1,98 @@
+import socket
+import struct
+import time
+
+import pytest
+
+from captive_dns import DNSResponder
+
+TYPE_A = 1
+TYPE_AAAA = 28
+CLASS_IN = 1
+
+
+def query(name, query_type=TYPE_A, query_id=0x1234, flags=0x0100):
+    question = b"".join(bytes((len(label),)) + label.encode() for label in name.split(".")) + b"\x00"
+    return struct.pack(">HHHHHH", query_id, flags, 1, 0, 0, 0) + question + struct.pack(">HH", query_type, CLASS_IN)
+
+
+@pytest.fixture
+def responder():
+    responder = DNSResponder(socket, "192.168.4.1", port=0)
+    responder.start("127.0.0.1")
+    yield responder
+    responder.stop()
+
+
+@pytest.fixture
+def client():
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(0.02)
+    yield client
+    client.close()
+
+
+def ask(responder, client, packet):
+    """
+    Send packet to responder and return its reply, or None when there is none.
+    """
+    client.sendto(packet, responder._socket.getsockname())
+    for _ in range(10):
+        responder.poll()
+        try:
+            return client.recv(512)
+        except socket.timeout:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def test_a_query_gets_the_badge_address(responder, client):
+    packet = query("connectivitycheck.gstatic.com")
+    reply = ask(responder, client, packet)
+    query_id, flags, questions, answers, authority, additional = struct.unpack_from(">HHHHHH", reply)
+    assert query_id == 0x1234
+    # response, authoritative, recursion desired kept, no error
+    assert flags == 0x8500
+    assert (questions, answers, authority, additional) == (1, 1, 0, 0)
+    # the question is echoed back
+    assert reply[12:len(packet)] == packet[12:]
+    answer = reply[len(packet):]
+    assert answer[:2] == b"\xc0\x0c"
+    assert struct.unpack(">HHIH", answer[2:12]) == (TYPE_A, CLASS_IN, 60, 4)
+    assert socket.inet_ntoa(answer[12:16]) == "192.168.4.1"
+    assert responder.answered == 1
+
+
+def test_address_can_change(responder, client):
+    responder.address = "10.0.0.7"
+    reply = ask(responder, client, query("badge.local"))
+    assert socket.inet_ntoa(reply[-4:]) == "10.0.0.7"
+
+
+@pytest.mark.parametrize("query_type", [TYPE_AAAA, 15, 16])
+def test_other_types_get_an_empty_answer(responder, client, query_type):
+    packet = query("example.com", query_type)
+    reply = ask(responder, client, packet)
+    assert len(reply) == len(packet)
+    flags, questions, answers = struct.unpack_from(">HHH", reply, 2)
+    assert flags == 0x8500
+    assert (questions, answers) == (1, 0)
+
+
+@pytest.mark.parametrize("packet", [
+    b"\x12\x34\x01\x00",
+    # question name runs off the end
+    struct.pack(">HHHHHH", 1, 0x0100, 1, 0, 0, 0) + b"\x07example\x03co",
+    # compression pointer in the question
+    struct.pack(">HHHHHH", 1, 0x0100, 1, 0, 0, 0) + b"\xc0\x0c\x00\x01\x00\x01",
+    # two questions
+    struct.pack(">HHHHHH", 1, 0x0100, 2, 0, 0, 0) + b"\x00\x00\x01\x00\x01",
+    # a response, not a query
+    query("example.com", flags=0x8400),
+])
+def test_malformed_queries_are_ignored(responder, client, packet):
+    assert ask(responder, client, packet) is None
+    assert responder.answered == 0
+    # and the responder still answers the next one
+    assert ask(responder, client, query("example.com")) is not None
@@ -0,0 +1,60 @@
+import random
+
+from checkpoint import Checkpoint, GameState, SLOT_SIZE
+
+
+def game_state(moves=(4, 0, 8)):
+    state = GameState()
+    state.state = 1
+    state.game_first_turn = "O"
+    state.moves = bytearray(moves)
+    state.selector = 7
+    state.match_first_turn = "O"
+    state.wins["X"] = 1
+    state.draws = 1
+    state.games_played = 2
+    state.match_number = 300
+    return state
+
+
+def test_round_trip():
+    memory = bytearray(256)
+    assert Checkpoint(memory).load() is None
+    Checkpoint(memory).save(game_state())
+    loaded = Checkpoint(memory).load()
+    assert list(loaded.moves) == [4, 0, 8]
+    assert (loaded.state, loaded.selector, loaded.game_first_turn, loaded.match_first_turn) == (1, 7, "O", "O")
+    assert (loaded.wins, loaded.draws, loaded.games_played, loaded.match_number) == ({"X": 1, "O": 0}, 1, 2, 300)
+
+
+def test_unchanged_saves_are_skipped():
+    checkpoint = Checkpoint(bytearray(256))
+    assert checkpoint.save(game_state())
+    assert not checkpoint.save(game_state())
+    assert (checkpoint.saves, checkpoint.skipped) == (1, 1)
+
+
+def test_newest_slot_wins_across_sequence_wraparound():
+    memory = bytearray(256)
+    checkpoint = Checkpoint(memory)
+    checkpoint._sequence = 0xFFFE
+    for move in range(5):
+        checkpoint.save(game_state([move]))
+    assert list(Checkpoint(memory).load().moves) == [4]
+
+
+def test_cut_short_save_falls_back_to_the_one_before():
+    memory = bytearray(256)
+    checkpoint = Checkpoint(memory)
+    checkpoint.save(game_state([1]))
+    checkpoint.save(game_state([1, 2]))
+    memory[SLOT_SIZE + 5] ^= 0xFF
+    assert list(Checkpoint(memory).load().moves) == [1]
+
+
+def test_random_memory_is_not_restored():
+    generator = random.Random(50)
+    for _ in range(2000):
+        memory = bytearray(generator.getrandbits(8) for _ in range(2 * SLOT_SIZE))
+        loaded = Checkpoint(memory, slots=2).load()
+        assert loaded is None or len(set(loaded.moves)) == len(loaded.moves) <= 9
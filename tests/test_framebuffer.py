@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from compile_images import read_bmp
+from framebuffer import FrameBuffer, BLACK, WHITE, load_bmp
+
+
+def pixels(image):
+    return [[image.get_pixel(x, y) for x in range(image.width)] for y in range(image.height)]
+
+
+def random_image(width, height, seed):
+    rng = random.Random(seed)
+    image = FrameBuffer(width, height)
+    for y in range(height):
+        for x in range(width):
+            image.set_pixel(x, y, rng.getrandbits(1))
+    return image
+
+
+def test_rows_are_padded_like_a_bmp():
+    assert FrameBuffer(1, 1).stride == 4
+    assert FrameBuffer(32, 1).stride == 4
+    assert FrameBuffer(33, 1).stride == 8
+
+
+def test_set_pixel_is_msb_first_and_clipped():
+    image = FrameBuffer(16, 2)
+    image.set_pixel(0, 0, WHITE)
+    image.set_pixel(9, 1, WHITE)
+    image.set_pixel(16, 0, WHITE)
+    image.set_pixel(-1, 0, WHITE)
+    assert image.buffer[0] == 0x80
+    assert image.buffer[image.stride + 1] == 0x40
+    assert sum(image.buffer) == 0x80 + 0x40
+
+
+@pytest.mark.parametrize("start, end", [(0, 40), (3, 5), (3, 8), (7, 9), (5, 29), (-4, 12), (30, 60), (8, 8)])
+@pytest.mark.parametrize("color", [BLACK, WHITE])
+def test_fill_span_matches_set_pixel(start, end, color):
+    image = random_image(40, 1, start)
+    expected = pixels(image)
+    for x in range(max(start, 0), min(end, 40)):
+        expected[0][x] = color
+    image.fill_span(0, start, end, color)
+    assert pixels(image) == expected
+
+
+@pytest.mark.parametrize("x, y", [(0, 0), (3, 1), (8, 0), (13, -2), (-3, 2), (20, 5)])
+@pytest.mark.parametrize("masked", [False, True])
+def test_blit_matches_set_pixel(x, y, masked):
+    target = random_image(32, 8, 1)
+    source = random_image(11, 5, 2)
+    mask = random_image(11, 5, 3) if masked else None
+    expected = FrameBuffer(32, 8)
+    expected.copy_from(target)
+    expected._blit_pixels(source, x, y, mask)
+    target.blit(source, x, y, mask)
+    assert pixels(target) == pixels(expected)
+
+
+def test_dirty_rows():
+    image = FrameBuffer(8, 6)
+    assert image.dirty_range() is None
+    image.set_pixel(1, 2, WHITE)
+    image.fill_span(4, 0, 3, WHITE)
+    assert image.dirty_range() == (2, 5)
+    image.clear_dirty()
+    image.fill_rect(0, 5, 8, 4, BLACK)
+    assert image.dirty_range() == (5, 6)
+
+
+def test_diff():
+    first = random_image(40, 6, 4)
+    second = FrameBuffer(40, 6)
+    second.copy_from(first)
+    assert first.diff(second) is None
+    second.set_pixel(12, 2, 1 - second.get_pixel(12, 2))
+    second.set_pixel(35, 4, 1 - second.get_pixel(35, 4))
+    rows = bytearray(6)
+    # whole bytes from x 8 to the edge
+    assert first.diff(second, rows) == (8, 2, 32, 3)
+    assert list(rows) == [0, 0, 1, 0, 1, 0]
+
+
+def test_bmp_round_trip(tmp_path):
+    image = random_image(37, 9, 5)
+    path = str(tmp_path / "image.bmp")
+    image.save_bmp(path)
+    width, height, palette, rows = read_bmp(path)
+    assert (width, height, palette) == (37, 9, [0x000000, 0xFFFFFF])
+    assert rows == pixels(image)
+    loaded, mask = load_bmp(path)
+    assert pixels(loaded) == pixels(image)
+    assert mask is None
+    assert loaded.dirty_range() is None
+    # index 0 transparent leaves the black pixels out of the mask
+    loaded, mask = load_bmp(path, transparent=(0,))
+    assert pixels(mask) == pixels(image)
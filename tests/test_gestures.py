@@ -0,0 +1,81 @@
+from gestures import GestureRecognizer, Gesture, GESTURE_TAP, GESTURE_LONG_PRESS, GESTURE_CHORD
+
+
+class Event:
+    def __init__(self, key_number, pressed, timestamp):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.released = not pressed
+        self.timestamp = timestamp
+
+
+def gestures_of(recognizer):
+    found = []
+    gesture = Gesture()
+    while recognizer.events.get_into(gesture):
+        found.append((gesture.kind, gesture.key_number))
+    return found
+
+
+def test_tap_is_not_a_long_press_when_the_loop_stalls():
+    # press and release 100 ms apart, but the loop only gets to them after a
+    # 2 second e-ink refresh, both events are fed before update()
+    recognizer = GestureRecognizer(long_press_mask=0b11111)
+    recognizer.feed(Event(3, True, 1000))
+    recognizer.feed(Event(3, False, 1100))
+    recognizer.update(3100)
+    assert gestures_of(recognizer) == [(GESTURE_TAP, 3)]
+
+
+def test_long_press_while_held():
+    recognizer = GestureRecognizer(long_press_mask=0b11111)
+    recognizer.feed(Event(3, True, 1000))
+    recognizer.update(1500)
+    assert gestures_of(recognizer) == []
+    recognizer.update(1800)
+    recognizer.feed(Event(3, False, 2500))
+    assert gestures_of(recognizer) == [(GESTURE_LONG_PRESS, 3)]
+
+
+def chord_recognizer():
+    # long press A (2) and C (4) undo and redo, pressed together they are a chord
+    return GestureRecognizer(long_press_mask=0b11111, chord_mask=0b10100)
+
+
+def test_hold_then_press_is_a_chord():
+    recognizer = chord_recognizer()
+    recognizer.feed(Event(2, True, 1000))
+    recognizer.update(1600)
+    recognizer.feed(Event(4, True, 1600))
+    recognizer.feed(Event(4, False, 1700))
+    recognizer.feed(Event(2, False, 1750))
+    assert gestures_of(recognizer) == [(GESTURE_CHORD, 4)]
+
+
+def test_long_hold_then_press_is_still_a_chord():
+    recognizer = chord_recognizer()
+    recognizer.feed(Event(2, True, 1000))
+    recognizer.update(1900)
+    recognizer.update(2000)
+    recognizer.feed(Event(4, True, 2000))
+    recognizer.update(3000)
+    recognizer.feed(Event(2, False, 3100))
+    recognizer.feed(Event(4, False, 3200))
+    assert gestures_of(recognizer) == [(GESTURE_CHORD, 4)]
+
+
+def test_chord_key_long_press_on_release():
+    recognizer = chord_recognizer()
+    recognizer.feed(Event(2, True, 1000))
+    recognizer.update(2000)
+    assert gestures_of(recognizer) == []
+    recognizer.feed(Event(2, False, 2100))
+    assert gestures_of(recognizer) == [(GESTURE_LONG_PRESS, 2)]
+
+
+def test_chord_key_short_press_is_a_tap():
+    recognizer = chord_recognizer()
+    recognizer.feed(Event(4, True, 1000))
+    recognizer.feed(Event(4, False, 1200))
+    recognizer.update(2500)
+    assert gestures_of(recognizer) == [(GESTURE_TAP, 4)]
@@ -0,0 +1,61 @@
+import pytest
+
+from led_engine import LedEngine, ANIM_RAINBOW
+
+adafruit_pixelbuf = pytest.importorskip("adafruit_pixelbuf")
+
+
+class Strip(adafruit_pixelbuf.PixelBuf):
+    """
+    A PixelBuf like neopixel.NeoPixel that keeps what it would transmit.
+    """
+
+    def __init__(self, count, byteorder="GRB"):
+        super().__init__(count, byteorder=byteorder, brightness=0.5, auto_write=True)
+        self.sent = []
+
+    def _transmit(self, buffer):
+        self.sent.append(bytes(buffer))
+
+
+def engine_on(strip, **kwargs):
+    engine = LedEngine(strip, **kwargs)
+    # setting the brightness already showed the blank strip
+    strip.sent.clear()
+    return engine
+
+
+def identity_lut():
+    return bytearray(range(256))
+
+
+def test_fill_reaches_the_strip_in_its_byte_order():
+    strip = Strip(4)
+    engine = engine_on(strip, lut=identity_lut())
+    assert strip.brightness == 1.0 and not strip.auto_write
+    engine.fill(0x102030)
+    assert strip.sent == [bytes((0x20, 0x10, 0x30)) * 4]
+
+
+def test_rgbw_strip():
+    strip = Strip(2, byteorder="GRBW")
+    engine = engine_on(strip, lut=identity_lut())
+    engine.fill((1, 2, 3))
+    assert strip.sent[-1] == bytes((2, 1, 3, 0)) * 2
+
+
+def test_brightness_lut_scales_the_colours():
+    strip = Strip(1, byteorder="RGB")
+    engine = engine_on(strip, brightness=0.5)
+    engine.fill(0xFF8000)
+    assert strip.sent[-1] == bytes((127, 64, 0))
+    engine.brightness = 0.0
+    assert strip.sent[-1] == bytes(3)
+
+
+def test_tick_renders_animation_frames():
+    strip = Strip(8)
+    engine = engine_on(strip, sequence=((ANIM_RAINBOW, 8),), advance_interval=0, lut=identity_lut())
+    start = engine._next_frame
+    assert engine.tick(start + 100)
+    assert len(strip.sent) == 1 and any(strip.sent[0])
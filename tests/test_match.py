@@ -0,0 +1,89 @@
+from match import Match, MatchLog
+
+
+class FlashStorage(bytearray):
+    """
+    Counts slice writes, each one a sector erase on the badge's flash.
+    """
+
+    writes = 0
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.writes += 1
+        super().__setitem__(index, value)
+
+
+def play(match, log, winner):
+    starter = match.starting_player
+    match_end = match.record(winner)
+    log.append(winner, starter, 5, match.number, match_end=match_end)
+    if match_end:
+        match.reset()
+
+
+def test_append_is_one_write():
+    storage = FlashStorage(1024)
+    log = MatchLog(storage, size=1024)
+    log.clear()
+    storage.writes = 0
+    log.append("X", "X", 5, 0)
+    assert storage.writes == 1
+    assert MatchLog(storage, size=1024).read(0) == ("X", "X", 5, 0, False)
+
+
+def test_resume_an_open_match():
+    storage = bytearray(1024)
+    log = MatchLog(storage, size=1024)
+    log.clear()
+    match = Match(best_of=3)
+    play(match, log, "X")
+    play(match, log, "O")
+    play(match, log, "O")
+    play(match, log, None)
+
+    resumed = Match(best_of=3)
+    resumed.resume(MatchLog(storage, size=1024))
+    assert (resumed.number, resumed.first_turn, resumed.wins, resumed.draws, resumed.games_played) == \
+           (match.number, match.first_turn, match.wins, match.draws, match.games_played)
+    assert resumed.starting_player == match.starting_player
+
+
+def test_resume_after_a_finished_match():
+    storage = bytearray(1024)
+    log = MatchLog(storage, size=1024)
+    log.clear()
+    match = Match(best_of=3)
+    play(match, log, "X")
+    play(match, log, "X")
+
+    resumed = Match(best_of=3)
+    resumed.resume(MatchLog(storage, size=1024))
+    assert (resumed.number, resumed.first_turn, resumed.games_played) == (1, "O", 0)
+
+
+def test_draws_count_towards_best_of():
+    match = Match(best_of=3)
+    assert not match.record(None)
+    assert not match.record(None)
+    assert match.record("O")
+    assert match.winner == "O"
+
+
+def test_match_with_equal_wins_is_drawn():
+    match = Match(best_of=3)
+    match.record("X")
+    match.record("O")
+    assert match.record(None)
+    assert match.decided
+    assert match.winner is None
+
+
+def test_majority_ends_the_match_early():
+    match = Match(best_of=5)
+    match.record(None)
+    match.record("X")
+    match.record("X")
+    assert not match.decided
+    assert match.record("X")
+    assert match.winner == "X"
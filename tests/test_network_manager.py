@@ -0,0 +1,78 @@
+import sys
+import types
+
+import pytest
+
+# mdns is built into CircuitPython, the badge only needs something to advertise to
+if "mdns" not in sys.modules:
+    class _Server:
+        def __init__(self, radio):
+            self.hostname = None
+
+        def advertise_service(self, **kwargs):
+            pass
+
+    sys.modules["mdns"] = types.SimpleNamespace(Server=_Server)
+
+from network_manager import NetworkManager
+
+
+class FakeRadio:
+    """
+    A radio that joins the network on connect() unless failures are queued.
+    """
+
+    def __init__(self, failures=0):
+        self.ipv4_address = None
+        self.ap_info = types.SimpleNamespace(channel=6, bssid=b"\x01\x02\x03\x04\x05\x06")
+        self.failures = failures
+        self.connects = 0
+
+    def connect(self, ssid, password, **kwargs):
+        self.connects += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("No network with that ssid")
+        self.ipv4_address = "192.168.1.42"
+
+
+@pytest.fixture
+def credentials(monkeypatch):
+    monkeypatch.setenv("CIRCUITPY_WIFI_SSID", "badgenet")
+    monkeypatch.setenv("CIRCUITPY_WIFI_PASSWORD", "secret")
+
+
+def test_start_reports_the_address_it_connected_with(credentials):
+    changes = []
+    radio = FakeRadio()
+    network = NetworkManager(radio, on_address_change=changes.append)
+    network.start()
+    assert radio.connects == 1
+    assert network.address == "192.168.1.42"
+    assert changes == ["192.168.1.42"]
+
+
+def test_connecting_caches_the_access_point(credentials):
+    storage = bytearray(8)
+    network = NetworkManager(FakeRadio(), storage=storage)
+    network.start()
+    assert network.load_cache() == (b"\x01\x02\x03\x04\x05\x06", 6)
+
+
+def test_failed_connect_backs_off(credentials):
+    radio = FakeRadio(failures=1)
+    network = NetworkManager(radio, check_interval=0)
+    network.start()
+    assert network.address is None
+    network.update(force=True)
+    # still inside the one second backoff
+    assert radio.connects == 1
+
+
+def test_no_credentials_never_connects(monkeypatch):
+    monkeypatch.delenv("CIRCUITPY_WIFI_SSID", raising=False)
+    radio = FakeRadio()
+    network = NetworkManager(radio)
+    network.start()
+    assert radio.connects == 0
+    assert network.address is None
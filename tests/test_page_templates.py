@@ -0,0 +1,36 @@
+from compile_templates import compile_template
+from page_templates import Template, TemplateResponse
+
+
+def render(response, chunk_size=16):
+    body = bytearray()
+    buffer = bytearray(chunk_size)
+    for _ in range(100):
+        count = response.read_chunk(memoryview(buffer))
+        if count == 0:
+            break
+        body += buffer[:count]
+    else:
+        raise AssertionError("read_chunk never finished")
+    response.close()
+    return bytes(body)
+
+
+def write_template(tmp_path, source):
+    path = tmp_path / "page.tpl"
+    path.write_bytes(compile_template(source))
+    return path
+
+
+def test_renders_slots_escaped(tmp_path):
+    path = write_template(tmp_path, "<p>{{ name }} and {{ raw_html }}</p>")
+    response = TemplateResponse(None, Template(str(path)), {"name": "<X>", "raw_html": "<b>O</b>"})
+    assert render(response) == b"<p>&lt;X&gt; and <b>O</b></p>"
+
+
+def test_truncated_template_still_ends(tmp_path):
+    path = write_template(tmp_path, "<p>a long static part before the slot {{ name }}, and one after it</p>")
+    template = Template(str(path))
+    path.write_bytes(path.read_bytes()[:-10])
+    body = render(TemplateResponse(None, template, {"name": "X"}))
+    assert body == b"<p>a long static part before the slot X, and one af"
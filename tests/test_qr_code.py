@@ -0,0 +1,68 @@
+import pytest
+
+from framebuffer import BLACK, WHITE
+from qr_code import QREncoder, ECC_L, ECC_M, QUIET_ZONE, capacity, generator_polynomial, reed_solomon
+
+
+def test_reed_solomon():
+    # the 1-M "HELLO WORLD" example from the standard
+    data = bytes((32, 91, 11, 120, 209, 114, 220, 77, 67, 64, 236, 17, 236, 17, 236, 17))
+    generator = generator_polynomial(10)
+    ecc = bytearray(10)
+    reed_solomon(data, generator, ecc)
+    assert list(ecc) == [196, 35, 39, 119, 235, 215, 231, 226, 93, 23]
+
+
+def test_capacity():
+    assert [capacity(version, ECC_L) for version in range(1, 5)] == [17, 32, 53, 78]
+    assert [capacity(version, ECC_M) for version in range(1, 5)] == [14, 26, 42, 62]
+
+
+def test_smallest_version_that_fits():
+    encoder = QREncoder(ECC_M)
+    image = encoder.encode("http://10.0.0.7/")
+    assert encoder.version == 2
+    assert image.width == image.height == 25 + 2 * QUIET_ZONE
+    with pytest.raises(ValueError):
+        encoder.encode("x" * 63)
+
+
+def test_quiet_zone_and_finder():
+    image = QREncoder(ECC_M).encode("http://192.168.1.42:5000/")
+    for i in range(image.width):
+        assert image.get_pixel(i, 0) == WHITE
+        assert image.get_pixel(0, i) == WHITE
+    row = [image.get_pixel(QUIET_ZONE + x, QUIET_ZONE + 2) for x in range(8)]
+    assert row == [BLACK, WHITE, BLACK, BLACK, BLACK, WHITE, BLACK, WHITE]
+
+
+def test_images_are_reused_per_version():
+    encoder = QREncoder(ECC_M)
+    first = encoder.encode("http://10.0.0.7/")
+    assert encoder.encode("http://10.0.0.8/") is first
+    assert encoder.encode("x") is not first
+
+
+@pytest.mark.parametrize("level, text", [
+    (ECC_M, "x"),
+    (ECC_M, "http://192.168.1.42:5000/"),
+    (ECC_L, "http://badge.local:5000/"),
+    # two error correction blocks
+    (ECC_M, "http://badge.local:5000/" + "z" * 38),
+    (ECC_L, "http://badge.local:5000/" + "z" * 54),
+])
+@pytest.mark.parametrize("mask", range(8))
+def test_matches_the_qrcode_package(level, text, mask):
+    qrcode = pytest.importorskip("qrcode")
+    encoder = QREncoder(level, mask=mask)
+    image = encoder.encode(text)
+
+    reference = qrcode.QRCode(version=encoder.version, border=0, mask_pattern=mask,
+                              error_correction={ECC_L: qrcode.constants.ERROR_CORRECT_L,
+                                                ECC_M: qrcode.constants.ERROR_CORRECT_M}[level])
+    reference.add_data(qrcode.util.QRData(text.encode(), mode=qrcode.util.MODE_8BIT_BYTE))
+    reference.make(fit=False)
+    modules = reference.get_matrix()
+    assert len(modules) == encoder.size
+    for y, row in enumerate(modules):
+        assert [image.get_pixel(QUIET_ZONE + x, QUIET_ZONE + y) == BLACK for x in range(len(row))] == row
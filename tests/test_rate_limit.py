@@ -0,0 +1,46 @@
+from rate_limit import RateLimiter
+
+
+def test_burst_then_refill():
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter.allow("10.0.0.2", 1000) for _ in range(4)] == [True, True, True, False]
+    assert limiter.rejected == 1
+    assert limiter.retry_after("10.0.0.2") == 1
+    # two tokens a second
+    assert not limiter.allow("10.0.0.2", 1400)
+    assert limiter.allow("10.0.0.2", 1600)
+    assert limiter.allow("10.0.0.2", 2600)
+    assert limiter.allow("10.0.0.2", 2600)
+    assert not limiter.allow("10.0.0.2", 2600)
+
+
+def test_refill_stops_at_burst():
+    limiter = RateLimiter(rate=2, burst=3)
+    limiter.allow("10.0.0.2", 1000)
+    assert [limiter.allow("10.0.0.2", 60000) for _ in range(4)] == [True, True, True, False]
+
+
+def test_clients_have_their_own_buckets():
+    limiter = RateLimiter(rate=1, burst=1)
+    assert limiter.allow("10.0.0.2", 1000)
+    assert not limiter.allow("10.0.0.2", 1000)
+    assert limiter.allow("10.0.0.3", 1000)
+    assert limiter.retry_after("10.0.0.4") == 0
+
+
+def test_full_table_evicts_the_client_seen_longest_ago():
+    limiter = RateLimiter(size=2, rate=1, burst=1)
+    limiter.allow("10.0.0.2", 1000)
+    limiter.allow("10.0.0.3", 1100)
+    limiter.allow("10.0.0.4", 1200)
+    assert limiter.evictions == 1
+    # .3 kept its empty bucket, .2 comes back with a full one
+    assert not limiter.allow("10.0.0.3", 1200)
+    assert limiter.allow("10.0.0.2", 1200)
+
+
+def test_clear_forgets_everyone():
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.allow("10.0.0.2", 1000)
+    limiter.clear()
+    assert limiter.allow("10.0.0.2", 1000)
@@ -0,0 +1,74 @@
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+from compile_images import compile_image, read_bmp
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Bitmap:
+    def __init__(self, width, height, value_count):
+        self.width = width
+        self.height = height
+        self.value_count = value_count
+        self.rows = [[0] * width for _ in range(height)]
+
+
+class Palette(list):
+    def __init__(self, color_count):
+        super().__init__([0] * color_count)
+
+
+def fill_region(bitmap, x1, y1, x2, y2, value):
+    assert value < bitmap.value_count
+    for y in range(y1, y2):
+        for x in range(x1, x2):
+            bitmap.rows[y][x] = value
+
+
+@pytest.fixture
+def rle_image(monkeypatch):
+    # displayio and bitmaptools are built into CircuitPython, these keep just
+    # what load_rle() uses
+    monkeypatch.setitem(sys.modules, "displayio", types.SimpleNamespace(Bitmap=Bitmap, Palette=Palette))
+    monkeypatch.setitem(sys.modules, "bitmaptools", types.SimpleNamespace(fill_region=fill_region))
+    monkeypatch.delitem(sys.modules, "rle_image", raising=False)
+    yield importlib.import_module("rle_image")
+    sys.modules.pop("rle_image", None)
+
+
+@pytest.mark.parametrize("palette", [[0x000000, 0xFFFFFF], [0x000000, 0x808080, 0xFF0000, 0xFFFFFF]])
+def test_round_trip(rle_image, tmp_path, palette):
+    # long runs cross rows and overflow the longest run a byte holds
+    rows = [[0] * 300, [1] * 150 + [0] * 150, [(x // 3) % len(palette) for x in range(300)], [1] * 300]
+    path = tmp_path / "image.rle"
+    path.write_bytes(compile_image(300, 4, palette, rows))
+    bitmap, loaded_palette = rle_image.load_rle(str(path))
+    assert (bitmap.width, bitmap.height) == (300, 4)
+    assert bitmap.rows == rows
+    assert list(loaded_palette) == palette
+
+
+def test_too_many_colours():
+    with pytest.raises(ValueError):
+        compile_image(1, 1, [0, 1, 2, 3, 4], [[0]])
+
+
+def test_not_an_rle_file(rle_image, tmp_path):
+    path = tmp_path / "image.rle"
+    path.write_bytes(b"BM" + bytes(40))
+    with pytest.raises(ValueError):
+        rle_image.load_rle(str(path))
+
+
+@pytest.mark.parametrize("name", ["x", "o", "selector", "pimoroni_badgerw_badge"])
+def test_shipped_images_are_up_to_date(rle_image, name):
+    width, height, palette, rows = read_bmp(os.path.join(REPO, name + ".bmp"))
+    bitmap, loaded_palette = rle_image.load_rle(os.path.join(REPO, name + ".rle"))
+    assert (bitmap.width, bitmap.height) == (width, height)
+    assert bitmap.rows == rows
+    assert list(loaded_palette) == palette
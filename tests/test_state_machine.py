@@ -0,0 +1,105 @@
+import pytest
+
+from gestures import Gesture, GESTURE_TAP, GESTURE_CHORD
+from state_machine import StateMachine, key_mask, EDGE_PRESSED, EDGE_RELEASED
+
+BADGE = 0
+GAME = 1
+UP, DOWN, A, B, C = range(5)
+
+
+class Event:
+    def __init__(self, key_number, pressed):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.released = not pressed
+
+
+def press(machine, key_number):
+    return machine.dispatch(Event(key_number, True))
+
+
+def release(machine, key_number):
+    return machine.dispatch(Event(key_number, False))
+
+
+@pytest.fixture
+def machine():
+    machine = StateMachine()
+    machine.add_state(BADGE)
+    machine.add_state(GAME)
+    machine.transition(BADGE)
+    return machine
+
+
+def test_key_mask():
+    assert key_mask(A) == 0b00100
+    assert key_mask(A, C) == 0b10100
+
+
+def test_dispatch_by_state_and_edge(machine):
+    machine.on(BADGE, B, EDGE_RELEASED, lambda event: "badge B")
+    machine.on(GAME, B, EDGE_RELEASED, lambda event: "game B")
+    assert press(machine, B) is None
+    assert release(machine, B) == "badge B"
+    machine.transition(GAME)
+    press(machine, B)
+    assert release(machine, B) == "game B"
+
+
+def test_chord_wins_over_single_key(machine):
+    machine.on(BADGE, C, EDGE_PRESSED, lambda event: "C")
+    machine.on(BADGE, (A, C), EDGE_PRESSED, lambda event: "A+C")
+    assert press(machine, C) == "C"
+    release(machine, C)
+    press(machine, A)
+    assert press(machine, C) == "A+C"
+    release(machine, A)
+    release(machine, C)
+    # a binding on a single key still fires with other keys held
+    press(machine, UP)
+    assert press(machine, C) == "C"
+
+
+def test_release_edge_sees_the_released_key(machine):
+    machine.on(BADGE, (A, C), EDGE_RELEASED, lambda event: "A+C")
+    press(machine, A)
+    press(machine, C)
+    assert release(machine, C) == "A+C"
+    assert machine.pressed_mask == key_mask(A)
+
+
+def test_bindings_added_after_dispatch(machine):
+    assert press(machine, UP) is None
+    machine.on(BADGE, UP, EDGE_PRESSED, lambda event: "UP")
+    assert press(machine, UP) == "UP"
+
+
+def test_gestures_dispatch_on_their_kind(machine):
+    machine.on(BADGE, A, GESTURE_TAP, lambda gesture: "tap A")
+    machine.on(BADGE, (A, C), GESTURE_CHORD, lambda gesture: "chord")
+    assert machine.dispatch_gesture(Gesture(GESTURE_TAP, A, key_mask(A))) == "tap A"
+    assert machine.dispatch_gesture(Gesture(GESTURE_CHORD, C, key_mask(A, C))) == "chord"
+    assert machine.dispatch_gesture(Gesture(GESTURE_TAP, B, key_mask(B))) is None
+
+
+def test_transition_calls_on_enter_and_tick():
+    entered = []
+    ticks = []
+    machine = StateMachine()
+    machine.add_state(BADGE, on_enter=entered.append, on_tick=lambda: ticks.append(BADGE))
+    machine.add_state(GAME, on_enter=entered.append)
+    machine.transition(BADGE)
+    machine.tick()
+    machine.transition(GAME)
+    machine.tick()
+    assert entered == [None, BADGE]
+    assert ticks == [BADGE]
+    assert machine.state == GAME
+
+
+def test_states_are_checked(machine):
+    with pytest.raises(ValueError):
+        machine.add_state(BADGE)
+    with pytest.raises(ValueError):
+        machine.on(7, A, EDGE_PRESSED, print)
@@ -0,0 +1,153 @@
+import errno
+
+import pytest
+
+from rate_limit import RateLimiter
+from web_server import Server, Response, GET
+
+
+class FakeClient:
+    """
+    A client socket that sends request and collects what the server sends back.
+    """
+
+    def __init__(self, request=b""):
+        self.incoming = bytearray(request)
+        self.outgoing = bytearray()
+        self.closed = False
+        self.stalled = False
+
+    def setblocking(self, flag):
+        pass
+
+    def recv_into(self, buffer):
+        if not self.incoming:
+            raise OSError(errno.EAGAIN, "would block")
+        count = min(len(buffer), len(self.incoming))
+        buffer[:count] = self.incoming[:count]
+        del self.incoming[:count]
+        return count
+
+    def send(self, data):
+        if self.stalled:
+            raise OSError(errno.EAGAIN, "would block")
+        self.outgoing += data
+        return len(data)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeListener:
+    def __init__(self):
+        self.waiting = []
+
+    def accept(self):
+        if not self.waiting:
+            raise OSError(errno.EAGAIN, "would block")
+        return self.waiting.pop(0), ("10.0.0.2", 40000)
+
+    def close(self):
+        pass
+
+
+def make_server(root_path, **kwargs):
+    server = Server(None, root_path, budget_us=1_000_000, **kwargs)
+    server._socket = FakeListener()
+
+    @server.route("/hello", GET)
+    def hello(request):
+        return Response(request, "hello")
+
+    return server
+
+
+def serve(server, client, passes=3):
+    server._socket.waiting.append(client)
+    for _ in range(passes):
+        server.poll()
+    return bytes(client.outgoing)
+
+
+@pytest.fixture
+def static_root(tmp_path):
+    (tmp_path / "settings.toml").write_text('CIRCUITPY_WIFI_PASSWORD = "secret"\n')
+    static = tmp_path / "static"
+    static.mkdir()
+    (static / "index.html").write_text("<p>badge</p>")
+    return str(static)
+
+
+def test_serves_static_files(static_root):
+    reply = serve(make_server(static_root), FakeClient(b"GET / HTTP/1.1\r\n\r\n"))
+    assert reply.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert reply.endswith(b"<p>badge</p>")
+
+
+@pytest.mark.parametrize("path", ["/../settings.toml", "/a/../../settings.toml", "/..\\settings.toml",
+                                  "/..", "/\\..\\settings.toml"])
+def test_rejects_paths_outside_the_root(static_root, path):
+    reply = serve(make_server(static_root), FakeClient(f"GET {path} HTTP/1.1\r\n\r\n".encode()))
+    assert reply.startswith(b"HTTP/1.1 403 Forbidden\r\n")
+    assert b"secret" not in reply
+
+
+@pytest.mark.parametrize("request_bytes", [
+    b"GARBAGE\r\n\r\n",
+    b"GET /hello\r\n\r\n",
+    b"POST /hello HTTP/1.1\r\nContent-Length: lots\r\n\r\n",
+    b"POST /hello HTTP/1.1\r\nContent-Length: -4\r\n\r\n",
+    b"GET /hello HTTP/1.1\r\nX-Name: \xff\xfe\r\n\r\n",
+])
+def test_malformed_requests_get_400(static_root, request_bytes):
+    server = make_server(static_root)
+    client = FakeClient(request_bytes)
+    reply = serve(server, client)
+    assert reply.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+    assert b"Connection: close\r\n" in reply
+    assert client.closed
+    assert server.open_connections == 0
+
+
+def test_malformed_request_leaves_other_clients_alone(static_root):
+    server = make_server(static_root)
+    good = FakeClient()
+    server._socket.waiting.append(good)
+    server.poll()
+    serve(server, FakeClient(b"GARBAGE\r\n\r\n"))
+    good.incoming += b"GET /hello HTTP/1.1\r\n\r\n"
+    server.poll()
+    assert bytes(good.outgoing).endswith(b"hello")
+    assert not good.closed
+
+
+def test_stuck_connections_time_out(static_root, monkeypatch):
+    clock = [1000]
+    monkeypatch.setattr("web_server.ticks_ms", lambda: clock[0])
+    server = make_server(static_root, pool_size=2, idle_timeout=5)
+    partial = FakeClient(b"GET /hello HT")
+    stalled = FakeClient(b"GET /hello HTTP/1.1\r\n\r\n")
+    stalled.stalled = True
+    serve(server, partial)
+    serve(server, stalled)
+    assert server.open_connections == 2
+
+    clock[0] += 4000
+    server.poll()
+    assert server.open_connections == 2
+
+    clock[0] += 2000
+    reply = serve(server, FakeClient(b"GET /hello HTTP/1.1\r\n\r\n"))
+    assert partial.closed and stalled.closed
+    assert reply.endswith(b"hello")
+
+
+def test_rate_limit_charges_requests_not_connections(static_root, monkeypatch):
+    monkeypatch.setattr("web_server.ticks_ms", lambda: 1000)
+    server = make_server(static_root, pool_size=16, limiter=RateLimiter(rate=2, burst=10))
+    # a page load, each asset on a connection of its own
+    for _ in range(10):
+        reply = serve(server, FakeClient(b"GET /hello HTTP/1.1\r\n\r\n"), passes=2)
+        assert reply.startswith(b"HTTP/1.1 200 OK\r\n")
+    reply = serve(server, FakeClient(b"GET /hello HTTP/1.1\r\n\r\n"), passes=2)
+    assert reply.startswith(b"HTTP/1.1 429 Too Many Requests\r\n")
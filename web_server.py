@@ -0,0 +1,634 @@
+"""
+Small HTTP/1.1 server for the badge with persistent connections.
+
+The route and response API follows the subset of adafruit_httpserver the badge
+scripts use, so handlers work unchanged. Unlike adafruit_httpserver, which
+closes every connection after one response, connections are kept alive and
+served from a fixed pool of slots. Each slot owns its socket and one receive
+buffer that is allocated once and reused for every request on it.
+
+poll() never blocks. Every call does a bounded amount of work, one recv or one
+send of at most chunk_size bytes per step, handing out steps to the
+connections in turn until budget_us microseconds have passed. Requests are
+parsed as their bytes arrive and response bodies are sent a chunk at a time
+across as many poll() calls as they need. Responses that do not know their
+length up front, like page_templates.TemplateResponse, are sent with chunked
+transfer encoding.
+"""
+import errno
+import json
+import os
+from time import monotonic_ns
+
+from adafruit_ticks import ticks_ms, ticks_diff
+
+GET = "GET"
+POST = "POST"
+PUT = "PUT"
+DELETE = "DELETE"
+
+
+class Status:
+    """
+    HTTP status code and reason phrase.
+    """
+
+    def __init__(self, code, text):
+        self.code = code
+        self.text = text
+
+    def __repr__(self):
+        return f"<Status {self.code} {self.text}>"
+
+
+OK_200 = Status(200, "OK")
+BAD_REQUEST_400 = Status(400, "Bad Request")
+FORBIDDEN_403 = Status(403, "Forbidden")
+NOT_FOUND_404 = Status(404, "Not Found")
+METHOD_NOT_ALLOWED_405 = Status(405, "Method Not Allowed")
+PAYLOAD_TOO_LARGE_413 = Status(413, "Payload Too Large")
+TOO_MANY_REQUESTS_429 = Status(429, "Too Many Requests")
+INTERNAL_SERVER_ERROR_500 = Status(500, "Internal Server Error")
+SERVICE_UNAVAILABLE_503 = Status(503, "Service Unavailable")
+
+# sent straight to clients turned away before they get a connection slot
+_BUSY_RESPONSE = b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 2\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+MIME_TYPES = {
+    "html": "text/html",
+    "css": "text/css",
+    "js": "application/javascript",
+    "json": "application/json",
+    "txt": "text/plain",
+    "png": "image/png",
+    "bmp": "image/bmp",
+    "ico": "image/x-icon",
+}
+
+
+class Request:
+    """
+    A parsed request. query_params values are left url encoded, the same as
+    adafruit_httpserver.
+    """
+
+    def __init__(self, method, path, query_params, http_version, headers, body, client_address):
+        self.method = method
+        self.path = path
+        self.query_params = query_params
+        self.http_version = http_version
+        self.headers = headers
+        self.body = body
+        self.client_address = client_address
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get("connection", "").lower()
+        if self.http_version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+
+def _parse_query(query):
+    params = {}
+    if not query:
+        return params
+    for pair in query.split("&"):
+        if not pair:
+            continue
+        key, _, value = pair.partition("=")
+        params[key] = value.replace("+", " ")
+    return params
+
+
+def _safe_path(path):
+    """
+    Whether path stays below the static files root, it must not step up with
+    a .. segment or use backslashes as separators.
+    """
+    return "\\" not in path and ".." not in path.split("/")
+
+
+class Response:
+    """
+    A response with a str or bytes body. Subclasses that can not tell their
+    length up front return None from body_length and fill the body in with
+    read_chunk() instead of read_body().
+    """
+
+    def __init__(self, request, body="", status=OK_200, headers=None, content_type="text/plain"):
+        self.request = request
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+        self.status = status
+        self.headers = headers if headers is not None else {}
+        self.content_type = content_type
+
+    @property
+    def body_length(self):
+        return len(self.body)
+
+    def read_body(self, offset, buffer):
+        """
+        Return the next part of the body, starting at offset and at most
+        len(buffer) bytes long. buffer may be used to hold it.
+        """
+        return memoryview(self.body)[offset:offset + len(buffer)]
+
+    def read_chunk(self, buffer):
+        """
+        Copy the next part of a body of unknown length into buffer and return
+        how many bytes were copied, 0 at the end.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def header_bytes(self, keep_alive, keep_alive_header):
+        lines = [f"HTTP/1.1 {self.status.code} {self.status.text}\r\n",
+                 f"Content-Type: {self.content_type}\r\n"]
+        if self.body_length is not None:
+            lines.append(f"Content-Length: {self.body_length}\r\n")
+        elif keep_alive:
+            lines.append("Transfer-Encoding: chunked\r\n")
+        # without either the body simply ends when the connection closes
+        for name, value in self.headers.items():
+            lines.append(f"{name}: {value}\r\n")
+        if keep_alive:
+            lines.append("Connection: keep-alive\r\n")
+            lines.append(keep_alive_header)
+        else:
+            lines.append("Connection: close\r\n")
+        lines.append("\r\n")
+        return "".join(lines).encode("utf-8")
+
+
+class JSONResponse(Response):
+    """
+    A response with data serialised as JSON.
+    """
+
+    def __init__(self, request, data, status=OK_200, headers=None):
+        super().__init__(request, json.dumps(data), status=status, headers=headers,
+                         content_type="application/json")
+
+
+class FileResponse(Response):
+    """
+    A response with the contents of a file under root_path. The file is read
+    a chunk at a time while it is sent, never as a whole.
+    """
+
+    def __init__(self, request, filename, root_path="", status=OK_200, headers=None, content_type=None):
+        if content_type is None:
+            content_type = MIME_TYPES.get(filename.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+        super().__init__(request, b"", status=status, headers=headers, content_type=content_type)
+        path = root_path + filename
+        self._length = os.stat(path)[6]
+        self._file = open(path, "rb")
+
+    @property
+    def body_length(self):
+        return self._length
+
+    def read_body(self, offset, buffer):
+        count = self._file.readinto(buffer)
+        return memoryview(buffer)[:count]
+
+    def close(self):
+        self._file.close()
+
+
+# chunked transfer encoding framing, a 4 digit hex size line in front of every
+# chunk and a line break after it
+_CHUNK_PREFIX = 6
+_CHUNK_OVERHEAD = _CHUNK_PREFIX + 2
+_LAST_CHUNK = b"0\r\n\r\n"
+_HEX_DIGITS = b"0123456789abcdef"
+
+# connection slot states
+_FREE = 0
+_READING = 1
+_SENDING = 2
+
+
+class _Connection:
+    """
+    One slot of the connection pool.
+    """
+
+    def __init__(self, buffer_size, chunk_size):
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.send_buffer = bytearray(chunk_size + _CHUNK_OVERHEAD)
+        self.send_view = memoryview(self.send_buffer)
+        # room for the chunk size line in front of the body
+        self.body_buffer = self.send_view[_CHUNK_PREFIX:_CHUNK_PREFIX + chunk_size]
+        self.socket = None
+        self.client_address = None
+        self.state = _FREE
+        self.filled = 0
+        self.header_end = 0
+        self.crlf_matched = 0
+        self.requests = 0
+        self.last_active = 0
+        self.response = None
+        self.out = None
+        self.sent = 0
+        self.body_sent = 0
+        self.chunked = False
+        self.close_after_send = False
+
+    def open(self, sock, client_address, now):
+        self.socket = sock
+        self.client_address = client_address
+        self.requests = 0
+        self.last_active = now
+        self.reset()
+
+    def reset(self):
+        """
+        Get ready for the next request on the same socket.
+        """
+        self.state = _READING
+        self.filled = 0
+        self.header_end = 0
+        self.crlf_matched = 0
+        self.end_response()
+        self.close_after_send = False
+
+    def end_response(self):
+        if self.response is not None:
+            self.response.close()
+        self.response = None
+        self.out = None
+        self.sent = 0
+        self.body_sent = 0
+
+    def frame_chunk(self, count):
+        """
+        Wrap the count bytes in body_buffer in chunk framing.
+        """
+        buffer = self.send_buffer
+        for i in range(4):
+            buffer[3 - i] = _HEX_DIGITS[(count >> (4 * i)) & 0xF]
+        buffer[4] = 13
+        buffer[5] = 10
+        buffer[_CHUNK_PREFIX + count] = 13
+        buffer[_CHUNK_PREFIX + count + 1] = 10
+        return self.send_view[:count + _CHUNK_OVERHEAD]
+
+    def close(self):
+        self.end_response()
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+        self.socket = None
+        self.state = _FREE
+
+    def scan_header_end(self, start):
+        # look for the blank line after the headers without copying the buffer
+        buffer = self.buffer
+        matched = self.crlf_matched
+        for i in range(start, self.filled):
+            byte = buffer[i]
+            if byte == (13 if matched % 2 == 0 else 10):
+                matched += 1
+                if matched == 4:
+                    self.header_end = i + 1
+                    self.crlf_matched = 0
+                    return True
+            else:
+                matched = 1 if byte == 13 else 0
+        self.crlf_matched = matched
+        return False
+
+
+class Server:
+    """
+    HTTP server with a pool of pool_size persistent connections. Connections
+    that send or take nothing for idle_timeout seconds are closed, whether
+    between requests, part way through one or with a response unsent, and
+    every connection is closed after max_requests requests. budget_us bounds
+    the time one poll() spends on the network, chunk_size the bytes moved per
+    step.
+
+    The pool is also the cap on clients served at once. When every slot is
+    busy, the longest idle connection between requests is closed to make
+    room, and if none is idle the new connection gets a 503 and is closed
+    straight away. With a rate_limit.RateLimiter as limiter, every request
+    costs its client a token, and clients out of tokens get a 429. Opening a
+    connection costs nothing, the pool already caps those.
+    """
+
+    def __init__(self, pool, root_path="/static", debug=False, pool_size=4, buffer_size=1024,
+                 idle_timeout=5, max_requests=20, budget_us=3000, chunk_size=512, limiter=None):
+        self.pool = pool
+        self.limiter = limiter
+        self.turned_away = 0
+        self.root_path = root_path
+        self.debug = debug
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.budget_us = budget_us
+        self.chunk_size = chunk_size
+        self._routes = {}
+        self._socket = None
+        self._connections = [_Connection(buffer_size, chunk_size) for _ in range(pool_size)]
+        self._next = 0
+        self._keep_alive_header = f"Keep-Alive: timeout={idle_timeout}, max={max_requests}\r\n"
+
+    def route(self, path, methods=GET):
+        """
+        Decorator registering a handler for path and one or more methods.
+        """
+        if isinstance(methods, str):
+            methods = (methods,)
+
+        def register(handler):
+            self._routes[path] = (methods, handler)
+            return handler
+
+        return register
+
+    def start(self, host="0.0.0.0", port=5000):
+        self._socket = self.pool.socket(self.pool.AF_INET, self.pool.SOCK_STREAM)
+        try:
+            self._socket.setsockopt(self.pool.SOL_SOCKET, self.pool.SO_REUSEADDR, 1)
+        except (AttributeError, OSError):
+            pass
+        self._socket.bind((host, port))
+        self._socket.listen(len(self._connections))
+        self._socket.setblocking(False)
+        if self.debug:
+            print(f"Started web server on {host}:{port}")
+
+    def stop(self):
+        for connection in self._connections:
+            connection.close()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    @property
+    def open_connections(self):
+        return sum(1 for connection in self._connections if connection.state != _FREE)
+
+    def poll(self):
+        """
+        Accept new connections and make progress on open ones for at most
+        budget_us microseconds. Call this every loop iteration. Returns True
+        when there is still work waiting for the next call.
+        """
+        if self._socket is None:
+            # not started, or stopped while the network is down
+            return False
+        deadline = monotonic_ns() + self.budget_us * 1000
+        now = ticks_ms()
+        self._close_idle(now)
+        connections = self._connections
+        count = len(connections)
+        self._accept(now)
+        while True:
+            # one step per connection per pass, starting where the last poll
+            # stopped so a busy client can not starve the others
+            progress = False
+            for _ in range(count):
+                connection = connections[self._next]
+                self._next = (self._next + 1) % count
+                if connection.state == _READING:
+                    progress = self._read(connection, now) or progress
+                elif connection.state == _SENDING:
+                    progress = self._send(connection, now) or progress
+                if monotonic_ns() >= deadline:
+                    return True
+            if not progress:
+                return False
+
+    def _close_idle(self, now):
+        # a client that stops half way through its request, or stops reading
+        # the response, would otherwise hold its slot for good
+        for connection in self._connections:
+            if connection.state != _FREE and ticks_diff(now, connection.last_active) > self.idle_timeout * 1000:
+                if self.debug:
+                    print(f"Closing idle connection from {connection.client_address}")
+                connection.close()
+
+    def _free_slot(self):
+        idle = None
+        for connection in self._connections:
+            if connection.state == _FREE:
+                return connection
+            if connection.state == _READING and connection.filled == 0 and \
+                    (idle is None or ticks_diff(connection.last_active, idle.last_active) < 0):
+                idle = connection
+        return idle
+
+    def _accept(self, now):
+        try:
+            sock, client_address = self._socket.accept()
+        except OSError as error:
+            if error.errno in (errno.EAGAIN, errno.ETIMEDOUT):
+                return False
+            raise
+        connection = self._free_slot()
+        if connection is None:
+            self._turn_away(sock, _BUSY_RESPONSE)
+            return True
+        if connection.state != _FREE:
+            # make room by dropping the longest idle keep-alive connection
+            connection.close()
+        sock.setblocking(False)
+        connection.open(sock, client_address, now)
+        return True
+
+    def _turn_away(self, sock, response):
+        # the response is tiny, if the socket can not take it at once the
+        # client just sees the connection close
+        self.turned_away += 1
+        try:
+            sock.setblocking(False)
+            sock.send(response)
+        except OSError:
+            pass
+        sock.close()
+
+    def _read(self, connection, now):
+        """
+        Receive at most chunk_size bytes, and handle the request once it is
+        complete. Returns True if anything was received.
+        """
+        if connection.filled == len(connection.buffer):
+            self._respond(connection, Response(None, "Request too large", status=PAYLOAD_TOO_LARGE_413),
+                          keep_alive=False)
+            return True
+        end = min(connection.filled + self.chunk_size, len(connection.buffer))
+        try:
+            received = connection.socket.recv_into(connection.view[connection.filled:end])
+        except OSError as error:
+            if error.errno == errno.EAGAIN:
+                return False
+            connection.close()
+            return False
+        if received == 0:
+            # closed by the client
+            connection.close()
+            return False
+        scan_from = connection.filled
+        connection.filled += received
+        connection.last_active = now
+        if connection.header_end == 0 and not connection.scan_header_end(scan_from):
+            return True
+        try:
+            request = self._parse(connection)
+        except ValueError as error:
+            # malformed request line or headers, only this client is dropped
+            if self.debug:
+                print(f"Bad request from {connection.client_address}: {error}")
+            self._respond(connection, Response(None, "Bad Request", status=BAD_REQUEST_400), keep_alive=False)
+            return True
+        if request is None:
+            return True
+        connection.requests += 1
+        if self.limiter is not None and not self.limiter.allow(request.client_address[0], now):
+            self.turned_away += 1
+            response = Response(request, "Too Many Requests", status=TOO_MANY_REQUESTS_429,
+                                headers={"Retry-After": self.limiter.retry_after(request.client_address[0])})
+            # closing frees the slot for someone else
+            self._respond(connection, response, keep_alive=False)
+            return True
+        keep_alive = request.keep_alive and connection.requests < self.max_requests
+        self._respond(connection, self._handle(request), keep_alive)
+        return True
+
+    def _parse(self, connection):
+        """
+        Parse the request once the headers and body are complete, returns None
+        while more of the body is still to come. Raises ValueError, or its
+        UnicodeError, when the request is malformed.
+        """
+        header_text = str(connection.view[:connection.header_end], "utf-8")
+        lines = header_text.split("\r\n")
+        request_line = lines[0].split(" ")
+        if len(request_line) != 3:
+            raise ValueError("bad request line")
+        method, target, http_version = request_line
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body_length = int(headers.get("content-length", 0))
+        if body_length < 0:
+            raise ValueError("negative content-length")
+        if connection.header_end + body_length > len(connection.buffer):
+            connection.filled = len(connection.buffer)
+            return None
+        if connection.filled < connection.header_end + body_length:
+            return None
+        body = bytes(connection.view[connection.header_end:connection.header_end + body_length])
+
+        path, _, query = target.partition("?")
+        return Request(method, path, _parse_query(query), http_version, headers, body,
+                       connection.client_address)
+
+    def _handle(self, request):
+        if self.debug:
+            print(f"{request.client_address} -- \"{request.method} {request.path}\"")
+        route = self._routes.get(request.path)
+        if route is None:
+            if request.method == GET and self.root_path is not None:
+                if not _safe_path(request.path):
+                    return Response(request, "Forbidden", status=FORBIDDEN_403)
+                filename = "/index.html" if request.path == "/" else request.path
+                try:
+                    return FileResponse(request, filename, root_path=self.root_path)
+                except OSError:
+                    pass
+            return Response(request, "Not Found", status=NOT_FOUND_404)
+        methods, handler = route
+        if request.method not in methods:
+            return Response(request, "Method Not Allowed", status=METHOD_NOT_ALLOWED_405)
+        try:
+            response = handler(request)
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"Error handling {request.path}: {error}")
+            return Response(request, "Internal Server Error", status=INTERNAL_SERVER_ERROR_500)
+        return response
+
+    def _respond(self, connection, response, keep_alive):
+        connection.response = response
+        connection.out = memoryview(response.header_bytes(keep_alive, self._keep_alive_header))
+        connection.sent = 0
+        connection.body_sent = 0
+        # bodies of unknown length are chunked on kept alive connections, and
+        # end with the connection otherwise
+        connection.chunked = response.body_length is None and keep_alive
+        connection.close_after_send = not keep_alive
+        connection.state = _SENDING
+
+    def _send(self, connection, now):
+        """
+        Send at most chunk_size bytes of the response, the headers first and
+        then the body. Returns True if anything was sent.
+        """
+        if connection.sent == len(connection.out) and not self._next_out(connection):
+            self._finish(connection, now)
+            return True
+        end = min(connection.sent + self.chunk_size, len(connection.out))
+        try:
+            sent = connection.socket.send(connection.out[connection.sent:end])
+        except OSError as error:
+            if error.errno == errno.EAGAIN:
+                return False
+            connection.close()
+            return False
+        connection.sent += sent
+        connection.last_active = now
+        return sent > 0
+
+    def _next_out(self, connection):
+        """
+        Load the next part of the body to send, returns False once it was
+        all sent.
+        """
+        response = connection.response
+        if response.body_length is not None:
+            if connection.body_sent >= response.body_length:
+                return False
+            out = response.read_body(connection.body_sent, connection.body_buffer)
+            if len(out) == 0:
+                # the body ended early, the client can not trust this connection
+                connection.close_after_send = True
+                return False
+        else:
+            if connection.body_sent < 0:
+                return False
+            count = response.read_chunk(connection.body_buffer)
+            if connection.chunked:
+                if count == 0:
+                    out = _LAST_CHUNK
+                else:
+                    out = connection.frame_chunk(count)
+            elif count == 0:
+                return False
+            else:
+                out = connection.body_buffer[:count]
+        # -1 marks the last chunk as sent
+        connection.body_sent = -1 if out is _LAST_CHUNK else connection.body_sent + len(out)
+        connection.out = out
+        connection.sent = 0
+        return True
+
+    def _finish(self, connection, now):
+        connection.last_active = now
+        if connection.close_after_send:
+            connection.close()
+            return
+        # anything already received after this request is dropped, clients
+        # wait for the response before sending the next request
+        connection.reset()